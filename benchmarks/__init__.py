@@ -0,0 +1,5 @@
+"""Benchmarks of the parsing, searching, evaluation and rendering paths
+
+Run with ``python -m benchmarks``; see ``python -m benchmarks --help`` for
+the available options.
+"""
@@ -0,0 +1,79 @@
+import fnmatch
+import gc
+import json
+import sys
+import timeit
+import tracemalloc
+import click
+from benchmarks.cases import all_cases
+
+sizes = {'small': 1, 'medium': 10, 'large': 100}
+
+
+def measure(fn, repeat):
+    """Return best time over the repeats and peak memory of a further call"""
+    gc.collect()
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+@click.command()
+@click.option('--size', type=click.Choice(sorted(sizes)), default='small',
+              help="Scale of the generated inputs")
+@click.option('--repeat', '-r', type=int, default=3,
+              help="Number of timed repeats of each case")
+@click.option('--filter', '-k', 'patterns', multiple=True,
+              help="Only run cases matching the glob pattern")
+@click.option('--save', type=click.File('w'),
+              help="Save results as a baseline")
+@click.option('--compare', type=click.File('r'),
+              help="Compare results against a saved baseline")
+@click.option('--tolerance', type=float, default=0.1,
+              help="Relative throughput loss reported as a regression")
+def main(size, repeat, patterns, save, compare, tolerance):
+    """Run benchmarks, reporting throughput and peak traced memory"""
+    baseline = {}
+    if compare:
+        baseline = json.load(compare)
+        if baseline.get('size', size) != size:
+            click.echo("Baseline was recorded with size {}".format(
+                baseline['size']), err=True)
+        baseline = baseline.get('results', {})
+
+    results = {}
+    regressions = []
+    for name, unit, setup in all_cases():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        fn, count = setup(sizes[size])
+        best, peak = measure(fn, repeat)
+        rate = count/best
+        results[name] = {'unit': unit, 'count': count, 'seconds': best,
+                         'rate': rate, 'peak_bytes': peak}
+        line = "{:<28} {:>12.1f} {}/s {:>10.1f} KiB".format(
+            name, rate, unit, peak/1024.)
+        if name in baseline:
+            ratio = rate/baseline[name]['rate']
+            line += " {:>7.2f}x".format(ratio)
+            if ratio < 1 - tolerance:
+                line += " REGRESSION"
+                regressions.append(name)
+        click.echo(line)
+
+    if save:
+        json.dump({'size': size, 'python': sys.version.split()[0],
+                   'results': results}, save, indent=2, sort_keys=True)
+    if regressions:
+        click.echo("Regressions in {}".format(', '.join(regressions)),
+                   err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
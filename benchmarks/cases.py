@@ -0,0 +1,250 @@
+"""Benchmark cases
+
+Each case is a function taking a size scale and returning the function to
+time together with the number of units it processes per call.
+"""
+import copy
+import os
+import shutil
+import tempfile
+from io import StringIO
+import six
+import sci_parameter_utils.fragment as frag
+import sci_parameter_utils.general as gen
+from sci_parameter_utils.engine import TemplateEngine
+from sci_parameter_utils.index import ParameterIndex
+from sci_parameter_utils.parsers import PRMParser
+from benchmarks import generators
+try:
+    import typing  # noqa: F401
+    from typing import Any, Callable, List, Tuple  # noqa: F401
+except:
+    pass
+
+_cases = []  # type: List[Tuple[str, str, Callable[[int], Tuple[Callable[[], Any], int]]]] # noqa
+
+
+def case(name, unit):
+    # type: (str, str) -> Callable
+    """Register a benchmark case measured in the given unit"""
+    def internal_dec(fn):
+        _cases.append((name, unit, fn))
+        return fn
+    return internal_dec
+
+
+def all_cases():
+    # type: () -> List[Tuple[str, str, Callable[[int], Tuple[Callable[[], Any], int]]]] # noqa
+    return list(_cases)
+
+
+def _parse_case(scale, **kwargs):
+    parser = PRMParser
+    text = six.text_type(generators.prm_text(10000*scale, **kwargs))
+    nlines = text.count('\n')
+
+    def run():
+        for _ in parser.lines(StringIO(text)):
+            pass
+    return run, nlines
+
+
+@case('parse', 'lines')
+def parse(scale):
+    return _parse_case(scale)
+
+
+@case('parse_nested', 'lines')
+def parse_nested(scale):
+    return _parse_case(scale, depth=6, per_section=4)
+
+
+@case('parse_continued', 'lines')
+def parse_continued(scale):
+    return _parse_case(scale, continuation=0.5, comments=0.5)
+
+
+@case('typeset', 'lines')
+def typeset(scale):
+    parser = PRMParser
+    text = six.text_type(
+        generators.prm_text(10000*scale, continuation=0.1, comments=0.2))
+    lines = list(parser.lines(StringIO(text)))
+
+    def run():
+        for l in lines:
+            parser.typeset_line(l)
+    return run, len(lines)
+
+
+@case('search', 'lines')
+def search(scale):
+    parser = PRMParser
+    nkeys = 10000*scale
+    text = six.text_type(generators.prm_text(nkeys))
+    keys = generators.prm_keys(nkeys)
+    sdefs = dict(('s{}'.format(i), {'type': 'loc', 'key': k})
+                 for i, k in enumerate(keys[::nkeys//50]))
+    selems = frag.elems_from_dict(sdefs, frag.SearchElem)
+
+    def run():
+        gen.do_search(selems, StringIO(text), parser)
+    return run, text.count('\n')
+
+
+@case('search_many', 'files')
+def search_many(scale):
+    parser = PRMParser
+    texts = [six.text_type(generators.prm_text(500, seed=i))
+             for i in range(200*scale)]
+    keys = generators.prm_keys(500)
+    sdefs = dict(('s{}'.format(i), {'type': 'loc', 'key': k})
+                 for i, k in enumerate(keys[::100]))
+    plan = gen.SearchPlan(frag.elems_from_dict(sdefs, frag.SearchElem))
+
+    def run():
+        for text in texts:
+            gen.do_search(plan, StringIO(text), parser)
+    return run, len(texts)
+
+
+@case('index_query', 'queries')
+def index_query(scale):
+    nfiles = 500*scale
+    keys = generators.prm_keys(200)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pi = ParameterIndex(':memory:')
+        for i in range(nfiles):
+            fn = os.path.join(tmpdir, 'run{}.prm'.format(i))
+            with open(fn, 'w') as f:
+                f.write(generators.prm_text(200, seed=i))
+            pi.update(fn, PRMParser)
+    finally:
+        shutil.rmtree(tmpdir)
+    filters = [(keys[3], '>', '0.5'), (keys[7], '<', '0.5')]
+    nqueries = 100
+
+    def run():
+        for _ in range(nqueries):
+            pi.query(filters, [keys[11]])
+    return run, nqueries
+
+
+@case('search_patterns', 'lines')
+def search_patterns(scale):
+    parser = PRMParser
+    nkeys = 10000*scale
+    text = six.text_type(generators.prm_text(nkeys))
+    keys = generators.prm_keys(nkeys)
+    # Each pattern matches the key in every section
+    sdefs = dict(('s{}'.format(i),
+                  {'type': 'glob', 'key': '*:' + k.rsplit(':', 1)[-1]})
+                 for i, k in enumerate(keys[::nkeys//50]))
+    plan = gen.SearchPlan(frag.elems_from_dict(sdefs, frag.SearchElem))
+
+    def run():
+        gen.do_search(plan, StringIO(text), parser, findall=False)
+    return run, text.count('\n')
+
+
+def _template_case(scale, nslots=50, fixed=200):
+    parser = PRMParser
+    slots = ['s{}'.format(i) for i in range(nslots)]
+    text = six.text_type(generators.template_text(slots, fixed))
+    values = dict((n, u'{}'.format(i)) for i, n in enumerate(slots))
+    values['fname'] = u'out.prm'
+    return parser, text, values
+
+
+@case('template', 'files')
+def template(scale):
+    parser, text, values = _template_case(scale)
+    nfiles = 20*scale
+
+    def run():
+        tfile = StringIO(text)
+        for _ in range(nfiles):
+            gen.do_template(tfile, StringIO(), parser, values)
+    return run, nfiles
+
+
+@case('template_compiled', 'files')
+def template_compiled(scale):
+    parser, text, values = _template_case(scale)
+    ctemplate = gen.CompiledTemplate(StringIO(text), parser)
+    nfiles = 1000*scale
+
+    def run():
+        for _ in range(nfiles):
+            ctemplate.write(StringIO(), values)
+    return run, nfiles
+
+
+@case('engine_render_many', 'files')
+def engine_render_many(scale):
+    defs = generators.element_defs(5, 20)
+    engine = TemplateEngine(
+        defs, generators.template_text(sorted(defs), 200), 'prm',
+        compiled=True)
+    rows = generators.input_rows(defs, 50*scale)
+
+    def run():
+        for _ in engine.render_many(rows):
+            pass
+    return run, len(rows)
+
+
+def _compute_case(scale, **kwargs):
+    defs = generators.element_defs(5, 20)
+    eset = frag.TemplateElemSet(
+        frag.elems_from_dict(copy.deepcopy(defs), frag.TemplateElem),
+        **kwargs)
+    rows = []
+    for r in generators.input_rows(defs, 50*scale):
+        rows.append(dict((k, eset.validate(k, r[k])) for k in r))
+
+    def run():
+        for r in rows:
+            eset.compute_strings(dict(r))
+    return run, len(rows)
+
+
+@case('compute_strings', 'rows')
+def compute_strings(scale):
+    return _compute_case(scale)
+
+
+@case('compute_strings_compiled', 'rows')
+def compute_strings_compiled(scale):
+    return _compute_case(scale, compiled=True)
+
+
+@case('compute_strings_batch', 'rows')
+def compute_strings_batch(scale):
+    defs = generators.element_defs(5, 20)
+    eset = frag.TemplateElemSet(
+        frag.elems_from_dict(copy.deepcopy(defs), frag.TemplateElem),
+        compiled=True)
+    rows = generators.input_rows(defs, 1000*scale)
+    columns = dict((k, eset.validate_batch(k, [r[k] for r in rows]))
+                   for k in rows[0])
+
+    def run():
+        eset.compute_strings_batch(columns)
+    return run, len(rows)
+
+
+@case('dependency_order', 'elements')
+def dependency_order(scale):
+    n = 10000*scale
+    defs = {'x0': {'type': 'float'}}
+    for i in range(1, n):
+        deps = ['x{}'.format(i//2), 'x{}'.format(i - 1)]
+        defs['x{}'.format(i)] = {
+            'type': 'fmt', 'expr': '_'.join('{' + d + '}' for d in deps)}
+    elems = frag.elems_from_dict(defs, frag.TemplateElem)
+
+    def run():
+        frag.TemplateElemSet(elems)
+    return run, n
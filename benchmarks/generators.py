@@ -0,0 +1,128 @@
+"""Generators of synthetic inputs for the benchmarks
+
+All generators are deterministic for a given seed.
+"""
+import random
+try:
+    import typing  # noqa: F401
+    from typing import Any, List  # noqa: F401
+except:
+    pass
+
+
+def prm_text(nkeys, depth=2, per_section=20, continuation=0.0,
+             comments=0.0, seed=0):
+    # type: (int, int, int, float, float, int) -> str
+    """Text of a deal.II parameter file
+
+    Args:
+        nkeys (int): Number of set commands
+        depth (int): Nesting depth of the subsections containing the keys
+        per_section (int): Number of keys in each innermost subsection
+        continuation (float): Fraction of values continued over two lines
+        comments (float): Fraction of keys followed by a comment line and
+            having a same line comment
+
+    Returns:
+        str: Parameter file text
+    """
+    rng = random.Random(seed)
+    out = []  # type: List[str]
+    k = 0
+    section = 0
+    while k < nkeys:
+        for d in range(depth):
+            out.append('{}subsection Section {}-{}\n'.format(
+                '  '*d, section, d))
+        ind = '  '*depth
+        for _ in range(min(per_section, nkeys - k)):
+            if rng.random() < comments:
+                out.append('{}# Documentation for key {}\n'.format(ind, k))
+                comment = '  # default: 0'
+            else:
+                comment = ''
+            if rng.random() < continuation:
+                out.append('{}set Key {} = {}, {}, \\\n{}  {}, {}{}\n'.format(
+                    ind, k, k, k + 1, ind, k + 2, k + 3, comment))
+            else:
+                out.append('{}set Key {} = {}{}\n'.format(
+                    ind, k, rng.random(), comment))
+            k += 1
+        for d in reversed(range(depth)):
+            out.append('{}end\n'.format('  '*d))
+        section += 1
+    return ''.join(out)
+
+
+def prm_keys(nkeys, depth=2, per_section=20):
+    # type: (int, int, int) -> List[str]
+    """Full keys of the set commands of :func:`prm_text`"""
+    keys = []
+    for k in range(nkeys):
+        section = k // per_section
+        keys.append(':'.join(
+            ['Section {}-{}'.format(section, d) for d in range(depth)] +
+            ['Key {}'.format(k)]))
+    return keys
+
+
+def element_defs(ninputs, nexprs, terms=3, seed=0):
+    # type: (int, int, int, int) -> Dict[str, Dict[str, Any]]
+    """Definitions of a set of template elements
+
+    Args:
+        ninputs (int): Number of float inputs
+        nexprs (int): Number of expressions, each depending on previously
+            defined inputs or expressions
+        terms (int): Number of terms in each expression
+
+    Returns:
+        dict: Element definitions including a ``fmt`` and a ``fname``
+        element, in the form read from a definitions file
+    """
+    rng = random.Random(seed)
+    defs = {}  # type: Dict[str, Dict[str, Any]]
+    names = []  # type: List[str]
+    for i in range(ninputs):
+        n = 'x{}'.format(i)
+        defs[n] = {'type': 'float', 'fmt': '{:.6g}'}
+        names.append(n)
+    for i in range(nexprs):
+        n = 'e{}'.format(i)
+        expr = []  # type: List[str]
+        for t in range(terms):
+            if t:
+                expr.append(rng.choice(['+', '-', '*']))
+            expr.append('{}*{}'.format(rng.randint(1, 9), rng.choice(names)))
+        defs[n] = {'type': 'expr', 'expr': ' '.join(expr), 'fmt': '{:.6g}'}
+        names.append(n)
+    defs['label'] = {'type': 'fmt',
+                     'expr': '_'.join('{' + n + '}' for n in names[:3])}
+    defs['fname'] = {'type': 'fname',
+                     'expr': 'run_{' + names[0] + '}.prm'}
+    return defs
+
+
+def input_rows(defs, nrows, seed=0):
+    # type: (Dict[str, Dict[str, Any]], int, int) -> List[Dict[str, str]]
+    """Rows of string input values for the inputs of the definitions"""
+    rng = random.Random(seed)
+    inputs = sorted(k for k in defs
+                    if defs[k]['type'] in ('int', 'float', 'str'))
+    rows = []
+    for _ in range(nrows):
+        rows.append(dict((k, repr(rng.uniform(0.5, 2.0))) for k in inputs))
+    return rows
+
+
+def template_text(slots, fixed=0):
+    # type: (List[str], int) -> str
+    """Text of a parameter file template substituting the given elements,
+    with a number of additional fixed keys"""
+    out = ['# FN: {{{fname}}}\n', 'subsection Run\n']
+    for n in slots:
+        out.append('  set {} = {{{{{{{}}}}}}}\n'.format(n, n))
+    for k in range(fixed):
+        out.append('  set Fixed {} = {}\n'.format(k, k))
+    out.append('end\n')
+    return ''.join(out)
@@ -20,6 +20,9 @@ setup(
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
     install_requires=dependencies,
+    extras_require={
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'sci_parameter_utils = sci_parameter_utils.cli:cli_main'
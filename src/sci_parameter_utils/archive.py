@@ -0,0 +1,131 @@
+import fnmatch
+import io
+import tarfile
+import time
+import zipfile
+import six
+try:
+    import typing  # noqa: F401
+    from typing import Any, Iterator, Set  # noqa: F401
+except:
+    pass
+
+# Size of the write buffer of archive files
+_BUFFER_SIZE = 2**20
+
+_tar_modes = [
+    ('.tar', 'w'),
+    ('.tar.gz', 'w:gz'),
+    ('.tgz', 'w:gz'),
+    ('.tar.bz2', 'w:bz2'),
+    ('.tar.xz', 'w:xz'),
+]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def is_archive(path):
+    # type: (str) -> bool
+    """Whether the path has the extension of a supported archive format"""
+    return (path.endswith('.zip') or
+            any(path.endswith(e) for e, _ in _tar_modes))
+
+
+class ArchiveWriter:
+    """Writer adding text files to a single tar or zip archive
+
+    The format is chosen by the extension of the path, one of ``.zip``,
+    ``.tar``, ``.tar.gz``, ``.tgz``, ``.tar.bz2`` or ``.tar.xz``.
+    """
+
+    def __init__(self, path):
+        # type: (str) -> None
+        self.path = path
+        self.names = set()  # type: Set[str]
+        if path.endswith('.zip'):
+            self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+            self._tar = None
+            self._fobj = None
+            return
+        for extn, mode in _tar_modes:
+            if path.endswith(extn):
+                break
+        else:
+            raise ArchiveError(
+                "Unknown archive format for {}".format(path))
+        self._zip = None
+        self._fobj = io.open(path, 'wb', buffering=_BUFFER_SIZE)
+        try:
+            self._tar = tarfile.open(path, mode, fileobj=self._fobj)
+        except Exception:
+            self._fobj.close()
+            raise
+
+    def add(self, name, text):
+        # type: (str, str) -> None
+        """Add a file with the given name and text"""
+        name = name.lstrip('/')
+        if name in self.names:
+            raise ArchiveError(
+                "File {} already written to archive".format(name))
+        self.names.add(name)
+        data = six.text_type(text).encode('utf-8')
+        if self._zip is not None:
+            self._zip.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        # type: () -> None
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            try:
+                self._tar.close()
+            finally:
+                self._fobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+
+def read_members(path, pattern='*'):
+    # type: (str, str) -> Iterator[io.StringIO]
+    """Iterate over the files in a tar or zip archive in archive order
+
+    Each file with name matching the glob pattern is returned as a text
+    stream whose name is the archive path and member name separated by a
+    colon.
+    """
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path, 'r') as zf:
+            for info in zf.infolist():
+                if (info.filename.endswith('/') or
+                        not fnmatch.fnmatch(info.filename, pattern)):
+                    continue
+                yield _member(path, info.filename, zf.read(info))
+    else:
+        with tarfile.open(path, 'r') as tf:
+            for info in tf:
+                if (not info.isfile() or
+                        not fnmatch.fnmatch(info.name, pattern)):
+                    continue
+                yield _member(path, info.name,
+                              tf.extractfile(info).read())
+
+
+def _member(path, name, data):
+    # type: (str, str, bytes) -> io.StringIO
+    f = io.StringIO(data.decode('utf-8'))
+    f.name = '{}:{}'.format(path, name)
+    return f
@@ -0,0 +1,153 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+try:
+    import typing  # noqa: F401
+    from typing import Any, Iterable, List, Tuple, Type  # noqa: F401
+    from sci_parameter_utils.parameter_file import PFileParser, PFileLine  # noqa: F401, E501
+except:
+    pass
+
+# Increment when the stored representation changes
+CACHE_VERSION = 2
+
+
+def flatten_lines(lines):
+    # type: (Iterable[PFileLine]) -> Dict[str, str]
+    """Map from key to value of the key-value lines in the order the keys are
+    first found, later lines taking precedence"""
+    values = collections.OrderedDict()  # type: Dict[str, str]
+    for l in lines:
+        if l.ltype == "KeyValue":
+            values[l.value.key] = l.value.value
+    return values
+
+
+class ParseCache:
+    """On-disk cache of the flattened key-value maps of parameter files
+
+    Entries are keyed by the absolute path, size and modification time of
+    the file together with the parser used, and are stored as JSON, one file
+    per entry, so entries only ever hold data. When the total size of the
+    entries exceeds ``max_bytes`` the least recently used entries are
+    removed.
+    """
+
+    def __init__(self, cachedir, max_bytes=256*2**20):
+        # type: (str, int) -> None
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        self._size = sum(s for _, _, s in self._entries())
+
+    def _entries(self):
+        # type: () -> List[Tuple[float, str, int]]
+        entries = []
+        for fn in os.listdir(self.cachedir):
+            if not fn.endswith('.json'):
+                continue
+            path = os.path.join(self.cachedir, fn)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def _entry_path(self, path, parser):
+        # type: (str, Type[PFileParser]) -> str
+        st = os.stat(path)
+        mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+        key = u'\0'.join(str(k) for k in (
+            os.path.abspath(path), st.st_size, mtime,
+            parser.__module__, parser.__name__,
+            CACHE_VERSION))
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cachedir, digest + '.json')
+
+    def lookup(self, path, parser):
+        # type: (str, Type[PFileParser]) -> Dict[str, str]
+        """Return cached values for the file or None if not present"""
+        epath = self._entry_path(path, parser)
+        try:
+            with open(epath, 'rb') as f:
+                values = json.loads(f.read().decode('utf-8'),
+                                    object_pairs_hook=collections.OrderedDict)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(values, dict):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(epath, None)
+        except OSError:
+            pass
+        return values
+
+    def store(self, path, parser, values):
+        # type: (str, Type[PFileParser], Dict[str, str]) -> None
+        """Store values for the file, evicting old entries if needed"""
+        epath = self._entry_path(path, parser)
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(values).encode('utf-8'))
+            os.rename(tmp, epath)
+        except Exception:
+            os.remove(tmp)
+            raise
+        self._size += os.path.getsize(epath)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # type: () -> None
+        """Remove least recently used entries until below the size limit"""
+        entries = sorted(self._entries())
+        self._size = sum(s for _, _, s in entries)
+        target = self.max_bytes*0.9
+        for _, path, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def get_values(self, path, parser):
+        # type: (str, Type[PFileParser]) -> Dict[str, str]
+        """Return the key-value map of the file, parsing it only if not
+        already cached"""
+        values = self.lookup(path, parser)
+        if values is not None:
+            self.hits += 1
+            return values
+        self.misses += 1
+        with open(path, 'r') as f:
+            values = flatten_lines(parser.lines(f))
+        self.store(path, parser, values)
+        return values
+
+    def merge_stats(self, stats):
+        # type: (Dict[str, int]) -> None
+        """Add the hits, misses and evictions of other caches of the same
+        directory, such as those of worker processes, and update the size"""
+        self.hits += stats.get('hits', 0)
+        self.misses += stats.get('misses', 0)
+        self.evictions += stats.get('evictions', 0)
+        self._size = sum(s for _, _, s in self._entries())
+
+    def stats(self):
+        # type: () -> Dict[str, int]
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self._size}
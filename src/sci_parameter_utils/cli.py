@@ -1,12 +1,23 @@
 import click
+import copy
+import csv
+import io
+import itertools
 import json
 import sci_parameter_utils.fragment
 import sci_parameter_utils.parsers
 import sci_parameter_utils.general
-import yaml
+import sci_parameter_utils.sweep
+from sci_parameter_utils.engine import TemplateEngine, EngineError, RenderError
+from sci_parameter_utils.engine import get_extn
+from sci_parameter_utils.profiling import Profiler, NullProfiler
 try:
     import typing  # noqa: F401
-    from typing import Any, Callable, Iterable, Type  # noqa: F401
+    from typing import Any, Callable, Iterable, Set, Tuple, Type  # noqa: F401
+    if typing.TYPE_CHECKING:
+        from sci_parameter_utils.archive import ArchiveWriter  # noqa: F401
+        from sci_parameter_utils.manifest import Manifest  # noqa: F401
+        import sci_parameter_utils.tables  # noqa: F401
 except:
     pass
 
@@ -16,16 +27,57 @@ def get_dict_from_file(fobj):
     Get dictionary from a file by extn
     """
     if fobj.name.endswith('.yaml'):
+        import yaml
         return yaml.safe_load(fobj)
     return json.load(fobj)
 
 
-def get_extn_from_file(fobj):
+def _iter_csv_rows(fobj):
+    # type: (typing.TextIO) -> Iterable[Dict[str, str]]
+    """Rows of a CSV file with a header line, omitting empty and missing
+    fields"""
+    for i, r in enumerate(csv.DictReader(fobj), 1):
+        if None in r:
+            raise ValueError("Row {} has extra fields".format(i))
+        yield dict((k.strip(), v) for k, v in r.items()
+                   if v is not None and v != '')
+
+
+def iter_rows_from_file(fobj):
+    """
+    Iterate over rows of input values from a file by extn
+
+    JSON Lines and CSV files are read one row at a time, other files are
+    loaded as a list. A file with no rows yields a single empty row.
+    """
     fn = fobj.name
-    hInd = fn.rfind('.', -4)
-    if(hInd > 0):
-        return fn[hInd+1:]
-    return ""
+    if fn.endswith('.jsonl') or fn.endswith('.ndjson'):
+        rows = (json.loads(l) for l in fobj if l.strip())
+    elif fn.endswith('.csv'):
+        rows = _iter_csv_rows(fobj)
+    else:
+        rows = get_dict_from_file(fobj) or []
+
+    empty = True
+    for r in rows:
+        empty = False
+        yield r
+    if empty:
+        yield {}
+
+
+def _abort_on_error(rows, msg):
+    # type: (Iterable[Any], str) -> Iterable[Any]
+    try:
+        for r in rows:
+            yield r
+    except Exception as e:
+        click.echo("{}: {}".format(msg, e))
+        raise click.Abort()
+
+
+def get_extn_from_file(fobj):
+    return get_extn(fobj.name)
 
 
 def get_values_interactively(vlist, validator):
@@ -40,8 +92,149 @@ def get_values_interactively(vlist, validator):
 
 
 @click.group()
-def cli_main():
+@click.option('--profile', type=click.Path(dir_okay=False),
+              help="Write per-stage timings and counts as JSON to file")
+@click.option('--cprofile', type=click.Path(dir_okay=False),
+              help="Write cProfile statistics to file")
+@click.pass_context
+def cli_main(ctx, profile, cprofile):
     """Set of useful parameter utilities"""
+    if not (profile or cprofile):
+        return
+    ctx.obj = Profiler()
+    if cprofile:
+        import cProfile
+        cprof = cProfile.Profile()
+        cprof.enable()
+
+    def finish():
+        if cprofile:
+            cprof.disable()
+            cprof.dump_stats(cprofile)
+        if profile:
+            with open(profile, 'w') as f:
+                ctx.obj.dump(f)
+    ctx.call_on_close(finish)
+
+
+def get_profiler():
+    # type: () -> Profiler
+    """Profiler of the current command, recording nothing if profiling is
+    not enabled"""
+    ctx = click.get_current_context(silent=True)
+    prof = ctx.find_object(Profiler) if ctx is not None else None
+    if prof is None:
+        prof = NullProfiler()
+    return prof
+
+
+def get_input_values(eset, d, interact=False):
+    # type: (sci_parameter_utils.fragment.TemplateElemSet, Dict[str, Any], bool) -> Dict[str, Any] # noqa
+    """
+    Get validated input values for a row of supplied values
+    """
+    iReq = eset.get_inputs()
+    ivals = {}
+    missing = iReq.difference(d.keys())
+
+    for k in iReq:
+        if k in d:
+            ivals[k] = eset.validate(k, d[k])
+    if interact:
+        click.echo('Getting input values')
+        ivals.update(get_values_interactively(missing, eset.validate))
+
+    missing = iReq.difference(ivals)
+    if missing:
+        raise ValueError("No values supplied for {}".format(missing))
+    return ivals
+
+
+def render_row(engine, ivals, list_fns=False, archive=None, manifest=None):
+    # type: (TemplateEngine, Dict[str, Any], bool, ArchiveWriter, Manifest) -> str # noqa
+    """
+    Compute values for a row and write the templated file, or add it to the
+    archive if given, returning the name of the file
+
+    If a manifest is given the file is recorded in it, and not written again
+    if unchanged since it was last recorded.
+    """
+    prof = engine.profiler
+    if manifest is not None:
+        digest = manifest.row_digest(ivals)
+    fn = engine.format_filename(engine.compute(ivals))
+
+    if manifest is not None and manifest.unchanged(fn, digest):
+        manifest.record(fn, digest, True)
+        prof.count('unchanged')
+        return fn
+
+    if not list_fns:
+        text = engine.render_values(ivals)
+        try:
+            with prof.stage('write'):
+                if archive is not None:
+                    archive.add(fn, text)
+                else:
+                    with click.open_file(fn, 'w') as ofile:
+                        ofile.write(text)
+        except Exception as e:
+            raise RenderError("Error templating file {}: {}".format(fn, e))
+        prof.count('files')
+        prof.count('bytes', len(text))
+    # Only recorded once written, so a failed write is retried next run
+    if manifest is not None:
+        manifest.record(fn, digest)
+    return fn
+
+
+_worker_state = {}  # type: Dict[str, Any]
+
+
+class _FileCollector:
+    """Collects files rendered by a worker for the parent to archive"""
+
+    def __init__(self):
+        self.files = []  # type: List[Tuple[str, str]]
+
+    def add(self, name, text):
+        # type: (str, str) -> None
+        self.files.append((name, text))
+
+
+def _init_template_worker(defs, ttext, extn, out, list_fns, compiled,
+                          incremental, cse, archive, manifest):
+    # type: (Dict[str, Any], str, str, str, bool, bool, bool, bool, bool, Manifest) -> None # noqa
+    _worker_state['engine'] = TemplateEngine(
+        defs, ttext, extn, out,
+        compiled=compiled,
+        incremental=incremental,
+        cse=cse)
+    _worker_state['list_fns'] = list_fns
+    _worker_state['archive'] = archive
+    _worker_state['manifest'] = manifest
+
+
+def _template_worker(job):
+    # type: (Tuple[int, Dict[str, Any]]) -> Tuple[int, str, str, List[Tuple[str, str]], str, bool] # noqa
+    i, d = job
+    st = _worker_state
+    collector = _FileCollector() if st['archive'] else None
+    manifest = st['manifest']
+    try:
+        ivals = st['engine'].validate(d)
+        fn = render_row(st['engine'], ivals, st['list_fns'],
+                        archive=collector, manifest=manifest)
+    except RenderError as e:
+        return (i, None, str(e), [], None, False)
+    digest, skipped = None, False
+    if manifest is not None:
+        # The parent keeps the manifest, so only pass the record back
+        digest = manifest.new.pop(fn)
+        skipped = fn in manifest.skipped
+        manifest.skipped.discard(fn)
+    return (i, fn, None, collector.files if collector else [], digest,
+            skipped)
 
 
 @cli_main.command()
@@ -56,83 +249,332 @@ def cli_main():
               help="Allow interactive value supply")
 @click.option('list_fns', '--list/--no-list', '-l', default=False,
               help="List names of output files only")
+@click.option('--compiled/--symbolic', default=False,
+              help="Evaluate expressions numerically using compiled functions")
+@click.option('--incremental/--no-incremental', default=False,
+              help="Only recompute values depending on changed inputs")
+@click.option('--cse/--no-cse', default=False,
+              help="Evaluate subexpressions shared between expressions once")
+@click.option('--jobs', '-j', type=click.IntRange(1, None), default=1,
+              help="Number of worker processes for rendering files")
+@click.option('--sweep', '-s', type=click.File('r'),
+              help="Parameter sweep specification file")
+@click.option('--shard', default="",
+              help="Generate only shard I of N of the rows, given as I/N")
+@click.option('--archive', type=click.Path(dir_okay=False),
+              help="Write files into a tar or zip archive")
+@click.option('manifest_path', '--manifest', type=click.Path(dir_okay=False),
+              help="Manifest file used to skip files whose inputs are "
+              "unchanged")
+@click.option('--prune/--no-prune', default=False,
+              help="Delete files in the manifest no longer generated")
 @click.argument('template', type=click.File('r'))
-def template(params, ifile, out, template, interact, list_fns):
-    # type: (typing.TextIO, typing.TextIO, str, typing.TextIO, bool, bool) -> None # noqa
+def template(params, ifile, out, template, interact, list_fns, compiled,
+             incremental, cse, jobs, sweep, shard, archive, manifest_path,
+             prune):
+    # type: (typing.TextIO, typing.TextIO, str, typing.TextIO, bool, bool, bool, bool, bool, int, typing.TextIO, str, str, str, bool) -> None # noqa
     """Generate parameter files from TEMPLATE"""
+    prof = get_profiler()
+    if jobs > 1 and interact:
+        click.echo("Interactive value supply not possible with --jobs")
+        raise click.Abort()
+    if ifile and sweep:
+        click.echo("Only one of an input file and a sweep may be given")
+        raise click.Abort()
+    if archive and list_fns:
+        click.echo("Only one of --list and --archive may be given")
+        raise click.Abort()
+    if manifest_path and (archive or list_fns):
+        click.echo("A manifest may not be used with --list or --archive")
+        raise click.Abort()
+    if prune and not manifest_path:
+        click.echo("Pruning files requires a manifest")
+        raise click.Abort()
+
     try:
-        eset = sci_parameter_utils.fragment.TemplateElemSet(
-            sci_parameter_utils.fragment.elems_from_dict(
-                get_dict_from_file(params),
-                sci_parameter_utils.fragment.TemplateElem
-            ))
+        with prof.stage('load_definitions'):
+            defs = get_dict_from_file(params)
     except Exception as e:
         click.echo("Error setting up template: {}".format(e))
         raise click.Abort()
 
-    iReq = eset.get_inputs()
     if ifile:
-        iList = get_dict_from_file(ifile)
-        if not iList:
-            iList = [{}]
+        rows = _abort_on_error(iter_rows_from_file(ifile),
+                               "Error reading input values")
+    elif sweep:
+        try:
+            rows = (sci_parameter_utils.sweep
+                    .sweep_from_dict(get_dict_from_file(sweep))
+                    .rows())
+        except Exception as e:
+            click.echo("Error setting up sweep: {}".format(e))
+            raise click.Abort()
     else:
-        iList = [{}]
+        rows = iter([{}])
+
+    if shard:
+        try:
+            index, count = (int(i) for i in shard.split('/'))
+            rows = sci_parameter_utils.sweep.shard(rows, index, count)
+        except Exception as e:
+            click.echo("Error selecting shard {}: {}".format(shard, e))
+            raise click.Abort()
+    rows = prof.iterate('read_inputs', rows)
 
-    extn = get_extn_from_file(template)
     try:
-        parser = (sci_parameter_utils.parsers.PFileParser
-                  .parser_by_extn(extn))
-    except Exception as e:
-        click.echo("Error getting parser: {}".format(e))
+        engine = TemplateEngine(defs, template,
+                                out=out,
+                                compiled=compiled,
+                                incremental=incremental,
+                                cse=cse,
+                                profiler=prof)
+    except EngineError as e:
+        click.echo(str(e))
         raise click.Abort()
 
-    if not out:
-        out = sci_parameter_utils.general.get_fn_suggest(template, parser)
-    if not out:
-        out = 'output.'+extn
-
-    for d in iList:
-        ivals = {}
+    writer = None
+    if archive:
+        import sci_parameter_utils.archive as prm_archive
         try:
-            missing = iReq.difference(d.keys())
+            writer = prm_archive.ArchiveWriter(archive)
+        except Exception as e:
+            click.echo("Error opening archive: {}".format(e))
+            raise click.Abort()
+        click.get_current_context().call_on_close(writer.close)
 
-            for k in iReq:
-                if k in d:
-                    ivals[k] = eset.validate(k, d[k])
-            if interact:
-                click.echo('Getting input values')
-                ivals.update(get_values_interactively(missing, eset.validate))
+    manifest = None
+    if manifest_path:
+        import sci_parameter_utils.manifest as prm_manifest
+        try:
+            manifest = prm_manifest.Manifest(
+                manifest_path, engine.text, defs, engine.out, compiled, cse)
+        except Exception as e:
+            click.echo("Error opening manifest: {}".format(e))
+            raise click.Abort()
 
-            missing = iReq.difference(ivals)
-            if missing:
-                raise ValueError("No values supplied for {}".format(missing))
+        # Record the files generated even if generation fails
+        def save_manifest():
+            try:
+                manifest.save()
+            except Exception as e:
+                click.echo("Error writing manifest: {}".format(e))
+        click.get_current_context().call_on_close(save_manifest)
+
+    def prune_files():
+        if manifest is not None and prune:
+            try:
+                prof.count('pruned', len(manifest.prune()))
+            except Exception as e:
+                click.echo("Error pruning files: {}".format(e))
+                raise click.Abort()
+
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(
+            jobs,
+            initializer=_init_template_worker,
+            initargs=(defs, engine.text, engine.extn, engine.out, list_fns,
+                      compiled, incremental, cse, writer is not None,
+                      manifest))
+        failed = 0
+        jobs_iter = enumerate(rows)
+        try:
+            # Submit bounded windows of rows to keep memory use constant
+            while True:
+                window = list(itertools.islice(jobs_iter, 64*jobs))
+                if not window:
+                    break
+                prof.count('rows', len(window))
+                results = prof.iterate(
+                    'parallel_render',
+                    pool.imap(_template_worker, window, chunksize=16))
+                for i, fn, err, files, digest, skipped in results:
+                    try:
+                        if files:
+                            with prof.stage('write'):
+                                for name, text in files:
+                                    writer.add(name, text)
+                    except Exception as e:
+                        err = "Error templating file {}: {}".format(fn, e)
+                    if err:
+                        failed += 1
+                        click.echo("Row {}: {}".format(i, err))
+                    elif list_fns:
+                        click.echo(fn)
+                    elif skipped:
+                        prof.count('unchanged')
+                    else:
+                        prof.count('files')
+                    if digest is not None:
+                        manifest.record(fn, digest, skipped)
+        finally:
+            pool.close()
+            pool.join()
+        if failed:
+            click.echo("Failed to generate {} files".format(failed))
+            raise click.Abort()
+        prune_files()
+        return
 
+    for d in rows:
+        prof.count('rows')
+        try:
+            with prof.stage('validation'):
+                ivals = get_input_values(engine.eset, d, interact)
         except Exception as e:
             click.echo("Error obtaining input values: {}".format(e))
             raise click.Abort()
 
-        eset.compute_strings(ivals)
-        fn = out.format(**ivals)
         try:
-            pass
-
-        except Exception as e:
-            click.echo("Error generating filename: {}".format(e))
+            fn = render_row(engine, ivals, list_fns, writer, manifest)
+        except RenderError as e:
+            click.echo(str(e))
             raise click.Abort()
 
         if list_fns:
             click.echo(fn)
-            continue
+    prune_files()
+
+
+class PrintError(Exception):
+    pass
+
 
+def compute_printed(f, dset, sset, parser, names, cache=None,
+                    stop_early=False, profiler=None):
+    # type: (typing.TextIO, sci_parameter_utils.fragment.TemplateElemSet, sci_parameter_utils.general.SearchPlan, Type[sci_parameter_utils.parsers.PFileParser], List[str], Any, bool, Profiler) -> Dict[str, str] # noqa
+    """
+    Search a parameter file and return the strings of the printed elements
+    """
+    prof = profiler or NullProfiler()
+    try:
+        with prof.stage('search'):
+            ivals = sci_parameter_utils.general.do_search(
+                sset, f, parser,
+                cache=cache,
+                stop_early=stop_early,
+                profiler=prof)
+    except Exception as e:
+        raise PrintError("Error searching file: {}".format(e))
+
+    try:
+        with prof.stage('evaluation'):
+            raw = {}  # type: Dict[str, Any]
+            if dset.compiled:
+                # Compiled functions need numbers rather than the strings
+                # found, inputs are still printed as found
+                for k in dset.get_inputs().intersection(ivals):
+                    try:
+                        v = dset.validate(k, ivals[k])
+                    except (ValueError, TypeError):
+                        continue
+                    raw[k] = ivals[k]
+                    ivals[k] = v
+            dset.compute_strings(ivals)
+            for k in raw:
+                ivals[k] = dset.elements[k].do_format(raw[k])
+    except Exception as e:
+        raise PrintError("Error generating strings: {}".format(e))
+
+    try:
+        return dict((v, ivals[v]) for v in names)
+    except Exception as e:
+        raise PrintError("Error printing data: {}".format(e))
+
+
+def format_printed(values, printed):
+    # type: (Dict[str, str], List[Tuple[str, List[str]]]) -> List[str]
+    """Lines listing the printed values by section"""
+    lines = []
+    for k, names in printed:
+        lines.append('Section {}'.format(k))
+        for v in names:
+            lines.append('\t{} = {}'.format(v, values[v]))
+    return lines
+
+
+def open_table(fmt, output, columns):
+    # type: (str, str, List[str]) -> sci_parameter_utils.tables.TableWriter
+    """
+    Open a table writer for the current command, closed when it finishes
+    """
+    import sci_parameter_utils.tables as prm_tables
+    binary = prm_tables.is_binary(fmt)
+    if binary and not output:
+        click.echo("An output file is required for the {} format"
+                   .format(fmt))
+        raise click.Abort()
+    try:
+        tfile = click.open_file(output or '-', 'wb' if binary else 'w')
         try:
-            (sci_parameter_utils.general
-             .do_template(template,
-                          click.open_file(fn, 'w'),
-                          parser,
-                          ivals))
-        except Exception as e:
-            click.echo("Error templating file {}: {}".format(fn, e))
-            raise click.Abort()
+            table = prm_tables.table_writer(fmt, tfile, columns)
+        except Exception:
+            tfile.close()
+            raise
+    except Exception as e:
+        click.echo("Error opening output: {}".format(e))
+        raise click.Abort()
+
+    def close_table():
+        try:
+            table.close()
+        finally:
+            tfile.close()
+    click.get_current_context().call_on_close(close_table)
+    return table
+
+
+def _init_print_worker(idict, needed, parser, names, compiled, cse,
+                       cache_dir, stop_early):
+    # type: (Dict[str, Any], Set[str], Type[sci_parameter_utils.parsers.PFileParser], List[str], bool, bool, str, bool) -> None # noqa
+    dset = sci_parameter_utils.fragment.TemplateElemSet(
+        sci_parameter_utils.fragment.elems_from_dict(
+            idict['elems'],
+            sci_parameter_utils.fragment.TemplateElem
+        ),
+        compiled=compiled,
+        cse=cse).restrict(needed)
+    sset = sci_parameter_utils.fragment.elems_from_dict(
+        idict['locs'],
+        sci_parameter_utils.fragment.SearchElem
+    )
+    _worker_state['dset'] = dset
+    _worker_state['sset'] = sci_parameter_utils.general.SearchPlan(
+        dict((k, sset[k]) for k in sset if k in dset.elements))
+    _worker_state['parser'] = parser
+    _worker_state['names'] = names
+    _worker_state['stop_early'] = stop_early
+    _worker_state['cache'] = None
+    if cache_dir:
+        import sci_parameter_utils.cache as prm_cache
+        _worker_state['cache'] = prm_cache.ParseCache(cache_dir)
+
+
+def _print_worker(job):
+    # type: (Tuple[int, str, str]) -> Tuple[int, Dict[str, str], str, Dict[str, int]] # noqa
+    i, name, text = job
+    st = _worker_state
+    cache = st['cache']
+    before = cache.stats() if cache is not None else None
+    try:
+        if text is None:
+            f = open(name, 'r')
+        else:
+            f = io.StringIO(text)
+            f.name = name
+        with f:
+            values = compute_printed(f, st['dset'], st['sset'],
+                                     st['parser'], st['names'], cache=cache,
+                                     stop_early=st['stop_early'])
+        err = None
+    except Exception as e:
+        values, err = {}, str(e)
+    stats = {}  # type: Dict[str, int]
+    if cache is not None:
+        after = cache.stats()
+        stats = dict((k, after[k] - before[k])
+                     for k in ('hits', 'misses', 'evictions'))
+    return (i, values, err, stats)
 
 
 @cli_main.command('print')
@@ -141,32 +583,70 @@ def template(params, ifile, out, template, interact, list_fns):
               help="Parmeter definition file")
 @click.option('olist', '--print', '-p', default="",
               help="List of sections to print")
+@click.option('--compiled/--symbolic', default=False,
+              help="Evaluate expressions numerically using compiled functions")
+@click.option('--cse/--no-cse', default=False,
+              help="Evaluate subexpressions shared between expressions once")
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+              envvar='SCI_PARAMETER_UTILS_CACHE',
+              help="Directory for caching parsed parameter files")
+@click.option('--cache/--no-cache', 'use_cache', default=True,
+              help="Use the cache directory if given")
+@click.option('--cache-stats', is_flag=True, default=False,
+              help="Report cache statistics when finished")
+@click.option('--stop-early/--read-all', default=False,
+              help="Stop reading each file once all values are found")
+@click.option('archives', '--archive', '-a', multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="Tar or zip archive of files to read after PRMFILES")
+@click.option('--member', default='*',
+              help="Pattern of names of archive files to read")
+@click.option('--jobs', '-j', type=click.IntRange(1, None), default=1,
+              help="Number of worker processes for reading files")
+@click.option('fmt', '--format', '-f', default='text',
+              type=click.Choice(['text', 'csv', 'jsonl', 'npz']),
+              help="Print sections as text, or a table with a row per file")
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help="File to write the table to")
 @click.argument('prmfiles', type=click.File('r'), nargs=-1)
-def print_vals(prmfiles, deffile, olist):
-    # type: (List[typing.TextIO], typing.TextIO, str) -> None
+def print_vals(prmfiles, deffile, olist, compiled, cse, cache_dir, use_cache,
+               cache_stats, stop_early, archives, member, jobs, fmt, output):
+    # type: (List[typing.TextIO], typing.TextIO, str, bool, bool, str, bool, bool, bool, List[str], str, int, str, str) -> None # noqa
     """Prints values from PRMFILES"""
+    prof = get_profiler()
+    if output and fmt == 'text':
+        click.echo("Writing to a file requires a table --format")
+        raise click.Abort()
     try:
-        idict = get_dict_from_file(deffile)
-        deffile.close()
+        with prof.stage('load_definitions'):
+            idict = get_dict_from_file(deffile)
+            deffile.close()
+            worker_dict = copy.deepcopy(idict)
     except Exception as e:
         click.echo("Error setting loading def file: {}".format(e))
         raise click.Abort()
 
     try:
-        dset = sci_parameter_utils.fragment.TemplateElemSet(
-            sci_parameter_utils.fragment.elems_from_dict(
+        with prof.stage('load_definitions'):
+            elems = sci_parameter_utils.fragment.elems_from_dict(
                 idict['elems'],
                 sci_parameter_utils.fragment.TemplateElem
-            ))
+            )
+        with prof.stage('build_element_set'):
+            dset = sci_parameter_utils.fragment.TemplateElemSet(
+                elems,
+                compiled=compiled,
+                cse=cse)
     except Exception as e:
         click.echo("Error setting up template: {}".format(e))
         raise click.Abort()
 
     try:
-        sset = sci_parameter_utils.fragment.elems_from_dict(
-            idict['locs'],
-            sci_parameter_utils.fragment.SearchElem
-        )
+        with prof.stage('load_definitions'):
+            sset = sci_parameter_utils.fragment.elems_from_dict(
+                idict['locs'],
+                sci_parameter_utils.fragment.SearchElem
+            )
     except Exception as e:
         click.echo("Error generating search list: {}".format(e))
         raise click.Abort()
@@ -182,36 +662,278 @@ def print_vals(prmfiles, deffile, olist):
         click.echo("Error collecting printing sections: {}".format(e))
         raise click.Abort()
 
-    extn = get_extn_from_file(prmfiles[0])
+    # Only search for and compute the elements printed
     try:
-        parser = (sci_parameter_utils.parsers.PFileParser
-                  .parser_by_extn(extn))
+        with prof.stage('build_element_set'):
+            needed = set()  # type: Set[str]
+            for k in prlist:
+                if k in pr_sections:
+                    needed.update(prlist[k])
+            dset = dset.restrict(needed)
+            sset = sci_parameter_utils.general.SearchPlan(
+                dict((k, sset[k]) for k in sset if k in dset.elements))
+            printed = [(k, prlist[k]) for k in prlist if k in pr_sections]
+            names = []  # type: List[str]
+            for _, pnames in printed:
+                names.extend(v for v in pnames if v not in names)
     except Exception as e:
-        click.echo("Error getting parser: {}".format(e))
+        click.echo("Error collecting printing sections: {}".format(e))
         raise click.Abort()
 
-    for f in prmfiles:
-        click.echo("Input {}:".format(f.name))
-
+    table = None
+    if fmt != 'text':
+        import sci_parameter_utils.tables as prm_tables
+        table = open_table(fmt, output, names)
+
+    def report(name, values, err):
+        # type: (str, Dict[str, str], str) -> None
+        if table is None:
+            click.echo("Input {}:".format(name))
+            if err:
+                click.echo(err)
+                return
+            with prof.stage('output'):
+                for l in format_printed(values, printed):
+                    click.echo(l)
+            click.echo('-----')
+        elif err:
+            click.echo("Input {}: {}".format(name, err), err=True)
+        else:
+            values[prm_tables.FILE_COLUMN] = name
+            with prof.stage('output'):
+                table.write_row(values)
+
+    inputs = iter(prmfiles)  # type: Iterable[typing.TextIO]
+    if archives:
+        import sci_parameter_utils.archive as prm_archive
+        members = (f for a in archives
+                   for f in prm_archive.read_members(a, member))
+        inputs = itertools.chain(
+            inputs, _abort_on_error(members, "Error reading archive"))
+
+    cache = None
+    if cache_dir and use_cache:
+        import sci_parameter_utils.cache as prm_cache
         try:
-            ivals = sci_parameter_utils.general.do_search(sset, f, parser)
+            cache = prm_cache.ParseCache(cache_dir)
         except Exception as e:
-            click.echo("Error searching file: {}".format(e))
+            click.echo("Error opening cache: {}".format(e))
             raise click.Abort()
 
+    parser = None
+    first = next(inputs, None)
+    if first is not None:
+        inputs = itertools.chain([first], inputs)
         try:
-            dset.compute_strings(ivals)
+            parser = (sci_parameter_utils.parsers.PFileParser
+                      .parser_by_extn(get_extn_from_file(first)))
         except Exception as e:
-            click.echo("Error generating strings: {}".format(e))
+            click.echo("Error getting parser: {}".format(e))
             raise click.Abort()
 
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(
+            jobs,
+            initializer=_init_print_worker,
+            initargs=(worker_dict, needed, parser, names, compiled, cse,
+                      cache.cachedir if cache is not None else None,
+                      stop_early))
+        failed = 0
+        totals = {}  # type: Dict[str, int]
+        jobs_iter = enumerate(inputs)
         try:
-            for k in prlist:
-                if k in pr_sections:
-                    click.echo('Section {}'.format(k))
-                    for v in prlist[k]:
-                        click.echo('\t{} = {}'.format(v, ivals[v]))
-        except Exception as e:
-            click.echo("Error printing data: {}".format(e))
+            # Submit bounded windows of files, passing files by name unless
+            # only their contents are available
+            while True:
+                window = []
+                fnames = []
+                for i, f in itertools.islice(jobs_iter, 64*jobs):
+                    text = f.getvalue() if isinstance(f, io.StringIO) \
+                        else None
+                    window.append((i, f.name, text))
+                    fnames.append(f.name)
+                    f.close()
+                if not window:
+                    break
+                results = prof.iterate(
+                    'parallel_print',
+                    pool.imap(_print_worker, window, chunksize=4))
+                for name, (i, values, err, stats) in zip(fnames, results):
+                    for k in stats:
+                        totals[k] = totals.get(k, 0) + stats[k]
+                    if err:
+                        failed += 1
+                    else:
+                        prof.count('files')
+                    report(name, values, err)
+        finally:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.merge_stats(totals)
+        if failed:
+            click.echo("Failed to read {} files".format(failed), err=True)
             raise click.Abort()
-        click.echo('-----')
+    else:
+        for f in inputs:
+            try:
+                values = compute_printed(f, dset, sset, parser, names,
+                                         cache=cache,
+                                         stop_early=stop_early,
+                                         profiler=prof)
+            except PrintError as e:
+                report(f.name, {}, str(e))
+                raise click.Abort()
+            prof.count('files')
+            report(f.name, values, None)
+
+    if cache_stats:
+        if cache is None:
+            click.echo("Cache not in use", err=True)
+        else:
+            click.echo("Cache: {hits} hits, {misses} misses, "
+                       "{evictions} evictions, {bytes} bytes"
+                       .format(**cache.stats()),
+                       err=True)
+
+
+@cli_main.command()
+@click.option('--params', '-p', type=click.File('r'),
+              help="Parmeter definition file for templates")
+@click.option('--deffile', '-d', type=click.File('r'),
+              help="Parmeter definition file for printing")
+@click.option('--cse/--no-cse', default=False,
+              help="Evaluate subexpressions shared between expressions once")
+def plan(params, deffile, cse):
+    # type: (typing.TextIO, typing.TextIO, bool) -> None
+    """Show the order in which elements are evaluated"""
+    if bool(params) == bool(deffile):
+        click.echo("Exactly one definition file must be given")
+        raise click.Abort()
+
+    try:
+        if params:
+            defs = get_dict_from_file(params)
+        else:
+            defs = get_dict_from_file(deffile)['elems']
+        eset = sci_parameter_utils.fragment.TemplateElemSet(
+            sci_parameter_utils.fragment.elems_from_dict(
+                defs,
+                sci_parameter_utils.fragment.TemplateElem
+            ),
+            cse=cse)
+    except Exception as e:
+        click.echo("Error setting up elements: {}".format(e))
+        raise click.Abort()
+
+    for k, etype, expr, deps in eset.plan():
+        line = '{} ({})'.format(k, etype)
+        if expr:
+            line += ' = {}'.format(expr)
+        if deps:
+            line += ' <- {}'.format(', '.join(deps))
+        click.echo(line)
+
+
+@cli_main.command('index')
+@click.argument('database', type=click.Path(dir_okay=False))
+@click.argument('paths', type=click.Path(exists=True), nargs=-1)
+@click.option('--prune/--no-prune', default=False,
+              help="Remove files which no longer exist from the index")
+def index_files(database, paths, prune):
+    # type: (str, List[str], bool) -> None
+    """Add parameter files in PATHS to the index DATABASE
+
+    Directories are searched for files with the extension of a known format.
+    Files unchanged since they were last indexed are not read again.
+    """
+    import sci_parameter_utils.index as prm_index
+    prof = get_profiler()
+    try:
+        index = prm_index.ParameterIndex(database)
+    except Exception as e:
+        click.echo("Error opening index: {}".format(e))
+        raise click.Abort()
+
+    indexed = unchanged = failed = 0
+    try:
+        files = _abort_on_error(prm_index.find_files(paths),
+                                "Error getting parser")
+        for path, parser in files:
+            try:
+                with prof.stage('index'):
+                    changed = index.update(path, parser)
+            except Exception as e:
+                click.echo("Error indexing {}: {}".format(path, e),
+                           err=True)
+                failed += 1
+                continue
+            if changed:
+                indexed += 1
+                prof.count('files')
+            else:
+                unchanged += 1
+                prof.count('unchanged')
+        removed = index.remove_missing() if prune else []
+        index.commit()
+    finally:
+        index.close()
+
+    click.echo("Indexed {} files, {} unchanged, {} removed"
+               .format(indexed, unchanged, len(removed)))
+    if failed:
+        click.echo("Failed to index {} files".format(failed), err=True)
+        raise click.Abort()
+
+
+@cli_main.command()
+@click.argument('database', type=click.Path(exists=True, dir_okay=False))
+@click.option('filters', '--where', '-w', multiple=True,
+              help="Condition on the value of a key, such as "
+              "'Mesh:Refinement >= 6'")
+@click.option('select', '--select', '-s', multiple=True,
+              help="Key whose values are shown")
+@click.option('fmt', '--format', '-f', default='text',
+              type=click.Choice(['text', 'csv', 'jsonl', 'npz']),
+              help="Show files as text, or a table with a row per file")
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help="File to write the table to")
+def query(database, filters, select, fmt, output):
+    # type: (str, List[str], List[str], str, str) -> None
+    """Show files in the index DATABASE satisfying all conditions"""
+    import sci_parameter_utils.index as prm_index
+    prof = get_profiler()
+    if output and fmt == 'text':
+        click.echo("Writing to a file requires a table --format")
+        raise click.Abort()
+    try:
+        conds = [prm_index.parse_filter(w) for w in filters]
+        index = prm_index.ParameterIndex(database)
+        try:
+            with prof.stage('query'):
+                rows = index.query(conds, select)
+        finally:
+            index.close()
+    except Exception as e:
+        click.echo("Error querying index: {}".format(e))
+        raise click.Abort()
+
+    table = None
+    if fmt != 'text':
+        import sci_parameter_utils.tables as prm_tables
+        table = open_table(fmt, output, list(select))
+
+    with prof.stage('output'):
+        for path, values in rows:
+            prof.count('files')
+            if table is not None:
+                row = dict((k, v if v is not None else '')
+                           for k, v in zip(select, values))
+                row[prm_tables.FILE_COLUMN] = path
+                table.write_row(row)
+                continue
+            click.echo(path)
+            for k, v in zip(select, values):
+                if v is not None:
+                    click.echo('\t{} = {}'.format(k, v))
@@ -0,0 +1,204 @@
+import copy
+import io
+import six
+import string
+import sci_parameter_utils.fragment
+import sci_parameter_utils.general
+import sci_parameter_utils.parsers  # noqa: F401
+from sci_parameter_utils.parameter_file import PFileParser
+from sci_parameter_utils.profiling import NullProfiler
+try:
+    import typing  # noqa: F401
+    from typing import Any, Dict, Iterable, Iterator, Set, Tuple  # noqa: F401
+    from typing import Union  # noqa: F401
+    from sci_parameter_utils.profiling import Profiler  # noqa: F401
+except:
+    pass
+
+
+class EngineError(Exception):
+    pass
+
+
+class RenderError(EngineError):
+    pass
+
+
+def get_extn(fn):
+    # type: (str) -> str
+    """Extension of a file name, used to select its parser"""
+    hInd = fn.rfind('.', -4)
+    if(hInd > 0):
+        return fn[hInd+1:]
+    return ""
+
+
+def get_format_names(fstr):
+    # type: (str) -> Set[str]
+    """Names of the values used by a format string"""
+    names = set()
+    for t in string.Formatter().parse(fstr):
+        if t[1]:
+            names.add(t[1])
+    return names
+
+
+class TemplateEngine:
+    """Renders parameter files from element definitions and a template
+
+    The definitions and template are parsed once on initialization, so a
+    long-lived process can render any number of rows of input values::
+
+        engine = TemplateEngine(yaml.safe_load(open('defs.yaml')),
+                                open('template.prm'))
+        for fn, text in engine.render_many([{'a': 1}, {'a': 2}]):
+            ...
+
+    Only the elements used by the template and output name are computed.
+    """
+
+    def __init__(self, defs, template, extn=None, out=None, compiled=False,
+                 incremental=False, cse=False, profiler=None):
+        # type: (Dict[str, Any], Union[str, typing.TextIO], str, str, bool, bool, bool, Profiler) -> None # noqa
+        """Initialize from element definitions and a template
+
+        Args:
+            defs (dict): Element definitions, as in a parameter
+                configuration file
+            template: Template file or text
+            extn (str, optional): Extension of the template format, taken
+                from the name of the template file if not given
+            out (str, optional): Name format for output files, taken from
+                the template or ``output.<extn>`` if not given
+            compiled (bool): Evaluate expressions using compiled functions
+            incremental (bool): Only recompute values depending on inputs
+                which changed since the previous row
+            cse (bool): Evaluate shared subexpressions once
+            profiler (Profiler, optional): Profiler recording the time
+                spent in each stage
+
+        Raises:
+            EngineError: The definitions or template are invalid
+        """
+        prof = profiler or NullProfiler()
+        self.profiler = prof
+        try:
+            with prof.stage('load_definitions'):
+                elems = sci_parameter_utils.fragment.elems_from_dict(
+                    copy.deepcopy(defs),
+                    sci_parameter_utils.fragment.TemplateElem
+                )
+            with prof.stage('build_element_set'):
+                eset = sci_parameter_utils.fragment.TemplateElemSet(
+                    elems,
+                    compiled=compiled,
+                    incremental=incremental,
+                    cse=cse)
+        except Exception as e:
+            raise EngineError("Error setting up template: {}".format(e))
+
+        if isinstance(template, six.string_types):
+            text = template
+        else:
+            text = template.read()
+            if extn is None:
+                extn = get_extn(template.name)
+        self.text = six.text_type(text)
+        self.extn = extn or ""
+        try:
+            self.parser = PFileParser.parser_by_extn(self.extn)
+        except Exception as e:
+            raise EngineError("Error getting parser: {}".format(e))
+
+        with prof.stage('read_template'):
+            if not out:
+                try:
+                    out = sci_parameter_utils.general.get_fn_suggest(
+                        io.StringIO(self.text), self.parser)
+                except Exception as e:
+                    raise EngineError(
+                        "Error reading template: {}".format(e))
+            if not out:
+                out = 'output.'+self.extn
+            self.out = out
+
+            try:
+                self.template = sci_parameter_utils.general.CompiledTemplate(
+                    io.StringIO(self.text), self.parser)
+                unknown = self.template.required.difference(eset.elements)
+                if unknown:
+                    raise ValueError(
+                        "No elements defined for {}".format(set(unknown)))
+            except Exception as e:
+                raise EngineError("Error reading template: {}".format(e))
+
+        try:
+            needed = sorted(self.template.required.union(
+                get_format_names(out).intersection(eset.elements)))
+        except ValueError as e:
+            raise EngineError("Error generating filename: {}".format(e))
+        with prof.stage('build_element_set'):
+            self.eset = eset.restrict(needed)
+
+    def validate(self, row):
+        # type: (Dict[str, Any]) -> Dict[str, Any]
+        """Return the validated input values of a row of supplied values
+
+        Raises:
+            RenderError: A value is missing or invalid
+        """
+        iReq = self.eset.get_inputs()
+        try:
+            missing = iReq.difference(row)
+            if missing:
+                raise ValueError(
+                    "No values supplied for {}".format(missing))
+            return dict((k, self.eset.validate(k, row[k])) for k in iReq)
+        except Exception as e:
+            raise RenderError("Error obtaining input values: {}".format(e))
+
+    def compute(self, ivals):
+        # type: (Dict[str, Any]) -> Dict[str, Any]
+        """Compute the strings of all elements from validated input values,
+        updating and returning the values"""
+        try:
+            with self.profiler.stage('evaluation'):
+                self.eset.compute_strings(ivals)
+        except Exception as e:
+            raise RenderError("Error computing values: {}".format(e))
+        return ivals
+
+    def format_filename(self, values):
+        # type: (Dict[str, Any]) -> str
+        """Name of the output file for computed values"""
+        try:
+            with self.profiler.stage('filename'):
+                return self.out.format(**values)
+        except Exception as e:
+            raise RenderError("Error generating filename: {}".format(e))
+
+    def render_values(self, values):
+        # type: (Dict[str, Any]) -> str
+        """Text of the output file for computed values"""
+        try:
+            with self.profiler.stage('render'):
+                return self.template.render(values)
+        except Exception as e:
+            raise RenderError("Error rendering template: {}".format(e))
+
+    def filename(self, row):
+        # type: (Dict[str, Any]) -> str
+        """Name of the output file for a row of input values"""
+        return self.format_filename(self.compute(self.validate(row)))
+
+    def render(self, row):
+        # type: (Dict[str, Any]) -> str
+        """Text of the output file for a row of input values"""
+        return self.render_values(self.compute(self.validate(row)))
+
+    def render_many(self, rows):
+        # type: (Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str]]
+        """Yield the name and text of the output file for each row"""
+        for row in rows:
+            values = self.compute(self.validate(row))
+            yield self.format_filename(values), self.render_values(values)
@@ -1,10 +1,13 @@
-import sympy
 import string
+import numbers
 import abc
+import fnmatch
+import re
 from six import add_metaclass, raise_from, PY2
+from sci_parameter_utils.graph import DependencyGraph, DependencyError  # noqa: F401, E501
 try:
     import typing  # noqa: F401
-    from typing import Any, Callable, Set, Type  # noqa: F401
+    from typing import Any, Callable, FrozenSet, Iterable, List, Sequence, Set, Tuple, Type  # noqa: F401, E501
     E = typing.TypeVar('E', bound='ElemBase')
 except:
     pass
@@ -14,6 +17,20 @@ tr_func = (
     else str.maketrans)  # type: ignore
 
 
+# sympy is imported when an expression element is first constructed rather
+# than with this module, as it dominates startup time otherwise
+
+
+def _get_numpy():
+    # type: () -> Any
+    """Return numpy module if available, otherwise None"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
 def _register_by_type(etype, base_class, store_dict):
     # type: (str, Type[E], Dict[str, Type[E]]) -> Callable[[Type[E]], Type[E]]
     def internal_dec(cls):
@@ -59,40 +76,52 @@ class InvalidInputError(ValueError):
     pass
 
 
-class DependencyError(Exception):
-    pass
-
-
 class TemplateElemSet:
-    def __init__(self, elems):
-        # type: (Dict[str, TemplateElem]) -> None
+    def __init__(self, elems, compiled=False, incremental=False, cse=False):
+        # type: (Dict[str, TemplateElem], bool, bool, bool) -> None
         self.elements = elems
+        self.compiled = compiled
+        self.incremental = incremental
+        self.cse = cse
+        self._collect_nodes()
         self._compute_order()
         self._collect_inputs()
+        self._collect_evaluators()
+        self.reset()
 
-    def _compute_order(self):
+    def _collect_nodes(self):
         # type: () -> None
-        searching = set()  # type: Set[str]
-        order = []  # type: List[str]
-        for k in self.elements:
-            self._search_dep(k, searching, order)
-        self.order = order
-
-    def _search_dep(self, k, searching, order):
-        # type: (str, Set[str], List[str]) -> None
-        if k not in self.elements:
-            raise DependencyError("Unknown dependency {}".format(k))
-        if k in searching:
-            raise DependencyError(
-                "Cyclic element dependency including {}".format(k))
-        if k in order:
+        """Collect the elements to evaluate, replacing expressions by ones
+        using hidden intermediate elements for shared subexpressions if
+        requested"""
+        self.nodes = dict(self.elements)  # type: Dict[str, TemplateElem]
+        self.hidden = frozenset()  # type: FrozenSet[str]
+        if not self.cse:
+            return
+        names = sorted(k for k in self.elements
+                       if isinstance(self.elements[k], NExprElem))
+        if not names:
             return
-        searching.add(k)
-        for d in self.elements[k].get_dependencies():
-            self._search_dep(d, searching, order)
-        searching.remove(k)
-        order.append(k)
-        return
+        import sympy
+        prefix = '__cse_'
+        while any(k.startswith(prefix) for k in self.elements):
+            prefix = '_' + prefix
+        repl, reduced = sympy.cse(
+            [self.elements[k].expr for k in names],
+            symbols=sympy.numbered_symbols(prefix))
+        for sym, sub in repl:
+            self.nodes[str(sym)] = NExprElem(str(sym), sub)
+        for k, expr in zip(names, reduced):
+            elem = self.elements[k]
+            if expr != elem.expr:
+                self.nodes[k] = NExprElem(k, expr, fmt=elem.fmt)
+        self.hidden = frozenset(str(sym) for sym, _ in repl)
+
+    def _compute_order(self):
+        # type: () -> None
+        self.graph = DependencyGraph(dict(
+            (k, self.nodes[k].get_dependencies()) for k in self.nodes))
+        self.order = self.graph.order
 
     def _collect_inputs(self):
         # type: () -> None
@@ -102,10 +131,84 @@ class TemplateElemSet:
             if isinstance(e, InputElem):
                 self.inputs.add(k)
 
+    def _collect_evaluators(self):
+        # type: () -> None
+        self.evaluators = {}  # type: Dict[str, Callable[[Dict[str, Any]], Any]] # noqa
+        for k in self.order:
+            e = self.nodes[k]
+            if self.compiled:
+                self.evaluators[k] = e.get_evaluator()
+            else:
+                self.evaluators[k] = e.evaluate
+
+    @property
+    def dependents(self):
+        # type: () -> Dict[str, Set[str]]
+        return self.graph.dependents
+
+    def reset(self):
+        # type: () -> None
+        """Forget values retained for incremental computation"""
+        self._prev = None  # type: Dict[str, Any]
+        self._prev_supplied = frozenset()  # type: FrozenSet[str]
+        self._downstream_cache = {}  # type: Dict[FrozenSet[str], Set[str]]
+
+    def _downstream(self, changed):
+        # type: (FrozenSet[str]) -> Set[str]
+        try:
+            return self._downstream_cache[changed]
+        except KeyError:
+            pass
+        found = self.graph.downstream(changed)
+        if len(self._downstream_cache) > 256:
+            self._downstream_cache.clear()
+        self._downstream_cache[changed] = found
+        return found
+
     def get_inputs(self):
         # type: () -> Set[str]
         return self.inputs
 
+    def restrict(self, names):
+        # type: (Iterable[str]) -> TemplateElemSet
+        """Return a set of only the given elements and those they depend on
+
+        Args:
+            names: Names of the elements required
+
+        Returns:
+            :class:`TemplateElemSet`: Set with the same options computing
+            only the required elements
+        """
+        names = set(names)
+        unknown = names.difference(self.elements)
+        if unknown:
+            raise DependencyError("Unknown dependency {}".format(
+                ', '.join(sorted(unknown))))
+        needed = self.graph.upstream(names)
+        return TemplateElemSet(
+            dict((k, self.elements[k]) for k in self.elements
+                 if k in needed),
+            compiled=self.compiled,
+            incremental=self.incremental,
+            cse=self.cse)
+
+    def plan(self):
+        # type: () -> List[Tuple[str, str, str, List[str]]]
+        """Return the evaluation order as tuples of the element name, type,
+        expression and dependencies, hidden elements for shared
+        subexpressions having type ``shared``"""
+        out = []
+        for k in self.order:
+            e = self.nodes[k]
+            if k in self.hidden:
+                etype = 'shared'
+            else:
+                etype = getattr(e, '_etype', type(e).__name__)
+            out.append((k, etype, str(getattr(e, 'expr', '')),
+                        sorted(e.get_dependencies())))
+        return out
+
     def validate(self, k, v):
         # type: (str, str) -> Any
         if k in self.inputs:
@@ -126,10 +229,43 @@ class TemplateElemSet:
 
     def compute_values(self, valdict):
         # type: (Dict[str, Any]) -> None
-        for k in self.order:
-            if k in valdict:
-                continue
-            valdict[k] = self.elements[k].evaluate(valdict)
+        if self.incremental:
+            self._compute_values_incremental(valdict)
+        else:
+            for k in self.order:
+                if k in valdict:
+                    continue
+                valdict[k] = self.evaluators[k](valdict)
+        for k in self.hidden:
+            del valdict[k]
+
+    def _compute_values_incremental(self, valdict):
+        # type: (Dict[str, Any]) -> None
+        """Compute values reusing those of the previous call for elements
+        not dependent on any supplied value that has changed"""
+        prev = self._prev
+        supplied = frozenset(valdict)
+        self._prev = None
+        if prev is None or supplied != self._prev_supplied:
+            for k in self.order:
+                if k in valdict:
+                    continue
+                valdict[k] = self.evaluators[k](valdict)
+        else:
+            changed = frozenset(
+                k for k in supplied
+                if not (type(valdict[k]) is type(prev[k]) and
+                        (valdict[k] is prev[k] or valdict[k] == prev[k])))
+            dirty = self._downstream(changed)
+            for k in self.order:
+                if k in valdict:
+                    continue
+                if k in dirty:
+                    valdict[k] = self.evaluators[k](valdict)
+                else:
+                    valdict[k] = prev[k]
+        self._prev = dict(valdict)
+        self._prev_supplied = supplied
 
     def compute_strings(self, valdict):
         # type: (Dict[str, Any]) -> None
@@ -140,6 +276,74 @@ class TemplateElemSet:
             except ValueError as e:
                 raise_from(ValueError('Error formatting {}:'.format(k)), e)
 
+    def validate_batch(self, k, column):
+        # type: (str, Sequence[Any]) -> List[Any]
+        validate = self.validate
+        return [validate(k, v) for v in column]
+
+    def compute_values_batch(self, columns):
+        # type: (Dict[str, Sequence[Any]]) -> Dict[str, Sequence[Any]]
+        """Compute all elements for a table of rows given as columns
+
+        For compiled sets each element is evaluated once over the whole
+        column in dependency order, expressions being evaluated numerically
+        using numpy where available. Other sets are evaluated row by row, so
+        the values are those of :meth:`compute_values` in every case.
+
+        Args:
+            columns (dict): Sequence of values for each supplied element, all
+                of the same length
+
+        Returns:
+            dict: Columns for all elements, including those supplied
+        """
+        nrows = None
+        for k in columns:
+            if nrows is None:
+                nrows = len(columns[k])
+            elif len(columns[k]) != nrows:
+                raise ValueError(
+                    "Column {} has length {} not {}".format(
+                        k, len(columns[k]), nrows))
+        if nrows is None:
+            nrows = 1
+        missing = self.inputs.difference(columns)
+        if missing:
+            raise DependencyError(
+                "Missing dependencies {}".format(missing))
+        if not self.compiled:
+            return self._compute_values_rows(columns, nrows)
+        outcols = dict(columns)
+        for k in self.order:
+            if k in outcols:
+                continue
+            outcols[k] = self.nodes[k].evaluate_batch(outcols, nrows)
+        for k in self.hidden:
+            del outcols[k]
+        return outcols
+
+    def _compute_values_rows(self, columns, nrows):
+        # type: (Dict[str, Sequence[Any]], int) -> Dict[str, Sequence[Any]]
+        cols = [(k, columns[k].tolist() if hasattr(columns[k], 'tolist')
+                 else columns[k]) for k in columns]
+        outcols = dict((k, []) for k in set(columns).union(self.elements))
+        for i in range(nrows if columns else 1):
+            vals = dict((k, c[i]) for k, c in cols)
+            self.compute_values(vals)
+            for k in vals:
+                outcols[k].append(vals[k])
+        return outcols
+
+    def compute_strings_batch(self, columns):
+        # type: (Dict[str, Sequence[Any]]) -> Dict[str, List[str]]
+        outcols = self.compute_values_batch(columns)
+        for k in outcols:
+            try:
+                outcols[k] = self.elements[k].do_format_batch(outcols[k])
+            except ValueError as e:
+                raise_from(ValueError('Error formatting {}:'.format(k)), e)
+        return outcols
+
 
 @add_metaclass(abc.ABCMeta)
 class ElemBase:
@@ -207,11 +411,34 @@ class TemplateElem(ElemBase):
         file"""
         pass  # pragma nocover
 
+    def get_evaluator(self):
+        # type: () -> Callable[[Dict[str, Any]], Any]
+        """Method returning a callable equivalent to evaluate, which elements
+        may override to precompute a faster evaluation"""
+        return self.evaluate
+
+    def evaluate_batch(self, columns, nrows):
+        # type: (Dict[str, Sequence[Any]], int) -> Sequence[Any]
+        """Method returning values of the element for every row of the given
+        columns"""
+        evaluate = self.get_evaluator()
+        cols = [(k, columns[k]) for k in self.get_dependencies()
+                if k in columns]
+        return [evaluate(dict((k, c[i]) for k, c in cols))
+                for i in range(nrows)]
+
     def do_format(self, value):
         # type: (Any) -> str
         """Method returning formatted string when given result of evaluate"""
         return str(value)
 
+    def do_format_batch(self, values):
+        # type: (Sequence[Any]) -> List[str]
+        """Method returning formatted strings for a column of values"""
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        return [self.do_format(v) for v in values]
+
 
 class InputElem(TemplateElem):
     def get_name(self):
@@ -234,6 +461,11 @@ class InputElem(TemplateElem):
     def do_format(self, value):
         return self.fmt.format(value)
 
+    def do_format_batch(self, values):
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        return list(map(self.fmt.format, values))
+
 
 @TemplateElem.register_type('int')
 class IntElem(InputElem):
@@ -262,9 +494,14 @@ class ExprElem(TemplateElem):
 @TemplateElem.register_type('expr')
 class NExprElem(ExprElem):
     def __init__(self, name, expr, fmt='{}', **idict):
+        import sympy
         self.name = name
         self.expr = sympy.S(expr)
         self.fmt = fmt
+        self._symbols = self.expr.atoms(sympy.Symbol)
+        self._compiled = None  # type: Callable[..., Any]
+        self._vectorized = None  # type: Callable[..., Any]
+        self._args = ()  # type: Tuple[str, ...]
         if self.name in self.get_dependencies():
             raise DependencyError(
                 "Element '{}' cannot be dependent on itself".format(self.name))
@@ -279,14 +516,14 @@ class NExprElem(ExprElem):
 
     def get_dependencies(self):
         to_ret = set()
-        for k in self.expr.atoms(sympy.Symbol):
+        for k in self._symbols:
             to_ret.add(str(k))
         return to_ret
 
     def evaluate(self, values):
         var_vals = {}
         dep_missing = set()
-        for k in self.expr.atoms(sympy.Symbol):
+        for k in self._symbols:
             k_str = str(k)
             try:
                 var_vals[k] = values[k_str]
@@ -297,16 +534,124 @@ class NExprElem(ExprElem):
                 "Missing dependencies {}".format(dep_missing))
         return self.expr.subs(var_vals)
 
+    def get_evaluator(self):
+        import sympy
+        if self._compiled is None:
+            syms = sorted(self._symbols, key=str)
+            try:
+                self._compiled = sympy.lambdify(syms, self.expr,
+                                                modules='math')
+            except Exception:
+                # Expression cannot be compiled, keep symbolic evaluation
+                return self.evaluate
+            self._args = tuple(str(k) for k in syms)
+        return self.evaluate_compiled
+
+    def evaluate_compiled(self, values):
+        """Evaluate using the compiled numeric function, falling back to
+        symbolic substitution for values it cannot handle"""
+        try:
+            args = [values[k] for k in self._args]
+        except KeyError:
+            return self.evaluate(values)
+        for v in args:
+            if not isinstance(v, numbers.Number):
+                # e.g. unvalidated strings which must be sympified
+                return self.evaluate(values)
+        try:
+            return self._compiled(*args)
+        except (TypeError, ValueError, ArithmeticError, NameError):
+            return self.evaluate(values)
+
+    def evaluate_batch(self, columns, nrows):
+        import sympy
+        numpy = _get_numpy()
+        if numpy is None:
+            return TemplateElem.evaluate_batch(self, columns, nrows)
+
+        syms = sorted(self._symbols, key=str)
+        dep_missing = set(str(k) for k in syms).difference(columns)
+        if dep_missing:
+            raise DependencyError(
+                "Missing dependencies {}".format(dep_missing))
+        args = []
+        for k in syms:
+            a = numpy.asarray(columns[str(k)])
+            if a.dtype.kind not in 'biuf':
+                return TemplateElem.evaluate_batch(self, columns, nrows)
+            if a.dtype.kind != 'f':
+                # Python integers as when evaluating rows, which cannot
+                # overflow unlike fixed width integers
+                a = a.astype(object)
+            args.append(a)
+
+        if self._vectorized is None:
+            try:
+                self._vectorized = sympy.lambdify(syms, self.expr,
+                                                  modules='numpy')
+            except Exception:
+                return TemplateElem.evaluate_batch(self, columns, nrows)
+        try:
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                out = self._vectorized(*args)
+        except (TypeError, ValueError, ArithmeticError, NameError,
+                AttributeError):
+            return TemplateElem.evaluate_batch(self, columns, nrows)
+        out = numpy.asarray(out)
+        if out.dtype.kind == 'O' and all(isinstance(v, float)
+                                         for v in out.flat):
+            out = out.astype(float)
+        if out.shape != (nrows,):
+            out = numpy.broadcast_to(out, (nrows,)).copy()
+        return out
+
     def do_format(self, value):
         return self.fmt.format(value)
 
+    def do_format_batch(self, values):
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        return list(map(self.fmt.format, values))
+
+
+def _compile_format(fstr):
+    # type: (str) -> Tuple[str, Tuple[str, ...]]
+    """Convert a format string using named fields into one using positional
+    fields, returning it with the names in position order, or None for the
+    format string if it uses fields that cannot be converted"""
+    names = []  # type: List[str]
+    out = []  # type: List[str]
+    simple = True
+    for literal, field, spec, conv in string.Formatter().parse(fstr):
+        out.append(literal.replace('{', '{{').replace('}', '}}'))
+        if field is None:
+            continue
+        if (not field or field.isdigit() or '.' in field or '[' in field or
+                '{' in spec):
+            simple = False
+            for f in [field] + [t[1] for t in string.Formatter().parse(spec)]:
+                if f and f not in names:
+                    names.append(f)
+            continue
+        if field not in names:
+            names.append(field)
+        out.append('{' + str(names.index(field)))
+        if conv:
+            out.append('!' + conv)
+        if spec:
+            out.append(':' + spec)
+        out.append('}')
+    return (''.join(out) if simple else None), tuple(names)
+
 
 @TemplateElem.register_type('fmt')
 class FmtElem(ExprElem):
     def __init__(self, name, expr, **idict):
         self.name = name
         self.expr = expr
-        if self.name in self.get_dependencies():
+        self._format, self._names = _compile_format(expr)
+        self._deps = frozenset(self._names)
+        if self.name in self._deps:
             raise DependencyError(
                 "Element '{}' cannot be dependent on itself".format(self.name))
         if idict:
@@ -319,27 +664,52 @@ class FmtElem(ExprElem):
         return self.name
 
     def get_dependencies(self):
-        deps = set()
-        for t in string.Formatter().parse(self.expr):
-            if t[1]:
-                deps.add(t[1])
-        return deps
+        return set(self._deps)
+
+    def _missing(self, values):
+        # type: (Any) -> DependencyError
+        return DependencyError(
+            "Missing dependencies {}".format(
+                set(self._deps.difference(values.keys()))))
 
     def evaluate(self, values):
-        deps = self.get_dependencies()
-        if not deps.issubset(values.keys()):
-            raise DependencyError(
-                "Missing dependencies {}".format(
-                    deps.difference(values.keys())))
-        return self.expr.format(**values)
+        try:
+            args = [values[k] for k in self._names]
+        except KeyError:
+            raise self._missing(values)
+        if self._format is None:
+            return self.expr.format(**values)
+        return self._format.format(*args)
+
+    def evaluate_batch(self, columns, nrows):
+        if self._format is None:
+            return TemplateElem.evaluate_batch(self, columns, nrows)
+        try:
+            cols = [columns[k] for k in self._names]
+        except KeyError:
+            raise self._missing(columns)
+        fmt = self._format.format
+        if not cols:
+            return [fmt()]*nrows
+        cols = [c.tolist() if hasattr(c, 'tolist') else c for c in cols]
+        return [fmt(*r) for r in zip(*cols)]
+
+
+# Replacements of characters in filenames
+fn_transl = tr_func('./ ', '___')
 
 
 @TemplateElem.register_type('fname')
 class FNFmtElem(FmtElem):
     def evaluate(self, values):
-        fn_transl = tr_func('./ ', '___')
         return FmtElem.evaluate(self, values).translate(fn_transl)
 
+    def evaluate_batch(self, columns, nrows):
+        if self._format is None:
+            return TemplateElem.evaluate_batch(self, columns, nrows)
+        return [v.translate(fn_transl)
+                for v in FmtElem.evaluate_batch(self, columns, nrows)]
+
 
 class SearchElem(ElemBase):
     _elem_types = {}  # type: Dict[str, typing.Type[SearchElem]]
@@ -380,6 +750,23 @@ class SearchElem(ElemBase):
         # type (Any) -> Any
         return value
 
+    def get_pattern(self):
+        # type: () -> str
+        """Regular expression matching the keys of the element in full, or
+        None if the element has a single key"""
+        return None
+
+    def get_prefix(self, sep):
+        # type: (str) -> List[str]
+        """Sections containing every key matching the pattern"""
+        return []
+
+    def get_values(self, values):
+        # type: (List[Any]) -> Any
+        """Value of an element with a pattern given the values of the keys
+        matching it, in the order found"""
+        return [self.get_value(v) for v in values]
+
 
 @SearchElem.register_type('loc')
 class LocElem(SearchElem):
@@ -395,3 +782,71 @@ class LocElem(SearchElem):
 
     def get_value(self, value):
         return SearchElem.get_value(self, value)
+
+
+class _PatternElem(SearchElem):
+    def __init__(self, name, key, sep=None):
+        # type: (str, str, str) -> None
+        self.name = name
+        self.key = key
+        self.sep = sep
+        self._pattern = self._translate(key)
+        try:
+            re.compile(self._pattern)
+        except re.error as e:
+            raise InvalidElementError(
+                "Error constructing element '{}' of type '{}': "
+                "Invalid pattern {}: {}".format(name, self._etype, key, e))
+
+    @staticmethod
+    def _translate(key):
+        # type: (str) -> str
+        raise NotImplementedError()  # pragma nocoverage
+
+    def get_name(self):
+        return SearchElem.get_name(self)
+
+    def get_key(self):
+        return SearchElem.get_key(self)
+
+    def get_value(self, value):
+        return SearchElem.get_value(self, value)
+
+    def get_pattern(self):
+        return self._pattern
+
+    def get_values(self, values):
+        values = SearchElem.get_values(self, values)
+        if self.sep is not None:
+            return self.sep.join(values)
+        return values
+
+
+@SearchElem.register_type('glob')
+class GlobElem(_PatternElem):
+    """Values of all keys matching a shell style pattern, where ``*``
+    matches any characters including section separators"""
+
+    @staticmethod
+    def _translate(key):
+        # type: (str) -> str
+        return '(?:{})'.format(fnmatch.translate(key))
+
+    def get_prefix(self, sep):
+        # type: (str) -> List[str]
+        prefix = []
+        for name in self.key.split(sep)[:-1]:
+            if any(c in name for c in '*?['):
+                break
+            prefix.append(name)
+        return prefix
+
+
+@SearchElem.register_type('regex')
+class RegexElem(_PatternElem):
+    """Values of all keys matched in full by a regular expression"""
+
+    @staticmethod
+    def _translate(key):
+        # type: (str) -> str
+        return '(?:{})\\Z'.format(key)
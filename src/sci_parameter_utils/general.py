@@ -1,10 +1,15 @@
+import collections
+import os
 import re
 import six
 from sci_parameter_utils.parameter_file import PFileParser, KeyValuePair  # noqa: F401, E501
 try:
     import typing  # noqa: F401
-    from typing import Any, Pattern, Type  # noqa: F401
+    from typing import Any, Pattern, Set, Tuple, Type, Union  # noqa: F401
     from sci_parameter_utils.fragment import SearchElem  # noqa: F401
+    if typing.TYPE_CHECKING:
+        from sci_parameter_utils.cache import ParseCache  # noqa: F401
+        from sci_parameter_utils.profiling import Profiler  # noqa: F401
 except:
     pass
 
@@ -29,6 +34,7 @@ def get_fn_suggest(tfile, parser, repl_re=repl_re):
     # type: (typing.TextIO, Type[PFileParser], Pattern) -> str
     tfile.seek(0, 0)
     sugg_re = re.compile('FN:\s+(\S+)')
+    fn_suggest = ""
     lgen = parser.lines(tfile)
     for l in lgen:
         if l.ltype == "Comment":
@@ -43,46 +49,261 @@ class ParserError(Exception):
     pass
 
 
-def do_template(tfile, ofile, parser, values, repl_re=repl_re):
-    # type: (typing.TextIO, typing.TextIO, Type[PFileParser], Dict[str, str], Pattern) -> None # noqa
-    tfile.seek(0, 0)
-    for l in parser.lines(tfile):
-        if l.ltype == 'KeyValue':
-            if isinstance(l.value, KeyValuePair):
-                l.value.value = do_replace(l.value.value,
-                                           values)
-            else:
+class CompiledTemplate:
+    """Template parsed once into literal text and substitution slots
+
+    Key-value lines are typeset with markers in place of every ``{{{name}}}``
+    substitution so rendering a set of values only requires joining the
+    precomputed pieces.
+    """
+    _marker = u'\x00'
+
+    def __init__(self, tfile, parser, repl_re=repl_re):
+        # type: (typing.TextIO, Type[PFileParser], Pattern) -> None
+        """Initialize from a template file.
+
+        Args:
+            tfile: Template file, read from the start
+            parser (Type[PFileParser]): Parser for the template format
+            repl_re (Pattern, optional): Pattern matching substitutions
+        """
+        tfile.seek(0, 0)
+        pieces = []  # type: List[str]
+        slots = []  # type: List[Tuple[int, str]]
+        literal = []  # type: List[str]
+        for l in parser.lines(tfile):
+            if l.ltype != 'KeyValue':
+                literal.append(six.text_type(parser.typeset_line(l)))
+                continue
+            if not isinstance(l.value, KeyValuePair):
                 raise ParserError(
                     "Key-value line does not have KeyValuePair value")
-            ofile.write(six.text_type(parser.typeset_line(l)))
-        else:
-            ofile.write(six.text_type(parser.typeset_line(l)))
+
+            names = []  # type: List[str]
+
+            def mark(match):
+                names.append(match.group(1))
+                return self._marker
+            l.value.value = repl_re.sub(mark, l.value.value)
+            parts = (six.text_type(parser.typeset_line(l))
+                     .split(self._marker))
+            if len(parts) != len(names)+1:
+                raise ParserError(
+                    "Could not locate substitutions on line {}"
+                    .format(l.lnum))
+            literal.append(parts[0])
+            for n, p in zip(names, parts[1:]):
+                pieces.append(u''.join(literal))
+                slots.append((len(pieces), n))
+                pieces.append(None)
+                literal = [p]
+        pieces.append(u''.join(literal))
+
+        self.pieces = pieces
+        self.slots = slots
+        self.required = frozenset(n for _, n in slots)
+
+    def missing(self, values):
+        # type: (Dict[str, str]) -> Set[str]
+        """Return names of substitutions with no value supplied"""
+        return set(self.required.difference(values))
+
+    def render(self, values):
+        # type: (Dict[str, str]) -> str
+        """Return the template text with the given values substituted"""
+        out = list(self.pieces)
+        try:
+            for i, k in self.slots:
+                out[i] = values[k]
+        except KeyError as e:
+            raise ValueError("No element {} supplied".format(e.args[0]))
+        return u''.join(out)
+
+    def write(self, ofile, values):
+        # type: (typing.TextIO, Dict[str, str]) -> None
+        ofile.write(self.render(values))
+
+
+def do_template(tfile, ofile, parser, values, repl_re=repl_re):
+    # type: (typing.TextIO, typing.TextIO, Type[PFileParser], Dict[str, str], Pattern) -> None # noqa
+    CompiledTemplate(tfile, parser, repl_re).write(ofile, values)
 
 
 class MissingValues(Exception):
     pass
 
 
-def do_search(searchlist, ifile, parser, findall=True):
-    # type: (Dict[str, SearchElem], typing.TextIO, Type[PFileParser], bool) -> Dict[str, str] # noqa
-    valdict = {}  # type: Dict[str, str]
-    locdict = {}  # type: Dict[str, List[str]]
-    for k in searchlist:
-        lkey = searchlist[k].get_key()
-        if lkey in locdict:
-            locdict[lkey].append(k)
+# Maximum number of keys whose matching pattern elements a plan remembers
+_MATCH_MEMO_SIZE = 2**16
+
+
+def _spread_wildcard(node, wildcard, inside=False):
+    # type: (Dict[Any, Any], Dict[Any, Any], bool) -> None
+    """Add the wildcard to every section within one holding it, as such
+    sections may also contain matching keys"""
+    inside = inside or None in node
+    for child in node.values():
+        if child is wildcard:
+            continue
+        if inside:
+            child[None] = wildcard
+        _spread_wildcard(child, wildcard, inside)
+
+
+class SearchPlan:
+    """Search elements compiled for finding their values in many files
+
+    Elements are grouped by key, and the sections containing the keys are
+    arranged in a trie over the ``:`` separated components of the keys, so
+    a parser may skip sections containing none of the keys. A plan may be
+    used in place of the search elements in any number of calls to
+    :func:`do_search`.
+
+    The patterns of elements matching many keys are combined into a single
+    regular expression, so keys matching none of them are rejected with a
+    single match, and the elements matching each key are remembered.
+    Patterns containing groups, whose numbers and names would change when
+    combined, are instead matched separately against every key. The
+    trie holds ``None`` in place of a section name below the sections that
+    may contain matching keys, so any subsection there is searched.
+    """
+
+    def __init__(self, searchlist, sep=':'):
+        # type: (Dict[str, SearchElem], str) -> None
+        """Initialize from the search elements
+
+        Args:
+            searchlist (dict): Search elements by name
+            sep (str, optional): Separator of section names in keys
+        """
+        self.searchlist = searchlist
+        self.locdict = {}  # type: Dict[str, List[str]]
+        self.sections = {}  # type: Dict[str, Any]
+        self.patterns = []  # type: List[Tuple[str, Pattern]]
+        wildcard = {}  # type: Dict[Any, Any]
+        wildcard[None] = wildcard
+        for k in searchlist:
+            pattern = searchlist[k].get_pattern()
+            if pattern is not None:
+                self.patterns.append((k, re.compile(pattern)))
+                node = self.sections
+                for name in searchlist[k].get_prefix(sep):
+                    node = node.setdefault(name, {})
+                node[None] = wildcard
+                continue
+            lkey = searchlist[k].get_key()
+            if lkey in self.locdict:
+                self.locdict[lkey].append(k)
+                continue
+            self.locdict[lkey] = [k]
+            node = self.sections
+            for name in lkey.split(sep)[:-1]:
+                node = node.setdefault(name, {})
+        self.keys = frozenset(self.locdict)
+        _spread_wildcard(self.sections, wildcard)
+
+        self._grouped = frozenset(k for k, p in self.patterns if p.groups)
+        self._matcher = None  # type: Pattern
+        combined = [p.pattern for k, p in self.patterns
+                    if k not in self._grouped]
+        if combined:
+            self._matcher = re.compile('|'.join(combined))
+        self._matches = {}  # type: Dict[str, Tuple[str, ...]]
+
+    def match(self, key):
+        # type: (str) -> Tuple[str, ...]
+        """Names of the elements whose patterns match the key"""
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+        found = self._matcher is not None and bool(self._matcher.match(key))
+        if found or self._grouped:
+            names = tuple(k for k, p in self.patterns
+                          if (found or k in self._grouped) and p.match(key))
         else:
-            locdict[lkey] = [k]
+            names = ()  # type: Tuple[str, ...]
+        if len(self._matches) < _MATCH_MEMO_SIZE:
+            self._matches[key] = names
+        return names
+
+
+def do_search(searchlist, ifile, parser, findall=True, cache=None,
+              stop_early=False, profiler=None):
+    # type: (Union[Dict[str, SearchElem], SearchPlan], typing.TextIO, Type[PFileParser], bool, ParseCache, bool, Profiler) -> Dict[str, str] # noqa
+    """Find values of search elements in a parameter file
+
+    Args:
+        searchlist: Search elements by name, or a :class:`SearchPlan` of
+            them to reuse for many files
+        ifile: Parameter file to search
+        parser (Type[PFileParser]): Parser for the file format
+        findall (bool, optional): Raise :class:`MissingValues` unless every
+            element is found
+        cache (ParseCache, optional): Cache of parsed files to use
+        stop_early (bool, optional): Stop reading the file once every
+            element has a value, rather than using the last occurrence of
+            each key in the file. Files are read in full if any element
+            has a pattern.
+        profiler (Profiler, optional): Profiler counting the lines
+            examined
+
+    Returns:
+        dict: Values found by element name
+    """
+    if isinstance(searchlist, SearchPlan):
+        plan = searchlist
+    else:
+        plan = SearchPlan(searchlist)
+    searchlist = plan.searchlist
+    locdict = plan.locdict
+    match = plan.match if plan.patterns else None
+    valdict = {}  # type: Dict[str, str]
+    # Values of the keys matching each pattern, in the order first found
+    multi = collections.defaultdict(
+        collections.OrderedDict)  # type: Dict[str, Dict[str, str]]
+
+    path = getattr(ifile, 'name', None)
+    if cache is not None and path and os.path.isfile(path):
+        fvals = cache.get_values(path, parser)
+        for lkey in locdict:
+            if lkey in fvals:
+                for k in locdict[lkey]:
+                    valdict[k] = searchlist[k].get_value(fvals[lkey])
+        if match is not None:
+            for lkey in fvals:
+                for k in match(lkey):
+                    multi[k][lkey] = fvals[lkey]
+    elif not stop_early or locdict or match is not None:
+        remaining = set(locdict)
+        nlines = 0
+        lgen = parser.search_lines(ifile, plan)
+        for l in lgen:
+            nlines += 1
+            if l.ltype == "KeyValue":
+                key = l.value.key
+                if match is not None:
+                    for k in match(key):
+                        multi[k][key] = l.value.value
+                try:
+                    vlist = locdict[key]
+                except KeyError:
+                    continue
 
-    for l in parser.lines(ifile):
-        if l.ltype == "KeyValue":
-            try:
-                vlist = locdict[l.value.key]
-            except KeyError:
-                vlist = []
+                for k in vlist:
+                    valdict[k] = searchlist[k].get_value(l.value.value)
+                # Later keys may still match patterns
+                if stop_early and match is None:
+                    remaining.discard(key)
+                    if not remaining:
+                        break
+        if hasattr(lgen, 'close'):
+            lgen.close()
+        if profiler is not None:
+            profiler.count('lines', nlines)
 
-            for k in vlist:
-                valdict[k] = searchlist[k].get_value(l.value.value)
+    for k in multi:
+        valdict[k] = searchlist[k].get_values(list(multi[k].values()))
 
     if findall:
         sset = set(searchlist.keys())
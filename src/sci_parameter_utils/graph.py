@@ -0,0 +1,122 @@
+try:
+    import typing  # noqa: F401
+    from typing import Any, Collection, Iterable, List, Set  # noqa: F401
+except:
+    pass
+
+
+class DependencyError(Exception):
+    pass
+
+
+class DependencyGraph:
+    """Dependencies between named nodes in evaluation order
+
+    Nodes are ordered depth first so every node follows the nodes it depends
+    on, and assigned a level one greater than the highest level of its
+    dependencies, nodes with no dependencies having level 0. Nodes of the same
+    level do not depend on each other.
+    """
+
+    def __init__(self, deps):
+        # type: (Dict[str, Collection[str]]) -> None
+        """Initialize from the dependencies of each node
+
+        Args:
+            deps (dict): Collection of the names of the nodes each node
+                depends on
+
+        Raises:
+            DependencyError: A dependency is not a node or the dependencies
+                are cyclic
+        """
+        self.dependencies = dict(deps)  # type: Dict[str, Collection[str]]
+        self._dependents = None  # type: Dict[str, Set[str]]
+        self._sort(list(deps))
+
+    @property
+    def dependents(self):
+        # type: () -> Dict[str, Set[str]]
+        """Names of the nodes depending directly on each node"""
+        if self._dependents is None:
+            dependents = dict(
+                (k, set()) for k in self.dependencies)  # type: Dict[str, Set[str]] # noqa
+            for k in self.order:
+                for d in self.dependencies[k]:
+                    dependents[d].add(k)
+            self._dependents = dependents
+        return self._dependents
+
+    def _sort(self, roots):
+        # type: (List[str]) -> None
+        deps = self.dependencies
+        order = []  # type: List[str]
+        levels = {}  # type: Dict[str, int]
+        for root in roots:
+            if root in levels:
+                continue
+            path = [root]
+            onpath = {root: 0}
+            stack = [iter(deps[root])]
+            while stack:
+                for d in stack[-1]:
+                    if d in levels:
+                        continue
+                    if d not in deps:
+                        raise DependencyError(
+                            "Unknown dependency {}".format(d))
+                    if d in onpath:
+                        raise DependencyError(
+                            "Cyclic element dependency including {}: {}"
+                            .format(d, ' -> '.join(path[onpath[d]:]+[d])))
+                    onpath[d] = len(path)
+                    path.append(d)
+                    stack.append(iter(deps[d]))
+                    break
+                else:
+                    stack.pop()
+                    k = path.pop()
+                    del onpath[k]
+                    level = 0
+                    for d in deps[k]:
+                        if levels[d] >= level:
+                            level = levels[d] + 1
+                    levels[k] = level
+                    order.append(k)
+        self.order = order
+        self.levels = levels
+
+    def by_level(self):
+        # type: () -> List[List[str]]
+        """Return the nodes grouped by level, in evaluation order"""
+        groups = []  # type: List[List[str]]
+        for k in self.order:
+            lv = self.levels[k]
+            while len(groups) <= lv:
+                groups.append([])
+            groups[lv].append(k)
+        return groups
+
+    def downstream(self, names):
+        # type: (Iterable[str]) -> Set[str]
+        """Return the nodes given and all nodes depending on them"""
+        found = set(names)
+        stack = list(found)
+        while stack:
+            for d in self.dependents.get(stack.pop(), ()):
+                if d not in found:
+                    found.add(d)
+                    stack.append(d)
+        return found
+
+    def upstream(self, names):
+        # type: (Iterable[str]) -> Set[str]
+        """Return the nodes given and all nodes they depend on"""
+        found = set(names)
+        stack = list(found)
+        while stack:
+            for d in self.dependencies.get(stack.pop(), ()):
+                if d not in found:
+                    found.add(d)
+                    stack.append(d)
+        return found
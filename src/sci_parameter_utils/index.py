@@ -0,0 +1,290 @@
+import os
+import re
+import sqlite3
+from sci_parameter_utils.cache import flatten_lines
+from sci_parameter_utils.engine import get_extn
+from sci_parameter_utils.parameter_file import PFileParser, ParserNotFound
+try:
+    import typing  # noqa: F401
+    from typing import Any, Dict, Iterable, List, Set, Tuple, Type  # noqa: F401,E501
+except:
+    pass
+
+# Increment when the schema changes, indexes of other versions are rebuilt
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    parser TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vals (
+    file INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    num REAL,
+    PRIMARY KEY (file, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vals_num ON vals (key, num);
+CREATE INDEX IF NOT EXISTS vals_value ON vals (key, value);
+"""
+
+_TABLES = ['vals', 'keys', 'files', 'meta']
+
+# SQL of the comparison operators of filters
+_OPERATORS = {
+    '=': '=',
+    '==': '=',
+    '!=': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+    '~': 'GLOB',
+}
+
+_filter_re = re.compile(r'\s*(.+?)\s*(==|!=|<=|>=|=|<|>|~)\s*(.*?)\s*$')
+
+
+class ParameterIndexError(Exception):
+    pass
+
+
+def _number(value):
+    # type: (str) -> float
+    """Numeric form of a value, or None if it is not a number"""
+    try:
+        num = float(value)
+    except ValueError:
+        return None
+    if num != num:
+        return None
+    return num
+
+
+def parse_filter(text):
+    # type: (str) -> Tuple[str, str, str]
+    """Split a filter such as ``Mesh:Refinement >= 6`` into its key,
+    operator and value"""
+    match = _filter_re.match(text)
+    if match is None:
+        raise ParameterIndexError("Invalid filter {}".format(text))
+    return match.group(1), match.group(2), match.group(3)
+
+
+def find_files(paths):
+    # type: (Iterable[str]) -> Iterable[Tuple[str, Type[PFileParser]]]
+    """Files and their parsers, searching directories for files with the
+    extension of a known parser and giving each file once"""
+    seen = set()  # type: Set[str]
+    for path in paths:
+        if not os.path.isdir(path):
+            found = [(path, PFileParser.parser_by_extn(get_extn(path)))]
+        else:
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fn in sorted(files):
+                    try:
+                        parser = PFileParser.parser_by_extn(get_extn(fn))
+                    except ParserNotFound:
+                        continue
+                    found.append((os.path.join(root, fn), parser))
+        for fn, parser in found:
+            apath = os.path.abspath(fn)
+            if apath not in seen:
+                seen.add(apath)
+                yield fn, parser
+
+
+class ParameterIndex:
+    """SQLite database of the key-value pairs of many parameter files
+
+    Each file is stored by absolute path with its size and modification
+    time, so only files which have changed are parsed again when updating
+    the index. Values are stored as written in the file together with their
+    numeric value if they are numbers, and are indexed by key so files may be
+    selected by their values without reading them.
+    """
+
+    def __init__(self, path):
+        # type: (str) -> None
+        """Open the index, creating it if it does not exist
+
+        Args:
+            path (str): Path of the database file
+        """
+        self.path = path
+        self._key_ids = {}  # type: Dict[str, int]
+        try:
+            self.conn = sqlite3.connect(path)
+            self._setup()
+        except sqlite3.Error as e:
+            raise ParameterIndexError(
+                "Could not open index {}: {}".format(path, e))
+
+    def _setup(self):
+        # type: () -> None
+        conn = self.conn
+        try:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE name = 'version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is not None and row[0] == str(INDEX_VERSION):
+            return
+        if row is not None:
+            for t in _TABLES:
+                conn.execute('DROP TABLE IF EXISTS {}'.format(t))
+        conn.executescript(_SCHEMA)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                     (str(INDEX_VERSION),))
+        conn.commit()
+
+    def _key_id(self, key):
+        # type: (str) -> int
+        try:
+            return self._key_ids[key]
+        except KeyError:
+            pass
+        row = self.conn.execute(
+            'SELECT id FROM keys WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            kid = self.conn.execute(
+                'INSERT INTO keys (key) VALUES (?)', (key,)).lastrowid
+        else:
+            kid = row[0]
+        self._key_ids[key] = kid
+        return kid
+
+    def update(self, path, parser):
+        # type: (str, Type[PFileParser]) -> bool
+        """Index the file unless it is unchanged since it was last indexed
+
+        Changes are not saved until :meth:`commit` is called.
+
+        Args:
+            path (str): Path of the parameter file
+            parser (Type[PFileParser]): Parser for the file format
+
+        Returns:
+            bool: Whether the file was parsed
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        mtime = getattr(st, 'st_mtime_ns', int(st.st_mtime*1e9))
+        pname = '{}.{}'.format(parser.__module__, parser.__name__)
+        row = self.conn.execute(
+            'SELECT id, size, mtime, parser FROM files WHERE path = ?',
+            (path,)).fetchone()
+        if row is not None and tuple(row[1:]) == (st.st_size, mtime, pname):
+            return False
+
+        with open(path, 'r') as f:
+            values = flatten_lines(parser.lines(f))
+        if row is None:
+            fid = self.conn.execute(
+                'INSERT INTO files (path, size, mtime, parser) '
+                'VALUES (?, ?, ?, ?)',
+                (path, st.st_size, mtime, pname)).lastrowid
+        else:
+            fid = row[0]
+            self.conn.execute(
+                'UPDATE files SET size = ?, mtime = ?, parser = ? '
+                'WHERE id = ?', (st.st_size, mtime, pname, fid))
+            self.conn.execute('DELETE FROM vals WHERE file = ?', (fid,))
+        self.conn.executemany(
+            'INSERT INTO vals VALUES (?, ?, ?, ?)',
+            [(fid, self._key_id(k), v, _number(v))
+             for k, v in values.items()])
+        return True
+
+    def remove_missing(self):
+        # type: () -> List[str]
+        """Remove files which no longer exist from the index, returning
+        their paths"""
+        gone = [(fid, path) for fid, path in self.conn.execute(
+                    'SELECT id, path FROM files ORDER BY path')
+                if not os.path.exists(path)]
+        self.conn.executemany('DELETE FROM vals WHERE file = ?',
+                              [(fid,) for fid, _ in gone])
+        self.conn.executemany('DELETE FROM files WHERE id = ?',
+                              [(fid,) for fid, _ in gone])
+        return [path for _, path in gone]
+
+    def query(self, filters, select=()):
+        # type: (Iterable[Tuple[str, str, str]], Iterable[str]) -> List[Tuple[str, List[str]]] # noqa
+        """Find files by the values of their keys
+
+        Values of filters which are numbers are compared with the numeric
+        values of keys, so ``1e3`` equals ``1000``, and other values are
+        compared as strings. The ``~`` operator matches the values against a
+        shell style pattern.
+
+        Args:
+            filters: Key, operator and value of conditions which must all
+                hold, such as those returned by :func:`parse_filter`
+            select: Keys whose values to return
+
+        Returns:
+            list: Path of each file in order with the values of the
+            selected keys, ``None`` for keys not in the file
+        """
+        conds = []  # type: List[str]
+        cargs = []  # type: List[Any]
+        for key, op, value in filters:
+            try:
+                sqlop = _OPERATORS[op]
+            except KeyError:
+                raise ParameterIndexError("Unknown operator {}".format(op))
+            num = _number(value) if op != '~' else None
+            conds.append(
+                'SELECT file FROM vals WHERE '
+                'key = (SELECT id FROM keys WHERE key = ?) AND {} {} ?'
+                .format('value' if num is None else 'num', sqlop))
+            cargs.extend([key, value if num is None else num])
+
+        columns = ['f.path']
+        joins = []  # type: List[str]
+        jargs = []  # type: List[Any]
+        for i, key in enumerate(select):
+            columns.append('s{}.value'.format(i))
+            joins.append('LEFT JOIN vals s{0} ON s{0}.file = f.id AND '
+                         's{0}.key = (SELECT id FROM keys WHERE key = ?)'
+                         .format(i))
+            jargs.append(key)
+
+        sql = 'SELECT {} FROM files f {}'.format(', '.join(columns),
+                                                 ' '.join(joins))
+        if conds:
+            sql += ' WHERE f.id IN ({})'.format(' INTERSECT '.join(conds))
+        sql += ' ORDER BY f.path'
+        try:
+            return [(row[0], list(row[1:]))
+                    for row in self.conn.execute(sql, jargs + cargs)]
+        except sqlite3.Error as e:
+            raise ParameterIndexError("Error querying index: {}".format(e))
+
+    def commit(self):
+        # type: () -> None
+        self.conn.commit()
+
+    def rollback(self):
+        # type: () -> None
+        self.conn.rollback()
+        self._key_ids = {}
+
+    def close(self):
+        # type: () -> None
+        self.conn.close()
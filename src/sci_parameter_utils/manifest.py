@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import tempfile
+try:
+    import typing  # noqa: F401
+    from typing import Any, Dict, List, Set  # noqa: F401
+except:
+    pass
+
+# Increment when the digests or file format change
+MANIFEST_VERSION = 1
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _canonical(value):
+    # type: (Any) -> str
+    return json.dumps(value, sort_keys=True, default=repr)
+
+
+class Manifest:
+    """Record of the inputs each generated file was rendered from
+
+    Each file is recorded with a digest of the template, the element
+    definitions and the validated input values of its row, so a file need
+    only be rendered again if the digest changes or the file is missing.
+    """
+
+    def __init__(self, path, *sources):
+        # type: (str, *Any) -> None
+        """Initialize, reading any existing manifest
+
+        Args:
+            path (str): Path of the manifest file
+            *sources: Values all generated files depend on, such as the
+                template text and element definitions
+        """
+        self.path = path
+        self.base = hashlib.sha256(
+            _canonical(list(sources)).encode('utf-8')).hexdigest()
+        self.old = {}  # type: Dict[str, str]
+        self.new = {}  # type: Dict[str, str]
+        self.skipped = set()  # type: Set[str]
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                raise ManifestError(
+                    "Could not read manifest {}: {}".format(path, e))
+            if data.get('version') == MANIFEST_VERSION:
+                self.old = data['files']
+
+    def row_digest(self, values):
+        # type: (Dict[str, Any]) -> str
+        """Digest of the files generated from the given input values"""
+        return hashlib.sha256(
+            (self.base + _canonical(values)).encode('utf-8')).hexdigest()
+
+    def unchanged(self, fn, digest):
+        # type: (str, str) -> bool
+        """Whether the file exists and was generated with the same digest"""
+        return self.old.get(fn) == digest and os.path.exists(fn)
+
+    def record(self, fn, digest, skipped=False):
+        # type: (str, str, bool) -> None
+        """Record a file generated in this run, noting if it was skipped as
+        unchanged"""
+        self.new[fn] = digest
+        if skipped:
+            self.skipped.add(fn)
+        else:
+            self.skipped.discard(fn)
+
+    def orphans(self):
+        # type: () -> List[str]
+        """Files recorded previously but not generated in this run"""
+        return sorted(fn for fn in self.old if fn not in self.new)
+
+    def prune(self):
+        # type: () -> List[str]
+        """Delete the files not generated in this run and forget them,
+        returning the names of the files deleted"""
+        removed = []
+        for fn in self.orphans():
+            if os.path.exists(fn):
+                os.remove(fn)
+                removed.append(fn)
+            del self.old[fn]
+        return removed
+
+    def save(self):
+        # type: () -> None
+        """Write the manifest, keeping previous records of files not
+        generated in this run until they are pruned"""
+        files = dict(self.old)
+        files.update(self.new)
+        dirn = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=dirn, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'files': files}, f,
+                          indent=1, sort_keys=True)
+            os.rename(tmp, self.path)
+        except Exception:
+            os.remove(tmp)
+            raise
@@ -189,6 +189,27 @@ class PFileParser:
         """
         raise NotImplementedError()  # pragma nocoverage
 
+    @classmethod
+    def search_lines(cls, fobj, plan):
+        # type: (Any, Any) -> Iterable[PFileLine]
+        """Generator returning the lines of the file needed by a search.
+
+        Parsers may skip parts of the file containing none of the keys of
+        the plan, such as sections not in its trie of sections, and omit
+        lines other than key-value lines with keys of the plan. Errors in
+        skipped parts need not be detected. By default all lines are
+        returned.
+
+        Args:
+            fobj (str): File to read from.
+            plan (:py:class:`~sci_parameter_utils.general.SearchPlan`):
+                Plan of the search
+
+        Yields:
+            :py:class:`~.PFileLine`: The next line needed from the file.
+        """
+        return cls.lines(fobj)
+
     @staticmethod
     def typeset_line(line):
         # type: (PFileLine) -> str
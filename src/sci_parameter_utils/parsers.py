@@ -1,6 +1,87 @@
 import re
 from sci_parameter_utils.parameter_file import (
-    PFileParser, PFileLine)
+    PFileParser, PFileLine, KeyValuePair)
+try:
+    import typing  # noqa: F401
+    from typing import Any, Iterable, List  # noqa: F401
+except:
+    pass
+
+
+# Size of blocks read from parameter files
+_PRM_BLOCK_SIZE = 2**20
+
+
+def _prm_command(cline, lnum, position, comment=""):
+    # type: (str, int, List[str], str) -> PFileLine
+    if not cline:
+        return PFileLine(None, None, lnum=lnum)
+
+    try:
+        command, remainder = cline.strip().split(' ', 1)
+        command = command.strip()
+        remainder = remainder.strip()
+    except ValueError:
+        command, remainder = cline.strip(), None
+        command = command.strip()
+
+    try:
+        if(command == 'subsection'):
+            position.append(remainder)
+            return PFileLine("Control",
+                             command+' '+remainder,
+                             comment=comment,
+                             lnum=lnum,
+                             level=len(position)-1)
+        elif(command == 'end'):
+            if(len(position) > 0):
+                position.pop()
+            else:
+                raise ValueError()
+            if remainder:
+                raise ValueError()
+            return PFileLine("Control",
+                             command,
+                             comment=comment,
+                             lnum=lnum,
+                             level=len(position))
+        elif(command == 'set'):
+            key, value = remainder.split('=', 1)
+            return PFileLine.keyvalueline(
+                ':'.join(position+[key.strip()]),
+                value.strip(),
+                comment=comment,
+                lnum=lnum,
+                level=len(position))
+        else:
+            raise ValueError()
+    except ValueError:
+        errstr = "Line {}: Bad command {}".format(lnum,
+                                                  command)
+        if remainder:
+            errstr += " with arg {}".format(remainder)
+        raise ValueError(errstr)
+
+
+def _read_lines(fobj):
+    # type: (Any) -> Iterable[str]
+    """Lines of the file without line endings, read in large blocks"""
+    read = getattr(fobj, 'read', None)
+    if read is None:
+        # Each item is a line, which may lack its line ending
+        for line in fobj:
+            if line.endswith('\n'):
+                line = line[:-2] if line.endswith('\r\n') else line[:-1]
+            yield line
+        return
+    carry = ''
+    for block in iter(lambda: read(_PRM_BLOCK_SIZE), ''):
+        plines = (carry + block).split('\n')
+        carry = plines.pop()
+        for line in plines:
+            yield line
+    if carry:
+        yield carry
 
 
 @PFileParser.register_type("dealIIPRM", "prm")
@@ -9,61 +90,33 @@ class PRMParser(PFileParser):
 
     @staticmethod
     def lines(fobj):
-        def parse_command(cline, lnum, position, comment=""):
-            # type: (str, int, List[str], str) -> PFileLine
-            if not parse_line:
-                return PFileLine(None, None, lnum=lnum)
-
-            try:
-                command, remainder = cline.strip().split(' ', 1)
-                command = command.strip()
-                remainder = remainder.strip()
-            except ValueError:
-                command, remainder = cline.strip(), None
-                command = command.strip()
-
-            try:
-                if(command == 'subsection'):
-                    position.append(remainder)
-                    return PFileLine("Control",
-                                     command+' '+remainder,
-                                     comment=comment,
-                                     lnum=lnum,
-                                     level=len(position)-1)
-                elif(command == 'end'):
-                    if(len(position) > 0):
-                        position.pop()
-                    else:
-                        raise ValueError()
-                    if remainder:
-                        raise ValueError()
-                    return PFileLine("Control",
-                                     command,
-                                     comment=comment,
-                                     lnum=lnum,
-                                     level=len(position))
-                elif(command == 'set'):
-                    key, value = remainder.split('=', 1)
-                    return PFileLine.keyvalueline(
-                        ':'.join(position+[key.strip()]),
-                        value.strip(),
-                        comment=comment,
-                        lnum=lnum,
-                        level=len(position))
-                else:
-                    raise ValueError()
-            except ValueError:
-                errstr = "Line {}: Bad command {}".format(linenum,
-                                                          command)
-                if remainder:
-                    errstr += " with arg {}".format(remainder)
-                raise ValueError(errstr)
-
-        position = []
-        parse_line = ""
+        """Parse the file, handling single line set commands directly and
+        passing other lines to the general command parsing"""
+        position = []  # type: List[str]
+        prefix = ''
+        parts = []  # type: List[str]
         linenum = 0
-        for line in fobj:
+        for line in _read_lines(fobj):
             linenum += 1
+            if not parts and '\\' not in line:
+                i = line.find('#')
+                if i < 0:
+                    body = line.strip()
+                    comment = ""
+                else:
+                    body = line[:i].strip()
+                    comment = line[i+1:].strip()
+                if body[:4] == 'set ':
+                    i = body.find('=', 4)
+                    if i > 0:
+                        yield PFileLine("KeyValue",
+                                        KeyValuePair(
+                                            prefix+body[4:i].strip(),
+                                            body[i+1:].strip()),
+                                        comment,
+                                        len(position),
+                                        linenum)
+                        continue
 
             # Strip comments
             comment = ""
@@ -71,31 +124,126 @@ class PRMParser(PFileParser):
                 line, comment = line.split('#', 1)
                 comment = comment.strip()
                 if not line.strip():
-                    yield PFileLine.commentline(
-                        comment,
-                        lnum=linenum)
+                    yield PFileLine.commentline(comment, lnum=linenum)
                     continue
 
             line = line.strip()
 
             if(line[-1:] == '\\'):
                 if (comment):
-                    yield PFileLine.commentline(
-                        comment,
-                        lnum=linenum)
-                parse_line += line[:-1].strip()+' '
+                    yield PFileLine.commentline(comment, lnum=linenum)
+                parts.append(line[:-1].strip()+' ')
                 continue
 
-            parse_line += line
-            parse_line = parse_line.strip()
+            parts.append(line)
+            parse_line = ''.join(parts).strip()
+            parts = []
+
+            yield _prm_command(parse_line, linenum, position, comment)
+            prefix = ':'.join(position) + ':' if position else ''
+
+        if parts:
+            yield _prm_command(''.join(parts), linenum, position)
 
-            yield parse_command(parse_line, linenum, position, comment)
+        if len(position) > 0:
+            raise ValueError("Did not exit subsection {}".format(
+                ':'.join(position)))
 
-            parse_line = ""
+    @staticmethod
+    def search_lines(fobj, plan):
+        """Parse the file for a search, returning only key-value lines with
+        keys of the plan or matching its patterns and skipping subsections
+        not in its trie of sections"""
+        keys = plan.keys
+        match = plan.match if plan.patterns else None
+        nodes = [plan.sections]
+        position = []  # type: List[str]
+        prefix = ''
+        parts = []  # type: List[str]
+        # Depth within a skipped subsection and its name
+        skip = 0
+        skipped = ''
+        linenum = 0
+        for line in _read_lines(fobj):
+            linenum += 1
+            if not parts and '\\' not in line:
+                i = line.find('#')
+                body = (line if i < 0 else line[:i]).strip()
+                if body[:4] == 'set ':
+                    if skip:
+                        continue
+                    j = body.find('=', 4)
+                    if j > 0:
+                        key = prefix+body[4:j].strip()
+                        if key in keys or (match is not None and
+                                           match(key)):
+                            yield PFileLine("KeyValue",
+                                            KeyValuePair(
+                                                key, body[j+1:].strip()),
+                                            line[i+1:].strip() if i >= 0
+                                            else "",
+                                            len(position),
+                                            linenum)
+                        continue
+
+            # Strip comments
+            comment = ""
+            if '#' in line:
+                line, comment = line.split('#', 1)
+                comment = comment.strip()
+                if not line.strip():
+                    continue
+
+            line = line.strip()
+
+            if(line[-1:] == '\\'):
+                parts.append(line[:-1].strip()+' ')
+                continue
+
+            parts.append(line)
+            parse_line = ''.join(parts).strip()
+            parts = []
+
+            if skip:
+                command = parse_line.split(' ', 1)[0]
+                if command == 'subsection':
+                    skip += 1
+                elif command == 'end':
+                    skip -= 1
+                continue
+
+            pline = _prm_command(parse_line, linenum, position, comment)
+            if pline.ltype == "KeyValue":
+                key = pline.value.key
+                if key in keys or (match is not None and match(key)):
+                    yield pline
+            elif len(position) >= len(nodes):
+                node = nodes[-1].get(position[-1])
+                if node is None:
+                    node = nodes[-1].get(None)
+                if node is None:
+                    skipped = position.pop()
+                    skip = 1
+                else:
+                    nodes.append(node)
+            elif len(position) < len(nodes) - 1:
+                nodes.pop()
+            prefix = ':'.join(position) + ':' if position else ''
 
-        if parse_line:
-            yield parse_command(parse_line, linenum, position)
+        if parts:
+            parse_line = ''.join(parts)
+            if skip:
+                if parse_line.strip().split(' ', 1)[0] == 'end':
+                    skip -= 1
+            else:
+                pline = _prm_command(parse_line, linenum, position)
+                if pline.ltype == "KeyValue" and (
+                        pline.value.key in keys or
+                        (match is not None and match(pline.value.key))):
+                    yield pline
 
+        if skip:
+            position.append(skipped)
         if len(position) > 0:
             raise ValueError("Did not exit subsection {}".format(
                 ':'.join(position)))
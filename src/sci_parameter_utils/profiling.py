@@ -0,0 +1,114 @@
+import collections
+import contextlib
+import json
+import timeit
+try:
+    import typing  # noqa: F401
+    from typing import Any, Iterable, Iterator  # noqa: F401
+except:
+    pass
+
+
+class Profiler:
+    """Record of wall time spent in named stages and counts of items
+    processed
+
+    Stages may be entered any number of times, the time and number of calls
+    being accumulated::
+
+        prof = Profiler()
+        with prof.stage('evaluation'):
+            eset.compute_strings(ivals)
+        prof.count('rows')
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._start = timeit.default_timer()
+        self.stages = collections.OrderedDict()  # type: Dict[str, List[Any]] # noqa
+        self.counts = collections.OrderedDict()  # type: Dict[str, int]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # type: (str) -> Iterator[None]
+        """Context manager accumulating the time spent within it"""
+        t0 = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add_time(name, timeit.default_timer() - t0)
+
+    def add_time(self, name, seconds, calls=1):
+        # type: (str, float, int) -> None
+        try:
+            rec = self.stages[name]
+        except KeyError:
+            rec = self.stages[name] = [0.0, 0]
+        rec[0] += seconds
+        rec[1] += calls
+
+    def iterate(self, name, items):
+        # type: (str, Iterable[Any]) -> Iterator[Any]
+        """Yield from items, recording the time taken to produce each one
+        as the stage"""
+        it = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, n=1):
+        # type: (str, int) -> None
+        """Add to the count of items"""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self):
+        # type: () -> Dict[str, Any]
+        """Return the total time, stage times and counts"""
+        stages = collections.OrderedDict()  # type: Dict[str, Dict[str, Any]] # noqa
+        for k in self.stages:
+            seconds, calls = self.stages[k]
+            stages[k] = collections.OrderedDict(
+                [('seconds', seconds), ('calls', calls)])
+        return collections.OrderedDict([
+            ('total_seconds', timeit.default_timer() - self._start),
+            ('stages', stages),
+            ('counts', collections.OrderedDict(self.counts))])
+
+    def dump(self, fobj):
+        # type: (typing.TextIO) -> None
+        """Write the report to a file as JSON"""
+        json.dump(self.report(), fobj, indent=2)
+        fobj.write('\n')
+
+
+class _NullStage:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+class NullProfiler(Profiler):
+    """Profiler recording nothing, used when profiling is disabled"""
+    _null_stage = _NullStage()
+
+    def stage(self, name):
+        # type: (str) -> Any
+        return self._null_stage
+
+    def add_time(self, name, seconds, calls=1):
+        # type: (str, float, int) -> None
+        pass
+
+    def iterate(self, name, items):
+        # type: (str, Iterable[Any]) -> Iterator[Any]
+        return iter(items)
+
+    def count(self, name, n=1):
+        # type: (str, int) -> None
+        pass
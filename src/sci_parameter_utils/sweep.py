@@ -0,0 +1,310 @@
+import itertools
+import random
+try:
+    import typing  # noqa: F401
+    from typing import Any, Callable, Iterable, Iterator, Type  # noqa: F401
+except:
+    pass
+
+
+class InvalidSweepError(Exception):
+    pass
+
+
+def sweep_from_dict(idict):
+    # type: (Dict[str, Any]) -> SweepDesign
+    """Construct a sweep from its specification
+
+    Args:
+        idict (dict): Specification with the design type in ``design``, the
+            per input specifications in ``inputs`` and any additional
+            arguments of the design
+
+    Returns:
+        :class:`SweepDesign`: Design generating rows of input values
+    """
+    idict = dict(idict)
+    try:
+        tstr = idict.pop('design')
+    except KeyError:
+        raise InvalidSweepError("No design type for sweep")
+    try:
+        adict = idict.pop('inputs')
+    except KeyError:
+        raise InvalidSweepError("No inputs for sweep")
+    axes = []
+    for k in adict:
+        spec = adict[k]
+        if isinstance(spec, list):
+            spec = {'values': spec}
+        try:
+            axes.append(Axis(k, **spec))
+        except TypeError:
+            raise InvalidSweepError(
+                "Bad specification for input '{}': {}".format(k, spec))
+    return SweepDesign.design_by_type(tstr, axes, idict)
+
+
+def shard(rows, index, count):
+    # type: (Iterable[Dict[str, Any]], int, int) -> Iterator[Dict[str, Any]]
+    """Select every count-th row starting at index"""
+    if not 0 <= index < count:
+        raise InvalidSweepError(
+            "Shard {} not in range for {} shards".format(index, count))
+    return itertools.islice(rows, index, None, count)
+
+
+class Axis:
+    """Range of values for a single input
+
+    Values are given either explicitly by ``values``, as ``num`` evenly
+    spaced values from ``start`` to ``stop``, or for sampled designs as a
+    uniform range from ``low`` to ``high``.
+    """
+
+    def __init__(self, name, values=None, start=None, stop=None, num=None,
+                 low=None, high=None):
+        # type: (str, List[Any], float, float, int, float, float) -> None
+        self.name = name
+        self.values = values
+        if values is None and num is not None:
+            if start is None or stop is None:
+                raise InvalidSweepError(
+                    "Input '{}' needs start and stop with num".format(name))
+            num = int(num)
+            if num == 1:
+                self.values = [start]
+            else:
+                step = (stop - start)/float(num - 1)
+                self.values = [start + i*step for i in range(num - 1)]
+                self.values.append(stop)
+        if low is None and high is None and self.values is None:
+            raise InvalidSweepError(
+                "No values or range for input '{}'".format(name))
+        if (low is None) != (high is None):
+            raise InvalidSweepError(
+                "Input '{}' needs both low and high".format(name))
+        self.low = low
+        self.high = high
+
+    def points(self):
+        # type: () -> List[Any]
+        if self.values is None:
+            raise InvalidSweepError(
+                "Input '{}' has no discrete values".format(self.name))
+        return self.values
+
+    def sample(self, u):
+        # type: (float) -> Any
+        """Value corresponding to a position in the unit interval"""
+        if self.low is not None:
+            return self.low + u*(self.high - self.low)
+        n = len(self.values)
+        return self.values[min(int(u*n), n - 1)]
+
+
+class SweepDesign:
+    _design_types = {}  # type: Dict[str, typing.Type[SweepDesign]]
+
+    def __init__(self, axes, **idict):
+        # type: (List[Axis], **Any) -> None
+        self.axes = axes
+        if idict:
+            raise InvalidSweepError(
+                ("Error constructing sweep of type '{}': "
+                 "Unknown arguments {}")
+                .format(self._dtype, list(idict.keys())))
+
+    @staticmethod
+    def register_type(tstr):
+        # type: (str) -> Callable[[typing.Type[SweepDesign]], typing.Type[SweepDesign]] # noqa
+        def internal_dec(cls):
+            if not issubclass(cls, SweepDesign):
+                raise InvalidSweepError("Not subclass of sweep design")
+            SweepDesign._design_types[tstr] = cls
+            cls._dtype = tstr
+            return cls
+        return internal_dec
+
+    @staticmethod
+    def design_by_type(tstr, axes, args):
+        # type: (str, List[Axis], Dict[str, Any]) -> SweepDesign
+        if tstr not in SweepDesign._design_types:
+            raise InvalidSweepError("Unknown design '{}'".format(tstr))
+        return SweepDesign._design_types[tstr](axes, **args)
+
+    def names(self):
+        # type: () -> List[str]
+        return [a.name for a in self.axes]
+
+    def __len__(self):
+        # type: () -> int
+        """Number of rows generated"""
+        raise NotImplementedError()  # pragma nocoverage
+
+    def rows(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        """Generator returning rows of input values"""
+        raise NotImplementedError()  # pragma nocoverage
+
+
+@SweepDesign.register_type('grid')
+class GridDesign(SweepDesign):
+    """Full factorial design, the last input varying fastest"""
+
+    def __len__(self):
+        n = 1
+        for a in self.axes:
+            n *= len(a.points())
+        return n
+
+    def rows(self):
+        names = self.names()
+        for vals in itertools.product(*[a.points() for a in self.axes]):
+            yield dict(zip(names, vals))
+
+
+@SweepDesign.register_type('zip')
+class ZipDesign(SweepDesign):
+    """Inputs varied together, all requiring the same number of values"""
+
+    def __init__(self, axes, **idict):
+        SweepDesign.__init__(self, axes, **idict)
+        lens = set(len(a.points()) for a in axes)
+        if len(lens) > 1:
+            raise InvalidSweepError(
+                "Inputs of zip design have differing numbers of values")
+
+    def __len__(self):
+        if not self.axes:
+            return 0
+        return len(self.axes[0].points())
+
+    def rows(self):
+        names = self.names()
+        for vals in zip(*[a.points() for a in self.axes]):
+            yield dict(zip(names, vals))
+
+
+class SampledDesign(SweepDesign):
+    """Design choosing ``samples`` points in the unit hypercube"""
+
+    def __init__(self, axes, samples, seed=None, **idict):
+        SweepDesign.__init__(self, axes, **idict)
+        self.samples = int(samples)
+        self.seed = seed
+
+    def __len__(self):
+        return self.samples
+
+    def unit_points(self):
+        # type: () -> Iterator[List[float]]
+        raise NotImplementedError()  # pragma nocoverage
+
+    def rows(self):
+        names = self.names()
+        for u in self.unit_points():
+            yield dict((n, a.sample(v))
+                       for n, a, v in zip(names, self.axes, u))
+
+
+@SweepDesign.register_type('random')
+class RandomDesign(SampledDesign):
+    """Independent uniform samples"""
+
+    def unit_points(self):
+        rng = random.Random(self.seed)
+        d = len(self.axes)
+        for _ in range(self.samples):
+            yield [rng.random() for _ in range(d)]
+
+
+@SweepDesign.register_type('lhs')
+class LatinHypercubeDesign(SampledDesign):
+    """Latin hypercube samples, each input having one sample per stratum
+
+    The stratum permutations require storage proportional to the number of
+    samples for each input.
+    """
+
+    def unit_points(self):
+        rng = random.Random(self.seed)
+        n = self.samples
+        perms = []
+        for _ in self.axes:
+            p = list(range(n))
+            rng.shuffle(p)
+            perms.append(p)
+        for i in range(n):
+            yield [(p[i] + rng.random())/n for p in perms]
+
+
+# Primitive polynomial degree, coefficients and initial direction numbers
+# for dimensions 2 and up, from Joe and Kuo (new-joe-kuo-6.21201)
+_sobol_params = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+]
+
+_sobol_bits = 32
+
+
+def _sobol_directions(dim):
+    # type: (int) -> List[int]
+    bits = _sobol_bits
+    if dim == 0:
+        return [1 << (bits - 1 - i) for i in range(bits)]
+    s, a, m = _sobol_params[dim - 1]
+    v = [m[i] << (bits - 1 - i) for i in range(s)]
+    for i in range(s, bits):
+        vi = v[i - s] ^ (v[i - s] >> s)
+        for k in range(1, s):
+            if (a >> (s - 1 - k)) & 1:
+                vi ^= v[i - k]
+        v.append(vi)
+    return v
+
+
+@SweepDesign.register_type('sobol')
+class SobolDesign(SampledDesign):
+    """Unscrambled Sobol sequence starting from the origin, with ``skip``
+    initial points omitted"""
+
+    def __init__(self, axes, samples, skip=0, **idict):
+        SampledDesign.__init__(self, axes, samples, **idict)
+        if self.seed is not None:
+            raise InvalidSweepError("Sobol design does not use a seed")
+        if len(axes) > len(_sobol_params) + 1:
+            raise InvalidSweepError(
+                "Sobol design supports at most {} inputs".format(
+                    len(_sobol_params) + 1))
+        self.skip = int(skip)
+        if self.samples + self.skip > 2**_sobol_bits:
+            raise InvalidSweepError("Too many Sobol samples requested")
+
+    def unit_points(self):
+        dirs = [_sobol_directions(i) for i in range(len(self.axes))]
+        scale = float(2**_sobol_bits)
+        x = [0]*len(dirs)
+        for n in range(self.skip + self.samples):
+            if n > 0:
+                # Gray code ordering changes the lowest zero bit of n-1
+                c = 0
+                while (n - 1) >> c & 1:
+                    c += 1
+                x = [xi ^ v[c] for xi, v in zip(x, dirs)]
+            if n >= self.skip:
+                yield [xi/scale for xi in x]
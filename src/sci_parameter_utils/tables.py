@@ -0,0 +1,136 @@
+import collections
+import csv
+import io
+import json
+import zipfile
+try:
+    import typing  # noqa: F401
+    from typing import Any, Dict, List  # noqa: F401
+except:
+    pass
+
+# Name of the column holding the name of the input file of each row
+FILE_COLUMN = 'file'
+
+
+class TableError(Exception):
+    pass
+
+
+class TableWriter:
+    """Writer of a table with one row of printed values per input file
+
+    Rows are given as dictionaries containing every column.
+    """
+
+    def __init__(self, fobj, columns):
+        # type: (typing.IO, List[str]) -> None
+        self.fobj = fobj
+        self.columns = list(columns)
+
+    def write_row(self, row):
+        # type: (Dict[str, str]) -> None
+        raise NotImplementedError()
+
+    def close(self):
+        # type: () -> None
+        pass
+
+
+class CSVTableWriter(TableWriter):
+    """Writes rows as CSV with a header line as they are given"""
+
+    def __init__(self, fobj, columns):
+        # type: (typing.TextIO, List[str]) -> None
+        TableWriter.__init__(self, fobj, columns)
+        self._writer = csv.writer(fobj, lineterminator='\n')
+        self._writer.writerow(self.columns)
+
+    def write_row(self, row):
+        # type: (Dict[str, str]) -> None
+        self._writer.writerow([row[k] for k in self.columns])
+
+
+class JSONLinesTableWriter(TableWriter):
+    """Writes each row as a JSON object on a line as they are given"""
+
+    def write_row(self, row):
+        # type: (Dict[str, str]) -> None
+        self.fobj.write(json.dumps(collections.OrderedDict(
+            (k, row[k]) for k in self.columns)))
+        self.fobj.write('\n')
+
+
+class NPZTableWriter(TableWriter):
+    """Collects rows and writes each column as an array of a NumPy ``.npz``
+    file on closing
+
+    Columns whose values are all integers or all numbers are stored as
+    ``int64`` or ``float64`` arrays, other columns as string arrays.
+    """
+
+    def __init__(self, fobj, columns):
+        # type: (typing.BinaryIO, List[str]) -> None
+        try:
+            import numpy
+        except ImportError:
+            raise TableError("Writing npz files requires numpy")
+        self._numpy = numpy
+        TableWriter.__init__(self, fobj, columns)
+        self._data = dict(
+            (k, []) for k in self.columns)  # type: Dict[str, List[str]]
+
+    def write_row(self, row):
+        # type: (Dict[str, str]) -> None
+        for k in self.columns:
+            self._data[k].append(row[k])
+
+    def _array(self, values):
+        # type: (List[str]) -> Any
+        numpy = self._numpy
+        for dtype, conv in (('int64', int), ('float64', float)):
+            try:
+                return numpy.array([conv(v) for v in values], dtype=dtype)
+            except (ValueError, OverflowError):
+                continue
+        return numpy.array(values, dtype=str)
+
+    def close(self):
+        # type: () -> None
+        # Written as numpy.savez does, which reserves some array names
+        write_array = self._numpy.lib.format.write_array
+        with zipfile.ZipFile(self.fobj, 'w', zipfile.ZIP_STORED,
+                             allowZip64=True) as zf:
+            for k in self.columns:
+                buf = io.BytesIO()
+                write_array(buf, self._array(self._data[k]),
+                            allow_pickle=False)
+                zf.writestr(k + '.npy', buf.getvalue())
+
+
+_writers = {
+    'csv': CSVTableWriter,
+    'jsonl': JSONLinesTableWriter,
+    'npz': NPZTableWriter,
+}
+
+
+def is_binary(fmt):
+    # type: (str) -> bool
+    """Whether tables of the format are written to binary files"""
+    return fmt == 'npz'
+
+
+def table_writer(fmt, fobj, columns):
+    # type: (str, typing.IO, List[str]) -> TableWriter
+    """Return a writer of the named format, the first column naming the
+    input file of each row"""
+    try:
+        wclass = _writers[fmt]
+    except KeyError:
+        raise TableError("Unknown table format {}".format(fmt))
+    if FILE_COLUMN in columns:
+        raise TableError(
+            "Element {} conflicts with the input file column"
+            .format(FILE_COLUMN))
+    return wclass(fobj, [FILE_COLUMN] + list(columns))
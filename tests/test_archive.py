@@ -0,0 +1,37 @@
+import pytest
+import sci_parameter_utils.archive as archive
+
+
+@pytest.mark.parametrize("fname", [
+    'out.tar', 'out.tar.gz', 'out.tgz', 'out.tar.bz2', 'out.zip'])
+def test_archive_roundtrip(tmpdir, fname):
+    path = str(tmpdir.join(fname))
+    assert archive.is_archive(path)
+    files = [('run_{}.prm'.format(i), u'set A = {}\n'.format(i))
+             for i in range(5)]
+    with archive.ArchiveWriter(path) as writer:
+        for name, text in files:
+            writer.add(name, text)
+        writer.add('/abs/notes.txt', u'notes\n')
+
+    members = list(archive.read_members(path))
+    assert ([(m.name, m.read()) for m in members] ==
+            [('{}:{}'.format(path, n), t) for n, t in files] +
+            [('{}:abs/notes.txt'.format(path), u'notes\n')])
+
+    members = list(archive.read_members(path, '*.prm'))
+    assert len(members) == 5
+
+
+def test_archive_invalid(tmpdir):
+    path = str(tmpdir.join('out.rar'))
+    assert not archive.is_archive(path)
+    with pytest.raises(archive.ArchiveError) as excinfo:
+        archive.ArchiveWriter(path)
+    assert str(excinfo.value) == "Unknown archive format for {}".format(path)
+
+    with archive.ArchiveWriter(str(tmpdir.join('out.zip'))) as writer:
+        writer.add('a.prm', u'')
+        with pytest.raises(archive.ArchiveError) as excinfo:
+            writer.add('a.prm', u'')
+    assert str(excinfo.value) == "File a.prm already written to archive"
@@ -0,0 +1,108 @@
+import pytest
+import os
+import sci_parameter_utils.cache as cache
+import sci_parameter_utils.general as gen
+import sci_parameter_utils.fragment as frags
+import sci_parameter_utils.parsers as parsers
+
+PRM = """set A = 1
+subsection S
+  set B = 2
+  set A = 3
+end
+set A = 4
+"""
+
+
+@pytest.fixture
+def prm_parser():
+    return parsers.PFileParser.parser_by_name('dealIIPRM')
+
+
+def test_flatten(tmpdir, prm_parser):
+    tmpdir.join('a.prm').write(PRM)
+    with tmpdir.join('a.prm').open('r') as f:
+        values = cache.flatten_lines(prm_parser.lines(f))
+    assert values == {'A': '4', 'S:B': '2', 'S:A': '3'}
+    assert list(values) == ['A', 'S:B', 'S:A']
+
+
+def test_cache_hits(tmpdir, prm_parser):
+    cdir = str(tmpdir.join('cache'))
+    fn = str(tmpdir.join('a.prm'))
+    tmpdir.join('a.prm').write(PRM)
+    pc = cache.ParseCache(cdir)
+
+    v1 = pc.get_values(fn, prm_parser)
+    v2 = pc.get_values(fn, prm_parser)
+    assert v1 == v2 == {'A': '4', 'S:B': '2', 'S:A': '3'}
+    assert (pc.hits, pc.misses) == (1, 1)
+
+    pc2 = cache.ParseCache(cdir)
+    assert pc2.get_values(fn, prm_parser) == v1
+    assert (pc2.hits, pc2.misses) == (1, 0)
+    assert pc2.stats()['bytes'] > 0
+
+    tmpdir.join('a.prm').write(PRM + "set C = 5\n")
+    assert pc2.get_values(fn, prm_parser)['C'] == '5'
+    assert (pc2.hits, pc2.misses) == (1, 1)
+
+    # Entries which are not key-value maps are ignored
+    for text in ['not json', '[1, 2]']:
+        with open(pc2._entry_path(fn, prm_parser), 'w') as f:
+            f.write(text)
+        assert pc2.lookup(fn, prm_parser) is None
+        assert pc2.get_values(fn, prm_parser)['C'] == '5'
+
+
+def test_cache_eviction(tmpdir, prm_parser):
+    cdir = str(tmpdir.join('cache'))
+    pc = cache.ParseCache(cdir, max_bytes=1)
+    for i in range(3):
+        fn = str(tmpdir.join('{}.prm'.format(i)))
+        tmpdir.join('{}.prm'.format(i)).write(PRM)
+        pc.get_values(fn, prm_parser)
+    assert pc.evictions == 3
+    assert [f for f in os.listdir(cdir) if f.endswith('.json')] == []
+
+
+def test_cache_search(tmpdir, prm_parser):
+    tmpdir.join('a.prm').write(PRM)
+    pc = cache.ParseCache(str(tmpdir.join('cache')))
+    smap = {'a': frags.LocElem('a', 'A'),
+            'b': frags.LocElem('b', 'S:B'),
+            'c': frags.LocElem('c', 'S:A')}
+    with tmpdir.join('a.prm').open('r') as f:
+        expect = gen.do_search(smap, f, prm_parser)
+    for i in range(2):
+        with tmpdir.join('a.prm').open('r') as f:
+            assert gen.do_search(smap, f, prm_parser, cache=pc) == expect
+    assert (pc.hits, pc.misses) == (1, 1)
+
+    smap['g'] = frags.GlobElem('g', '*A')
+    with tmpdir.join('a.prm').open('r') as f:
+        expect = gen.do_search(smap, f, prm_parser)
+    assert expect['g'] == ['4', '3']
+    with tmpdir.join('a.prm').open('r') as f:
+        assert gen.do_search(smap, f, prm_parser, cache=pc) == expect
+
+    smap['d'] = frags.LocElem('d', 'D')
+    with pytest.raises(gen.MissingValues):
+        with tmpdir.join('a.prm').open('r') as f:
+            gen.do_search(smap, f, prm_parser, cache=pc)
+
+
+def test_cache_search_pattern_order(tmpdir, prm_parser):
+    keys = ['K{}'.format(i) for i in range(40, 0, -1)]
+    tmpdir.join('a.prm').write(''.join(
+        'set {} = {}\n'.format(k, i) for i, k in enumerate(keys)))
+    pc = cache.ParseCache(str(tmpdir.join('cache')))
+    smap = {'g': frags.GlobElem('g', 'K*')}
+    with tmpdir.join('a.prm').open('r') as f:
+        expect = gen.do_search(smap, f, prm_parser)
+    assert expect['g'] == [str(i) for i in range(len(keys))]
+    # Values found in the cache are in the same order, when stored and read
+    for i in range(2):
+        with tmpdir.join('a.prm').open('r') as f:
+            assert gen.do_search(smap, f, prm_parser, cache=pc) == expect
+    assert (pc.hits, pc.misses) == (1, 1)
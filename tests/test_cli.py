@@ -1,6 +1,12 @@
 import pytest
+import json
+import os
+import subprocess
+import sys
 import click.testing
+import sci_parameter_utils.archive as archive
 import sci_parameter_utils.cli as prm_cli
+import sci_parameter_utils.fragment as prm_fragment
 
 
 @pytest.mark.parametrize(
@@ -11,3 +17,689 @@ import sci_parameter_utils.cli as prm_cli
 def test_searcher(parser, args, stdout):
     res = click.testing.CliRunner.invoke(prm_cli.print_vals, args=args)
     assert res.output == stdout
+
+
+TEMPLATE_PRM = """# FN: {{{fn}}}.prm
+set Alpha = {{{a}}}
+subsection Sub
+  set Beta = {{{b}}}
+end
+"""
+
+TEMPLATE_DEFS = """a:
+    type: int
+b:
+    type: expr
+    expr: 2*a
+fn:
+    type: fname
+    expr: 'out_{a}'
+"""
+
+
+@pytest.fixture
+def template_setup(tmpdir):
+    tmpdir.join('template.prm').write(TEMPLATE_PRM)
+    tmpdir.join('defs.yaml').write(TEMPLATE_DEFS)
+    return tmpdir
+
+
+def run_template(tmpdir, *args):
+    return click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['template',
+         '-p', str(tmpdir.join('defs.yaml')),
+         '-o', str(tmpdir.join('{fn}.prm'))] +
+        list(args) +
+        [str(tmpdir.join('template.prm'))])
+
+
+@pytest.mark.parametrize("jobs", ['1', '3'])
+@pytest.mark.parametrize("incremental", [
+    '--incremental',
+    '--no-incremental',
+])
+def test_template_jobs(template_setup, jobs, incremental):
+    tmpdir = template_setup
+    tmpdir.join('in.yaml').write(
+        '\n'.join('- {{a: {}}}'.format(i) for i in range(10)))
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')),
+                       '-j', jobs, '-l', incremental)
+    assert res.exit_code == 0
+    assert res.output.split() == [str(tmpdir.join('out_{}.prm'.format(i)))
+                                  for i in range(10)]
+
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')),
+                       '-j', jobs, incremental)
+    assert res.exit_code == 0
+    for i in range(10):
+        assert tmpdir.join('out_{}.prm'.format(i)).read() == (
+            TEMPLATE_PRM
+            .replace('{{{a}}}', str(i))
+            .replace('{{{b}}}', str(2*i)))
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_template_profile(template_setup, jobs):
+    tmpdir = template_setup
+    tmpdir.join('in.yaml').write(
+        '\n'.join('- {{a: {}}}'.format(i) for i in range(5)))
+    pfile = tmpdir.join('profile.json')
+    cfile = tmpdir.join('profile.pstats')
+    res = click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['--profile', str(pfile), '--cprofile', str(cfile),
+         'template',
+         '-p', str(tmpdir.join('defs.yaml')),
+         '-o', str(tmpdir.join('{fn}.prm')),
+         '-i', str(tmpdir.join('in.yaml')),
+         '-j', jobs,
+         str(tmpdir.join('template.prm'))])
+    assert res.exit_code == 0
+    report = json.loads(pfile.read())
+    assert report['counts']['rows'] == 5
+    assert report['counts']['files'] == 5
+    stages = ['load_definitions', 'build_element_set', 'read_template',
+              'read_inputs']
+    if jobs == '1':
+        stages += ['validation', 'evaluation', 'filename', 'render',
+                   'write']
+        assert report['stages']['write']['calls'] == 5
+        assert report['counts']['bytes'] > 0
+    else:
+        stages += ['parallel_render']
+    assert sorted(report['stages']) == sorted(stages)
+    assert cfile.check()
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_template_cse(template_setup, jobs):
+    tmpdir = template_setup
+    tmpdir.join('in.yaml').write('- {a: 3}\n- {a: 4}\n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')),
+                       '--cse', '-j', jobs)
+    assert res.exit_code == 0
+    for i in [3, 4]:
+        assert tmpdir.join('out_{}.prm'.format(i)).read() == (
+            TEMPLATE_PRM
+            .replace('{{{a}}}', str(i))
+            .replace('{{{b}}}', str(2*i)))
+
+
+@pytest.mark.parametrize("cse,output", [
+    ('--no-cse', ['a (int)', 'b (expr) = 2*a <- a',
+                  "fn (fname) = out_{a} <- a"]),
+    ('--cse', ['a (int)', 'b (expr) = 2*a <- a',
+               "fn (fname) = out_{a} <- a"]),
+])
+def test_plan(template_setup, cse, output):
+    tmpdir = template_setup
+    res = click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['plan', '-p', str(tmpdir.join('defs.yaml')), cse])
+    assert res.exit_code == 0
+    assert sorted(res.output.splitlines()) == sorted(output)
+    assert res.output.splitlines()[0] == 'a (int)'
+
+
+def test_plan_print_defs(print_setup):
+    tmpdir = print_setup
+    res = click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['plan', '-d', str(tmpdir.join('defs.yaml'))])
+    assert res.exit_code == 0
+    assert res.output.splitlines()[-1].startswith('c (expr) = ')
+
+    res = click.testing.CliRunner().invoke(prm_cli.cli_main, ['plan'])
+    assert res.exit_code != 0
+    assert 'Exactly one definition file must be given' in res.output
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_template_unused_elements(template_setup, jobs):
+    tmpdir = template_setup
+    tmpdir.join('defs.yaml').write(
+        TEMPLATE_DEFS +
+        "z:\n    type: int\nu:\n    type: fmt\n    expr: '{z}'\n")
+    tmpdir.join('in.yaml').write('- {a: 3, z: x}\n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')),
+                       '-j', jobs)
+    assert res.exit_code == 0
+    assert tmpdir.join('out_3.prm').check()
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+@pytest.mark.parametrize("fname", ['out.tar.gz', 'out.zip'])
+def test_template_archive(template_setup, jobs, fname):
+    tmpdir = template_setup
+    tmpdir.join('in.yaml').write(
+        '\n'.join('- {{a: {}}}'.format(i) for i in range(5)))
+    path = str(tmpdir.join(fname))
+    res = click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['template',
+         '-p', str(tmpdir.join('defs.yaml')),
+         '-o', '{fn}.prm',
+         '-i', str(tmpdir.join('in.yaml')),
+         '-j', jobs,
+         '--archive', path,
+         str(tmpdir.join('template.prm'))])
+    assert res.exit_code == 0
+    assert not tmpdir.join('out_0.prm').check()
+    members = dict((m.name, m.read())
+                   for m in archive.read_members(path))
+    assert members == dict(
+        ('{}:out_{}.prm'.format(path, i),
+         TEMPLATE_PRM.replace('{{{a}}}', str(i))
+         .replace('{{{b}}}', str(2*i)))
+        for i in range(5))
+
+    res = run_template(tmpdir, '-l', '--archive', path)
+    assert res.exit_code != 0
+    assert 'Only one of --list and --archive may be given' in res.output
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_template_manifest(template_setup, jobs):
+    tmpdir = template_setup
+    manifest = str(tmpdir.join('manifest.json'))
+
+    def generate(rows, *args):
+        tmpdir.join('in.yaml').write(
+            '\n'.join('- {{a: {}}}'.format(i) for i in rows))
+        return run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')),
+                            '-j', jobs, '--manifest', manifest, *args)
+
+    def expected(i):
+        return (TEMPLATE_PRM.replace('{{{a}}}', str(i))
+                .replace('{{{b}}}', str(2*i)))
+
+    assert generate(range(4)).exit_code == 0
+    assert tmpdir.join('out_3.prm').read() == expected(3)
+
+    # Unchanged rows are not rewritten, missing files are
+    tmpdir.join('out_0.prm').write('edited')
+    tmpdir.join('out_1.prm').remove()
+    assert generate([0, 1, 2, 5]).exit_code == 0
+    assert tmpdir.join('out_0.prm').read() == 'edited'
+    assert tmpdir.join('out_1.prm').read() == expected(1)
+    assert tmpdir.join('out_5.prm').read() == expected(5)
+    assert tmpdir.join('out_3.prm').check()
+
+    # Files no longer generated are pruned
+    assert generate([0, 1, 5], '--prune').exit_code == 0
+    assert not tmpdir.join('out_2.prm').check()
+    assert not tmpdir.join('out_3.prm').check()
+    assert tmpdir.join('out_0.prm').read() == 'edited'
+    assert sorted(json.loads(tmpdir.join('manifest.json').read())['files']) \
+        == sorted(str(tmpdir.join('out_{}.prm'.format(i))) for i in [0, 1, 5])
+
+    # Changing the template regenerates all files
+    tmpdir.join('template.prm').write(TEMPLATE_PRM + '\n')
+    assert generate([0, 1, 5]).exit_code == 0
+    assert tmpdir.join('out_0.prm').read() == expected(0) + '\n'
+
+
+def test_template_manifest_write_error(template_setup, monkeypatch):
+    tmpdir = template_setup
+    manifest = str(tmpdir.join('manifest.json'))
+    tmpdir.join('in.yaml').write('- {a: 1}')
+    args = ['-i', str(tmpdir.join('in.yaml')), '--manifest', manifest]
+    open_file = click.open_file
+
+    def fail_write(fn, *args, **kwargs):
+        with open_file(fn, *args, **kwargs) as f:
+            f.write('partial')
+        raise IOError("No space left on device")
+    monkeypatch.setattr(click, 'open_file', fail_write)
+    res = run_template(tmpdir, *args)
+    assert res.exit_code != 0
+    assert 'No space left on device' in res.output
+    assert tmpdir.join('out_1.prm').read() == 'partial'
+
+    # The partially written file is not taken as unchanged
+    monkeypatch.setattr(click, 'open_file', open_file)
+    assert run_template(tmpdir, *args).exit_code == 0
+    assert tmpdir.join('out_1.prm').read() == (
+        TEMPLATE_PRM.replace('{{{a}}}', '1').replace('{{{b}}}', '2'))
+
+
+def test_template_manifest_options(template_setup):
+    tmpdir = template_setup
+    manifest = str(tmpdir.join('manifest.json'))
+    res = run_template(tmpdir, '--manifest', manifest, '--archive',
+                       str(tmpdir.join('out.zip')))
+    assert res.exit_code != 0
+    assert 'A manifest may not be used with --list or --archive' \
+        in res.output
+    res = run_template(tmpdir, '--prune')
+    assert res.exit_code != 0
+    assert 'Pruning files requires a manifest' in res.output
+
+
+def test_template_jobs_failures(template_setup):
+    tmpdir = template_setup
+    tmpdir.join('in.yaml').write('- {a: 1}\n- {a: x}\n- {}\n- {a: 4}\n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.yaml')), '-j', '2')
+    assert res.exit_code != 0
+    assert 'Row 1: Error obtaining input values' in res.output
+    assert 'Row 2: Error obtaining input values' in res.output
+    assert 'Failed to generate 2 files' in res.output
+    assert tmpdir.join('out_1.prm').check()
+    assert tmpdir.join('out_4.prm').check()
+
+
+@pytest.mark.parametrize("fname,text,rows", [
+    ('in.yaml', '- {a: 1}\n- {a: 2, b: x}\n', [{'a': 1}, {'a': 2, 'b': 'x'}]),
+    ('in.json', '[{"a": 1}]', [{'a': 1}]),
+    ('in.yaml', '', [{}]),
+    ('in.jsonl', '{"a": 1}\n\n{"a": 2, "b": "x"}\n',
+     [{'a': 1}, {'a': 2, 'b': 'x'}]),
+    ('in.csv', 'a, b\n1,x\n2,\n', [{'a': '1', 'b': 'x'}, {'a': '2'}]),
+    ('in.csv', 'a,b\n', [{}]),
+    ('in.csv', 'a,b\n1\n', [{'a': '1'}]),
+])
+def test_iter_rows(tmpdir, fname, text, rows):
+    tmpdir.join(fname).write(text)
+    with tmpdir.join(fname).open('r') as f:
+        assert list(prm_cli.iter_rows_from_file(f)) == rows
+
+
+def test_iter_rows_extra_fields(tmpdir):
+    tmpdir.join('in.csv').write('a,b\n1,2\n3,4,5\n')
+    with tmpdir.join('in.csv').open('r') as f:
+        rows = prm_cli.iter_rows_from_file(f)
+        assert next(rows) == {'a': '1', 'b': '2'}
+        with pytest.raises(ValueError) as excinfo:
+            next(rows)
+    assert str(excinfo.value) == "Row 2 has extra fields"
+
+
+def test_template_csv_extra_fields(template_setup):
+    tmpdir = template_setup
+    tmpdir.join('in.csv').write('a\n3\n4,5\n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.csv')), '-l')
+    assert res.exit_code != 0
+    assert ('Error reading input values: Row 2 has extra fields'
+            in res.output)
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_template_csv(template_setup, jobs):
+    tmpdir = template_setup
+    tmpdir.join('in.csv').write('a\n3\n4\n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.csv')),
+                       '-j', jobs, '-l')
+    assert res.exit_code == 0
+    assert res.output.split() == [str(tmpdir.join('out_{}.prm'.format(i)))
+                                  for i in (3, 4)]
+
+
+def test_template_bad_rows(template_setup):
+    tmpdir = template_setup
+    tmpdir.join('in.jsonl').write('{"a": 1}\n{"a": \n')
+    res = run_template(tmpdir, '-i', str(tmpdir.join('in.jsonl')), '-l')
+    assert res.exit_code != 0
+    assert res.output.startswith(str(tmpdir.join('out_1.prm')))
+    assert 'Error reading input values' in res.output
+
+
+@pytest.mark.parametrize("shard,expect", [
+    ('', [1, 2, 3, 4]),
+    ('1/2', [2, 4]),
+])
+def test_template_sweep(template_setup, shard, expect):
+    tmpdir = template_setup
+    tmpdir.join('sweep.yaml').write(
+        'design: grid\ninputs:\n  a: {start: 1, stop: 4, num: 4}\n')
+    args = ['-s', str(tmpdir.join('sweep.yaml')), '-l']
+    if shard:
+        args += ['--shard', shard]
+    res = run_template(tmpdir, *args)
+    assert res.exit_code == 0
+    assert res.output.split() == [str(tmpdir.join('out_{}.prm'.format(i)))
+                                  for i in expect]
+
+
+# Modules which the command line interface should only import when a command
+# needs them
+LAZY_MODULES = ['sympy', 'yaml', 'numpy', 'multiprocessing', 'tarfile',
+                'zipfile', 'sqlite3']
+
+
+@pytest.mark.parametrize("args", [
+    ['--help'],
+    ['template', '--help'],
+    ['print', '--help'],
+    ['query', '--help'],
+    ['print', '-d', '{tmpdir}/defs.json', '{tmpdir}/run.prm'],
+])
+def test_cli_import_lazy(tmpdir, args):
+    # Printing without expressions needs neither sympy nor yaml
+    tmpdir.join('defs.json').write(json.dumps({
+        'elems': {'a': {'type': 'float'}},
+        'locs': {'a': {'type': 'loc', 'key': 'Alpha'}},
+        'print': {'inputs': ['a']}}))
+    tmpdir.join('run.prm').write("set Alpha = 1.5\n")
+    args = [a.format(tmpdir=tmpdir) for a in args]
+    code = ("import sys\n"
+            "from sci_parameter_utils.cli import cli_main\n"
+            "try:\n"
+            "    cli_main({!r})\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules\n"
+            "                          if m.split('.')[0] in {!r}))))\n"
+            .format(args, LAZY_MODULES))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    proc = subprocess.Popen([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env, universal_newlines=True)
+    out, err = proc.communicate()
+    assert proc.returncode == 0, err
+    assert out.split('\n')[-2] == ''
+    if '--help' not in args:
+        assert '\ta = 1.5\n' in out
+
+
+PRINT_DEFS = """elems:
+    a:
+        type: float
+    b:
+        type: int
+    c:
+        type: expr
+        expr: a*b
+        fmt: '{:.2f}'
+locs:
+    a:
+        type: loc
+        key: Alpha
+    b:
+        type: loc
+        key: Sub:Beta
+print:
+    inputs: [a, b]
+    derived: [c]
+"""
+
+
+@pytest.fixture
+def print_setup(tmpdir):
+    tmpdir.join('defs.yaml').write(PRINT_DEFS)
+    for i in range(4):
+        tmpdir.join('run{}.prm'.format(i)).write(
+            "set Alpha = {}\nsubsection Sub\n  set Beta = {}\nend\n"
+            .format(0.5*i, i))
+    return tmpdir
+
+
+def run_print(tmpdir, *args):
+    return click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['print', '-d', str(tmpdir.join('defs.yaml'))] + list(args))
+
+
+def print_output(tmpdir, files, sections=('inputs', 'derived')):
+    out = ''
+    for i in files:
+        out += 'Input {}:\n'.format(tmpdir.join('run{}.prm'.format(i)))
+        if 'inputs' in sections:
+            out += 'Section inputs\n\ta = {}\n\tb = {}\n'.format(0.5*i, i)
+        if 'derived' in sections:
+            out += 'Section derived\n\tc = {:.2f}\n'.format(0.5*i*i)
+        out += '-----\n'
+    return out
+
+
+@pytest.mark.parametrize("sections", [
+    ('inputs', 'derived'),
+    ('derived',),
+])
+@pytest.mark.parametrize("compiled", ['--compiled', '--symbolic'])
+@pytest.mark.parametrize("stop_early", ['--stop-early', '--read-all'])
+def test_print(print_setup, monkeypatch, sections, compiled, stop_early):
+    tmpdir = print_setup
+    symbolic = []
+    evaluate = prm_fragment.NExprElem.evaluate
+
+    def record_evaluate(self, values):
+        symbolic.append(self.name)
+        return evaluate(self, values)
+    monkeypatch.setattr(prm_fragment.NExprElem, 'evaluate', record_evaluate)
+
+    args = [compiled, stop_early]
+    if len(sections) == 1:
+        args += ['-p', sections[0]]
+    res = run_print(tmpdir, *(args +
+                              [str(tmpdir.join('run{}.prm'.format(i)))
+                               for i in range(4)]))
+    assert res.exit_code == 0
+    assert res.output == print_output(tmpdir, range(4), sections)
+    if 'derived' in sections:
+        assert symbolic == ([] if compiled == '--compiled' else ['c']*4)
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_print_cache(print_setup, jobs):
+    tmpdir = print_setup
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)]
+    cdir = str(tmpdir.join('cache'))
+    for stats in ['0 hits, 4 misses', '4 hits, 0 misses']:
+        res = run_print(tmpdir, '--cache-dir', cdir, '--cache-stats',
+                        '-j', jobs, *files)
+        assert res.exit_code == 0
+        assert res.output.startswith(print_output(tmpdir, range(4)))
+        assert stats in res.output
+
+    res = run_print(tmpdir, '--cache-dir', cdir, '--no-cache',
+                    '--cache-stats', *files)
+    assert res.exit_code == 0
+    assert 'Cache not in use' in res.output
+
+
+def test_print_jobs(print_setup):
+    tmpdir = print_setup
+    for i in range(4, 40):
+        tmpdir.join('run{}.prm'.format(i)).write(
+            "set Alpha = {}\nsubsection Sub\n  set Beta = {}\nend\n"
+            .format(0.5*i, i))
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(40)]
+    res = run_print(tmpdir, '-j', '3', *files)
+    assert res.exit_code == 0
+    assert res.output == print_output(tmpdir, range(40))
+
+    # Errors are reported for each file without stopping
+    tmpdir.join('run2.prm').write("set Alpha = 1\n")
+    tmpdir.join('run5.prm').write("set Alpha = 1\n")
+    res = run_print(tmpdir, '-j', '3', *files)
+    assert res.exit_code != 0
+    good = [i for i in range(40) if i not in (2, 5)]
+    assert res.output.startswith(print_output(tmpdir, [0, 1]))
+    assert res.output.count('Error searching file: ') == 2
+    assert 'Failed to read 2 files' in res.output
+    for i in good:
+        assert print_output(tmpdir, [i]) in res.output
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+@pytest.mark.parametrize("fmt", ['csv', 'jsonl'])
+def test_print_table(print_setup, jobs, fmt):
+    tmpdir = print_setup
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)]
+    rows = [[f, str(0.5*i), str(i), '{:.2f}'.format(0.5*i*i)]
+            for i, f in enumerate(files)]
+    res = run_print(tmpdir, '-f', fmt, '-j', jobs, *files)
+    assert res.exit_code == 0
+    if fmt == 'csv':
+        assert res.output == ''.join(
+            ','.join(r) + '\n' for r in [['file', 'a', 'b', 'c']] + rows)
+    else:
+        assert [json.loads(l) for l in res.output.splitlines()] == [
+            dict(zip(['file', 'a', 'b', 'c'], r)) for r in rows]
+
+    ofile = tmpdir.join('out.' + fmt)
+    res = run_print(tmpdir, '-f', fmt, '-o', str(ofile), '-p', 'derived',
+                    '-j', jobs, *files)
+    assert res.exit_code == 0
+    assert res.output == ''
+    assert len(ofile.read().splitlines()) == (5 if fmt == 'csv' else 4)
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_print_npz(print_setup, jobs):
+    numpy = pytest.importorskip('numpy')
+    tmpdir = print_setup
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)]
+    ofile = str(tmpdir.join('out.npz'))
+    res = run_print(tmpdir, '-f', 'npz', '-o', ofile, '-j', jobs, *files)
+    assert res.exit_code == 0
+    with numpy.load(ofile) as data:
+        assert sorted(data.files) == ['a', 'b', 'c', 'file']
+        assert list(data['file']) == files
+        assert data['a'].dtype == numpy.float64
+        assert list(data['a']) == [0.5*i for i in range(4)]
+        assert data['b'].dtype == numpy.int64
+        assert list(data['b']) == list(range(4))
+
+    res = run_print(tmpdir, '-f', 'npz', *files)
+    assert res.exit_code != 0
+    assert 'An output file is required for the npz format' in res.output
+    res = run_print(tmpdir, '-o', ofile, *files)
+    assert res.exit_code != 0
+    assert 'Writing to a file requires a table --format' in res.output
+
+
+def test_print_table_errors(print_setup):
+    tmpdir = print_setup
+    tmpdir.join('run1.prm').write("set Alpha = 1\n")
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)]
+    res = run_print(tmpdir, '-f', 'csv', '-j', '2', *files)
+    assert res.exit_code != 0
+    assert 'Input {}: Error searching file'.format(files[1]) in res.output
+    assert 'Failed to read 1 files' in res.output
+    assert '{},1.5,3,4.50\n'.format(files[3]) in res.output
+
+
+def test_print_profile(print_setup):
+    tmpdir = print_setup
+    pfile = tmpdir.join('profile.json')
+    res = click.testing.CliRunner().invoke(
+        prm_cli.cli_main,
+        ['--profile', str(pfile),
+         'print', '-d', str(tmpdir.join('defs.yaml'))] +
+        [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)])
+    assert res.exit_code == 0
+    assert res.output == print_output(tmpdir, range(4))
+    report = json.loads(pfile.read())
+    assert report['counts'] == {'files': 4, 'lines': 8}
+    assert list(report['stages']) == [
+        'load_definitions', 'build_element_set', 'search', 'evaluation',
+        'output']
+    assert report['stages']['search']['calls'] == 4
+
+
+def test_print_unused_elements(print_setup):
+    tmpdir = print_setup
+    tmpdir.join('defs.yaml').write(
+        PRINT_DEFS.replace('locs:\n', 'locs:\n    c:\n'
+                           '        type: loc\n        key: Gamma\n'))
+    res = run_print(tmpdir, '-p', 'inputs', str(tmpdir.join('run1.prm')))
+    assert res.exit_code == 0
+    assert res.output == print_output(tmpdir, [1], ['inputs'])
+
+
+@pytest.mark.parametrize("stop_early", ['--stop-early', '--read-all'])
+def test_print_pattern(print_setup, stop_early):
+    tmpdir = print_setup
+    tmpdir.join('defs.yaml').write(
+        PRINT_DEFS.replace('print:\n', 'print:\n    all: [d]\n')
+        .replace('locs:\n', 'locs:\n    d:\n        type: glob\n'
+                 '        key: "*a"\n        sep: ","\n')
+        .replace('elems:\n', 'elems:\n    d:\n        type: str\n'))
+    res = run_print(tmpdir, stop_early, '-p', 'all',
+                    str(tmpdir.join('run1.prm')))
+    assert res.exit_code == 0
+    assert res.output == (
+        'Input {}:\nSection all\n\td = 0.5,1\n-----\n'
+        .format(tmpdir.join('run1.prm')))
+
+
+@pytest.mark.parametrize("jobs", ['1', '2'])
+def test_print_archive(print_setup, jobs):
+    tmpdir = print_setup
+    path = str(tmpdir.join('runs.tar'))
+    with archive.ArchiveWriter(path) as writer:
+        for i in range(4):
+            writer.add('run{}.prm'.format(i),
+                       tmpdir.join('run{}.prm'.format(i)).read())
+        writer.add('README', u'Not a parameter file\n')
+    res = run_print(tmpdir, str(tmpdir.join('run0.prm')),
+                    '-a', path, '--member', '*.prm', '-j', jobs)
+    assert res.exit_code == 0
+    expect = print_output(tmpdir, range(4))
+    for i in range(4):
+        expect = expect.replace(
+            str(tmpdir.join('run{}.prm:'.format(i))),
+            '{}:run{}.prm:'.format(path, i))
+    assert res.output == print_output(tmpdir, [0]) + expect
+
+
+def run_cli(*args):
+    return click.testing.CliRunner().invoke(prm_cli.cli_main, list(args))
+
+
+def test_index_query(print_setup):
+    tmpdir = print_setup
+    db = str(tmpdir.join('runs.db'))
+    files = [str(tmpdir.join('run{}.prm'.format(i))) for i in range(4)]
+    res = run_cli('index', db, str(tmpdir))
+    assert res.exit_code == 0
+    assert res.output == "Indexed 4 files, 0 unchanged, 0 removed\n"
+
+    tmpdir.join('run1.prm').write("set Alpha = 7\n")
+    os.utime(files[1], (0, 0))
+    os.remove(files[3])
+    res = run_cli('index', '--prune', db, str(tmpdir))
+    assert res.exit_code == 0
+    assert res.output == "Indexed 1 files, 2 unchanged, 1 removed\n"
+
+    res = run_cli('query', db, '-w', 'Alpha >= 1', '-s', 'Alpha',
+                  '-s', 'Sub:Beta')
+    assert res.exit_code == 0
+    assert res.output == (
+        '{}\n\tAlpha = 7\n{}\n\tAlpha = 1.0\n\tSub:Beta = 2\n'
+        .format(files[1], files[2]))
+
+    res = run_cli('query', db, '-w', 'Sub:Beta < 2', '-w', 'Alpha ~ 0*')
+    assert res.exit_code == 0
+    assert res.output == '{}\n'.format(files[0])
+
+    res = run_cli('query', db, '-f', 'csv', '-s', 'Sub:Beta')
+    assert res.exit_code == 0
+    assert res.output == 'file,Sub:Beta\n{},0\n{},\n{},2\n'.format(
+        *files[:3])
+
+
+def test_index_errors(print_setup):
+    tmpdir = print_setup
+    db = str(tmpdir.join('runs.db'))
+    tmpdir.join('bad.prm').write("subsection A\n")
+    res = run_cli('index', db, str(tmpdir))
+    assert res.exit_code != 0
+    assert "Error indexing {}: ".format(tmpdir.join('bad.prm')) in res.output
+    assert "Indexed 4 files, 0 unchanged, 0 removed" in res.output
+    assert "Failed to index 1 files" in res.output
+
+    res = run_cli('index', db, str(tmpdir.join('defs.yaml')))
+    assert res.exit_code != 0
+    assert "Error getting parser: " in res.output
+
+    res = run_cli('query', db, '-w', 'Alpha')
+    assert res.exit_code != 0
+    assert "Error querying index: Invalid filter Alpha" in res.output
+
+    res = run_cli('query', db, '-o', str(tmpdir.join('out.csv')))
+    assert res.exit_code != 0
+    assert "Writing to a file requires a table --format" in res.output
@@ -0,0 +1,71 @@
+import io
+import pytest
+from sci_parameter_utils.engine import TemplateEngine, EngineError, RenderError
+from sci_parameter_utils.profiling import Profiler
+
+TEMPLATE = u"""# FN: {{{fn}}}.prm
+set Alpha = {{{a}}}
+set Beta = {{{b}}}
+"""
+
+DEFS = {
+    'a': {'type': 'int'},
+    'b': {'type': 'expr', 'expr': '2*a'},
+    'fn': {'type': 'fname', 'expr': 'out_{a}'},
+    'z': {'type': 'int'},
+    'u': {'type': 'fmt', 'expr': '{z}'},
+}
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_engine_render(compiled):
+    engine = TemplateEngine(DEFS, TEMPLATE, 'prm', compiled=compiled)
+    assert engine.out == '{fn}.prm'
+    assert engine.eset.get_inputs() == set(['a'])
+    assert engine.filename({'a': 3}) == 'out_3.prm'
+    assert engine.render({'a': 3}) == (
+        u"# FN: {{{fn}}}.prm\nset Alpha = 3\nset Beta = 6\n")
+    assert list(engine.render_many([{'a': 1}, {'a': 2, 'z': 'x'}])) == [
+        ('out_1.prm', u"# FN: {{{fn}}}.prm\nset Alpha = 1\nset Beta = 2\n"),
+        ('out_2.prm', u"# FN: {{{fn}}}.prm\nset Alpha = 2\nset Beta = 4\n")]
+    assert 'type' in DEFS['a']
+
+
+def test_engine_file():
+    tfile = io.StringIO(TEMPLATE)
+    tfile.name = 'template.prm'
+    prof = Profiler()
+    engine = TemplateEngine(DEFS, tfile, out='{a}.prm', profiler=prof)
+    assert engine.extn == 'prm'
+    assert engine.filename({'a': 1}) == '1.prm'
+    assert set(prof.stages) == set([
+        'load_definitions', 'build_element_set', 'read_template',
+        'evaluation', 'filename'])
+
+
+def test_engine_default_out():
+    engine = TemplateEngine({'a': {'type': 'int'}}, u"set A = {{{a}}}\n",
+                            extn='prm')
+    assert engine.out == 'output.prm'
+    assert engine.filename({'a': 1}) == 'output.prm'
+    assert engine.render({'a': 1}) == u"set A = 1\n"
+
+
+def test_engine_errors():
+    with pytest.raises(EngineError) as excinfo:
+        TemplateEngine({'a': {'type': 'unknown'}}, TEMPLATE, 'prm')
+    assert str(excinfo.value).startswith("Error setting up template")
+    with pytest.raises(EngineError) as excinfo:
+        TemplateEngine(DEFS, TEMPLATE, 'xyz')
+    assert str(excinfo.value).startswith("Error getting parser")
+    with pytest.raises(EngineError) as excinfo:
+        TemplateEngine(DEFS, TEMPLATE + u"set C = {{{c}}}\n", 'prm')
+    assert str(excinfo.value).startswith("Error reading template")
+
+    engine = TemplateEngine(DEFS, TEMPLATE, 'prm')
+    with pytest.raises(RenderError) as excinfo:
+        engine.render({})
+    assert str(excinfo.value).startswith("Error obtaining input values")
+    with pytest.raises(RenderError) as excinfo:
+        engine.render({'a': 'x'})
+    assert str(excinfo.value).startswith("Error obtaining input values")
@@ -2,6 +2,7 @@ import pytest
 import sci_parameter_utils.fragment as frag
 import sympy
 import copy
+import re
 
 
 class DElem(frag.TemplateElem):
@@ -161,6 +162,8 @@ class TestExprElems:
 @pytest.mark.parametrize("tstr,args,key", [
     ('loc', {}, 'CFL'),
     ('loc', {}, 'CFL:Test:key'),
+    ('glob', {}, 'CFL:*:key'),
+    ('regex', {'sep': ','}, 'CFL:.*'),
 ])
 class TestSearchElems:
     def test_create(self, tstr, name, args, key):
@@ -231,6 +234,37 @@ def test_expressions(tstr, expr, idict, interm, fmt):
     assert fmt == elem.do_format(out)
 
 
+@pytest.mark.parametrize("tstr,trans", [
+    ('fmt', lambda v: v),
+    ('fname', lambda v: v.replace('.', '_').replace('/', '_')
+     .replace(' ', '_')),
+])
+@pytest.mark.parametrize("expr", [
+    'plain',
+    '{a}',
+    '{a}_{b}_{a}',
+    '{{a}} {a:>6.2f}/{b!r}',
+    '{a:{w}}.{b}',
+])
+def test_format_expressions(tstr, trans, expr):
+    values = {'a': 2.5, 'b': 'xy', 'w': 8}
+    elem = frag.TemplateElem.elem_by_type(tstr, 'test', {'expr': expr})
+    assert elem.evaluate(values) == trans(expr.format(**values))
+
+    cols = {'a': [2.5, 1.0, 3.0], 'b': ['xy', 'z', 'w'], 'w': [8, 2, 4]}
+    rows = [dict((k, cols[k][i]) for k in cols) for i in range(3)]
+    assert elem.evaluate_batch(cols, 3) == [trans(expr.format(**r))
+                                            for r in rows]
+
+
+def test_format_expressions_fields():
+    elem = frag.TemplateElem.elem_by_type('fmt', 'test',
+                                          {'expr': '{a:{w}} {b.real}'})
+    assert elem.get_dependencies() == set(['a', 'w', 'b.real'])
+    with pytest.raises(frag.DependencyError):
+        elem.evaluate({'a': 1, 'w': 2, 'b': 3})
+
+
 @pytest.mark.parametrize("tstr,name,expr,etype,error", [
     ('expr', 'a', 'a', frag.DependencyError,
      "Element 'a' cannot be dependent on itself"),
@@ -285,6 +319,36 @@ def test_searchers(tstr, name, key, args, value, output):
     assert elem.get_value(value) == output
 
 
+@pytest.mark.parametrize("tstr,key,args,matched,prefix,output", [
+    ('loc', 'A:B', {}, None, [], ['1', '2']),
+    ('glob', 'A:B*:C:?', {}, ['A:B:C:D', 'A:BE:F:C:D'], ['A'], ['1', '2']),
+    ('glob', 'A:B:*C', {'sep': ' '}, ['A:B:C', 'A:B:D:C'], ['A', 'B'],
+     '1 2'),
+    ('regex', 'A:B', {}, ['A:B'], [], ['1', '2']),
+    ('regex', 'A:.', {'sep': ','}, ['A:B', 'A:C'], [], '1,2'),
+])
+def test_pattern_searchers(tstr, key, args, matched, prefix, output):
+    args['key'] = key
+    elem = frag.SearchElem.elem_by_type(tstr, 'test', args)
+
+    if matched is None:
+        assert elem.get_pattern() is None
+    else:
+        pattern = re.compile(elem.get_pattern())
+        keys = matched + ['X:' + matched[0], matched[0] + ':X', 'A']
+        assert [k for k in keys if pattern.match(k)] == matched
+    assert elem.get_prefix(':') == prefix
+    assert elem.get_values(['1', '2']) == output
+
+
+def test_invalid_pattern():
+    with pytest.raises(frag.InvalidElementError) as excinfo:
+        frag.SearchElem.elem_by_type('regex', 'test', {'key': 'A:(B'})
+    assert str(excinfo.value).startswith(
+        "Error constructing element 'test' of type 'regex': "
+        "Invalid pattern A:(B: ")
+
+
 @pytest.mark.parametrize("idict", [
     {'a': {'type': 'b'}},
     {'a': {'type': 'b'}, 'b': {'type': 'c', 'test': 'd'}}
@@ -395,3 +459,274 @@ def test_elemset_depfail(frag_elemset, exc, error):
 
     if error:
         assert str(excinfo.value).startswith(error)
+
+
+@pytest.mark.parametrize("expr,idict,result,rtype", [
+    ('a', {'a': 5}, 5, int),
+    ('a*b', {'a': 5, 'b': 2}, 10, int),
+    ('a/b', {'a': 1.0, 'b': 4.0}, 0.25, float),
+    ('sqrt(a)+pi', {'a': 4.0}, 2.0+sympy.pi.evalf(), float),
+    ('2.5', {}, 2.5, float),
+])
+def test_compiled_expressions(expr, idict, result, rtype):
+    elem = frag.TemplateElem.elem_by_type('expr', 'test', {'expr': expr})
+    fn = elem.get_evaluator()
+
+    out = fn(idict)
+    assert type(out) is rtype
+    assert out == pytest.approx(float(result))
+    assert out == pytest.approx(float(elem.evaluate(idict)))
+
+
+@pytest.mark.parametrize("expr,idict", [
+    ('a*b', {'a': '5', 'b': 2}),
+    ('log(a)', {'a': 0}),
+    ('foo(a)', {'a': 2}),
+])
+def test_compiled_expressions_fallback(expr, idict):
+    elem = frag.TemplateElem.elem_by_type('expr', 'test', {'expr': expr})
+    fn = elem.get_evaluator()
+
+    assert fn(idict) == elem.evaluate(idict)
+
+
+def test_compiled_expressions_missing():
+    elem = frag.TemplateElem.elem_by_type('expr', 'test', {'expr': 'a*b'})
+    fn = elem.get_evaluator()
+    with pytest.raises(frag.DependencyError) as excinfo:
+        fn({'a': 1})
+
+    assert str(excinfo.value) == "Missing dependencies {}".format(set('b'))
+
+
+def test_compiled_elemset():
+    edict = frag.elems_from_dict({
+        'a': {'type': 'float'},
+        'b': {'type': 'int'},
+        'c': {'type': 'expr', 'expr': 'a*b', 'fmt': '{:.3f}'},
+        'd': {'type': 'fmt', 'expr': '{c}_{b}'},
+    }, frag.TemplateElem)
+    eset = frag.TemplateElemSet(edict, compiled=True)
+    vals = {'a': 1.5, 'b': 3}
+    eset.compute_values(vals)
+    assert isinstance(vals['c'], float)
+    assert vals['d'] == '4.5_3'
+    eset.compute_strings(vals)
+    assert vals['c'] == '4.500'
+
+
+CSE_DEFS = {
+    'g': {'type': 'float'},
+    'a': {'type': 'float'},
+    'dT': {'type': 'int'},
+    'Ra': {'type': 'expr', 'expr': 'g*a*dT**3/(1 + a)', 'fmt': '{:.4f}'},
+    'Ra2': {'type': 'expr', 'expr': '2*g*a*dT**3/(1 + a) + a',
+            'fmt': '{:.4f}'},
+    'Nu': {'type': 'expr', 'expr': '(g*a*dT**3/(1 + a))**0.25',
+           'fmt': '{:.4f}'},
+    'k': {'type': 'expr', 'expr': '2'},
+    'lbl': {'type': 'fmt', 'expr': '{Ra}_{k}'},
+}
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+@pytest.mark.parametrize("incremental", [True, False])
+def test_cse_elemset(compiled, incremental):
+    elems = frag.elems_from_dict(copy.deepcopy(CSE_DEFS), frag.TemplateElem)
+    eset = frag.TemplateElemSet(elems, compiled=compiled,
+                                incremental=incremental, cse=True)
+    full = frag.TemplateElemSet(elems, compiled=compiled)
+    assert eset.elements is elems
+    assert eset.hidden == frozenset(['__cse_0'])
+    assert eset.nodes['k'] is elems['k']
+    assert eset.nodes['Ra'] is not elems['Ra']
+
+    for row in [{'g': 9.8, 'a': 0.5, 'dT': 2},
+                {'g': 9.8, 'a': 0.5, 'dT': 3}]:
+        vals = dict(row)
+        eset.compute_strings(vals)
+        expect = dict(row)
+        full.compute_strings(expect)
+        assert vals == expect
+
+    cols = eset.compute_strings_batch({'g': [9.8, 1.0], 'a': [0.5, 0.5],
+                                       'dT': [2, 3]})
+    assert sorted(cols) == sorted(CSE_DEFS)
+
+
+def test_cse_plan():
+    elems = frag.elems_from_dict(copy.deepcopy(CSE_DEFS), frag.TemplateElem)
+    elems['__cse_1'] = frag.TemplateElem.elem_by_type('float', '__cse_1',
+                                                      {})
+    eset = frag.TemplateElemSet(elems, cse=True)
+    plan = eset.plan()
+    assert [k for k, _, _, _ in plan] == eset.order
+    plan = dict((k, (etype, expr, deps)) for k, etype, expr, deps in plan)
+    assert plan['___cse_0'] == ('shared', 'a*dT**3*g/(a + 1)',
+                                ['a', 'dT', 'g'])
+    assert plan['Ra'] == ('expr', '___cse_0', ['___cse_0'])
+    assert plan['Ra2'] == ('expr', '2*___cse_0 + a', ['___cse_0', 'a'])
+    assert plan['lbl'] == ('fmt', '{Ra}_{k}', ['Ra', 'k'])
+    assert plan['a'] == ('float', '', [])
+
+    plan = frag.TemplateElemSet(elems).plan()
+    assert 'shared' not in set(etype for _, etype, _, _ in plan)
+
+
+@pytest.mark.parametrize("cse", [True, False])
+def test_elemset_restrict(cse):
+    elems = frag.elems_from_dict(copy.deepcopy(CSE_DEFS), frag.TemplateElem)
+    eset = frag.TemplateElemSet(elems, compiled=True, cse=cse)
+    sub = eset.restrict(['lbl', 'Ra2'])
+    assert sorted(sub.elements) == sorted(['g', 'a', 'dT', 'Ra', 'Ra2', 'k',
+                                           'lbl'])
+    assert sub.get_inputs() == set(['g', 'a', 'dT'])
+    assert sub.compiled and sub.cse == cse
+    assert eset.restrict(['k']).get_inputs() == set()
+
+    vals = {'g': 1.0, 'a': 1.0, 'dT': 2}
+    sub.compute_strings(vals)
+    assert sorted(vals) == sorted(sub.elements)
+    assert vals['lbl'] == '4.0_2'
+
+    with pytest.raises(frag.DependencyError) as excinfo:
+        eset.restrict(['lbl', 'x', 'y'])
+    assert str(excinfo.value) == "Unknown dependency x, y"
+
+
+@pytest.fixture
+def batch_elemset():
+    edict = frag.elems_from_dict({
+        'a': {'type': 'float'},
+        'b': {'type': 'int'},
+        'c': {'type': 'expr', 'expr': 'a*b', 'fmt': '{:.3f}'},
+        'k': {'type': 'expr', 'expr': '2.5'},
+        'd': {'type': 'fmt', 'expr': '{a}_{b}'},
+        'f': {'type': 'fname', 'expr': '{d}.{b}'},
+    }, frag.TemplateElem)
+    return frag.TemplateElemSet(edict, compiled=True)
+
+
+@pytest.mark.parametrize("rows", [
+    [{'a': 1.5, 'b': 3}],
+    [{'a': 1.5, 'b': 3}, {'a': 2.0, 'b': -1}, {'a': 0.0, 'b': 7}],
+])
+def test_elemset_batch(batch_elemset, rows):
+    cols = {'a': [r['a'] for r in rows],
+            'b': [r['b'] for r in rows]}
+    vcols = batch_elemset.compute_values_batch(cols)
+    scols = batch_elemset.compute_strings_batch(cols)
+    for i, r in enumerate(rows):
+        vals = dict(r)
+        batch_elemset.compute_values(vals)
+        for k in vals:
+            assert vcols[k][i] == pytest.approx(vals[k]) \
+                if k in 'ack' else vcols[k][i] == vals[k]
+        batch_elemset.compute_strings(vals)
+        for k in vals:
+            assert scols[k][i] == vals[k]
+
+
+def test_elemset_batch_numpy(batch_elemset):
+    numpy = pytest.importorskip('numpy')
+    cols = {'a': numpy.linspace(0, 1, 5),
+            'b': numpy.arange(5)}
+    vcols = batch_elemset.compute_values_batch(cols)
+    assert isinstance(vcols['c'], numpy.ndarray)
+    assert vcols['c'] == pytest.approx(cols['a']*cols['b'])
+    assert vcols['k'] == pytest.approx([2.5]*5)
+    scols = batch_elemset.compute_strings_batch(cols)
+    assert scols['c'][-1] == '4.000'
+    assert scols['f'][-1] == '1_0_4_4'
+
+
+@pytest.mark.parametrize("expr,rows", [
+    ('a**b', [{'a': 10, 'b': 30}, {'a': 2, 'b': 3}]),
+    ('(a*b)**3', [{'a': 2**40, 'b': 1}, {'a': 3, 'b': -2}]),
+    ('a/b', [{'a': 1, 'b': 3}, {'a': 5, 'b': 2}]),
+    ('sqrt(a) + b', [{'a': 4, 'b': 1}, {'a': 2, 'b': 0}]),
+])
+@pytest.mark.parametrize("compiled", [True, False])
+def test_elemset_batch_exact(expr, rows, compiled):
+    edict = frag.elems_from_dict({
+        'a': {'type': 'int'},
+        'b': {'type': 'int'},
+        'p': {'type': 'expr', 'expr': expr},
+        'q': {'type': 'expr', 'expr': 'p + 2.5'},
+    }, frag.TemplateElem)
+    eset = frag.TemplateElemSet(edict, compiled=compiled)
+    cols = {'a': [r['a'] for r in rows], 'b': [r['b'] for r in rows]}
+    expect = []
+    for r in rows:
+        vals = dict(r)
+        eset.compute_strings(vals)
+        expect.append(vals)
+    scols = eset.compute_strings_batch(cols)
+    assert [dict((k, scols[k][i]) for k in scols)
+            for i in range(len(rows))] == expect
+
+    numpy = pytest.importorskip('numpy')
+    cols = dict((k, numpy.array(cols[k])) for k in cols)
+    scols = eset.compute_strings_batch(cols)
+    assert [dict((k, scols[k][i]) for k in scols)
+            for i in range(len(rows))] == expect
+
+
+def test_elemset_batch_invalid(batch_elemset):
+    with pytest.raises(ValueError) as excinfo:
+        batch_elemset.compute_values_batch({'a': [1.0, 2.0], 'b': [1]})
+    assert str(excinfo.value) == "Column b has length 1 not 2"
+
+    with pytest.raises(frag.DependencyError) as excinfo:
+        batch_elemset.compute_values_batch({'a': [1.0, 2.0]})
+    assert str(excinfo.value) == "Missing dependencies {}".format(set('b'))
+
+
+class CountElem(DElem):
+    def __init__(self, name, deps, counts):
+        DElem.__init__(self, name, deps)
+        self.counts = counts
+
+    def evaluate(self, values):
+        self.counts[self.name] = self.counts.get(self.name, 0) + 1
+        return '_'.join(str(values[k]) for k in sorted(self.deps))
+
+
+@pytest.mark.parametrize("rows,evaluated", [
+    ([{'a': 1, 'b': 1}, {'a': 1, 'b': 2}], {'w': 1, 'v': 2, 't': 2}),
+    ([{'a': 1, 'b': 1}, {'a': 2, 'b': 1}], {'w': 2, 'v': 1, 't': 2}),
+    ([{'a': 1, 'b': 1}, {'a': 1, 'b': 1}], {'w': 1, 'v': 1, 't': 1}),
+    ([{'a': 1, 'b': 1}, {'a': 1, 'b': 1.0}], {'w': 1, 'v': 2, 't': 2}),
+    ([{'a': 1, 'b': 1}, {'a': 1, 'b': 1, 'w': 'x'}],
+     {'w': 1, 'v': 2, 't': 2}),
+    ([{'a': 1, 'b': 1}, {'a': 1, 'b': 2}, {'a': 1, 'b': 3}],
+     {'w': 1, 'v': 3, 't': 3}),
+])
+def test_elemset_incremental(rows, evaluated):
+    counts = {}
+    edict = {
+        'a': IElem('a'),
+        'b': IElem('b'),
+        'w': CountElem('w', set('a'), counts),
+        'v': CountElem('v', set('b'), counts),
+        't': CountElem('t', set('wv'), counts),
+    }
+    eset = frag.TemplateElemSet(edict, incremental=True)
+    full = frag.TemplateElemSet(edict)
+
+    for r in rows:
+        vals = dict(r)
+        eset.compute_values(vals)
+        counts_before = dict(counts)
+        expect = dict(r)
+        full.compute_values(expect)
+        counts.clear()
+        counts.update(counts_before)
+        assert vals == expect
+
+    assert counts == evaluated
+
+    eset.reset()
+    eset.compute_values(dict(rows[-1]))
+    assert counts == dict((k, evaluated[k] + (k not in rows[-1]))
+                          for k in evaluated)
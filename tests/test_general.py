@@ -53,6 +53,15 @@ def test_fn_suggest_basic(parser, tmpdir, sugg, ostr):
         assert ostr == gen.get_fn_suggest(f, parser)
 
 
+def test_fn_suggest_missing(parser, tmpdir):
+    fn = 'out'
+    l = prm_file.PFileLine.commentline("No suggestion")
+    tmpdir.join(fn).write(parser.typeset_line(l))
+
+    with tmpdir.join(fn).open('r') as f:
+        assert "" == gen.get_fn_suggest(f, parser)
+
+
 @pytest.mark.parametrize("key", [
     "Key1",
     "Key2"
@@ -100,3 +109,148 @@ def test_fn_search_basic(parser, tmpdir, key, value, vf):
     with tmpdir.join(fn).open('r') as f:
         out = gen.do_search(smap, f, parser)
         assert value == vf(out[n])
+
+
+@pytest.mark.parametrize("lines,values,required", [
+    ([prm_file.PFileLine.commentline('{{{a}}}'),
+      prm_file.PFileLine.keyvalueline('Key', '{{{a}}}')],
+     {'a': '1'}, set('a')),
+    ([prm_file.PFileLine.keyvalueline('Key', '{{{a}}} {{{b}}}'),
+      prm_file.PFileLine.keyvalueline('Key2', 'c', comment='{{{c}}}'),
+      prm_file.PFileLine.keyvalueline('Key3', '{{{a}}}{{{c}}}')],
+     {'a': '1', 'b': '2', 'c': '3'}, set('abc')),
+    ([prm_file.PFileLine.keyvalueline('Key', 'x')], {}, set()),
+])
+def test_compiled_template(parser, lines, values, required):
+    ttext = u''.join(six.text_type(parser.typeset_line(l)) for l in lines)
+    f_t = StringIO(ttext)
+    f_o = StringIO()
+    f_g = StringIO()
+
+    ctemplate = gen.CompiledTemplate(f_t, parser)
+    assert ctemplate.required == required
+    assert ctemplate.missing({}) == required
+    assert ctemplate.missing(values) == set()
+
+    f_t.seek(0)
+    for l in parser.lines(f_t):
+        if l.ltype == 'KeyValue':
+            l.value.value = gen.do_replace(l.value.value, values)
+        f_o.write(six.text_type(parser.typeset_line(l)))
+    assert ctemplate.render(values) == f_o.getvalue()
+    assert ctemplate.render(values) == f_o.getvalue()
+    ctemplate.write(f_g, values)
+    assert f_g.getvalue() == f_o.getvalue()
+
+
+def test_compiled_template_missing(parser):
+    l = prm_file.PFileLine.keyvalueline('Key', '{{{a}}} {{{b}}}')
+    ctemplate = gen.CompiledTemplate(
+        StringIO(six.text_type(parser.typeset_line(l))), parser)
+    with pytest.raises(ValueError) as excinfo:
+        ctemplate.render({'a': '1'})
+    assert str(excinfo.value) == "No element b supplied"
+
+
+@pytest.mark.parametrize("keys,expect", [
+    (['A', 'S:B'], {'A': '1', 'S:B': '2'}),
+    (['A'], {'A': '1'}),
+    ([], {}),
+])
+def test_search_stop_early(keys, expect):
+    parser = prm_file.PFileParser.parser_by_name('dealIIPRM')
+    text = (u"set A = 1\nsubsection S\n  set B = 2\nend\n"
+            u"set A = 5\nbad line\n")
+    smap = dict((k, frags.LocElem(k, k)) for k in keys)
+
+    assert gen.do_search(smap, StringIO(text), parser,
+                         stop_early=True) == expect
+    with pytest.raises(ValueError):
+        gen.do_search(smap, StringIO(text), parser)
+
+
+def test_search_stop_early_missing():
+    parser = prm_file.PFileParser.parser_by_name('dealIIPRM')
+    text = u"set A = 1\nsubsection S\n  set B = 2\nend\n"
+    smap = dict((k, frags.LocElem(k, k)) for k in ['A', 'C'])
+
+    with pytest.raises(gen.MissingValues):
+        gen.do_search(smap, StringIO(text), parser, stop_early=True)
+    assert gen.do_search(smap, StringIO(text), parser, findall=False,
+                         stop_early=True) == {'A': '1'}
+
+
+def test_search_plan(parser):
+    keys = ['A', 'S:B', 'S:T:C', 'U:D']
+    smap = dict((k.lower(), frags.LocElem(k.lower(), k)) for k in keys)
+    smap['a2'] = frags.LocElem('a2', 'A')
+    plan = gen.SearchPlan(smap)
+    assert plan.keys == frozenset(keys)
+    assert sorted(plan.locdict['A']) == ['a', 'a2']
+    assert plan.sections == {'S': {'T': {}}, 'U': {}}
+
+    smap = {'k': frags.LocElem('k', 'Key')}
+    plan = gen.SearchPlan(smap)
+    text = u''.join(six.text_type(parser.typeset_line(
+        prm_file.PFileLine.keyvalueline('Key', v))) for v in ['1', '2'])
+    for _ in range(2):
+        assert gen.do_search(plan, StringIO(text), parser) == {'k': '2'}
+
+
+def test_search_plan_patterns():
+    smap = {'a': frags.LocElem('a', 'S:T:A'),
+            'g': frags.GlobElem('g', 'S:*:B'),
+            'r': frags.RegexElem('r', r'U:[CD]\d')}
+    plan = gen.SearchPlan(smap)
+    assert plan.keys == frozenset(['S:T:A'])
+    assert sorted(k for k, _ in plan.patterns) == ['g', 'r']
+    wildcard = plan.sections[None]
+    assert wildcard[None] is wildcard
+    assert plan.sections['S'][None] is wildcard
+    assert plan.sections['S']['T'][None] is wildcard
+
+    assert plan.match('S:T:U:B') == ('g',)
+    assert plan.match('S:B') == ()
+    assert plan.match('U:C1') == ('r',)
+    assert plan.match('U:C1:X') == ()
+    assert plan.match('S:T:A') == ()
+
+    plan = gen.SearchPlan({'g': frags.GlobElem('g', 'S:T*:B')})
+    assert list(plan.sections) == ['S']
+    assert plan.sections['S'][None][None] is plan.sections['S'][None]
+
+
+def test_search_plan_pattern_groups():
+    parser = prm_file.PFileParser.parser_by_name('dealIIPRM')
+    text = u"set aba = 1\nset x = 2\nset xy = 3\nset abc = 4\n"
+    smap = {'r1': frags.RegexElem('r1', '(x)y?'),
+            'r2': frags.RegexElem('r2', r'(a)b\1'),
+            'r3': frags.RegexElem('r3', '(?P<n>x)y'),
+            'r4': frags.RegexElem('r4', '(?P<n>a)bc'),
+            'g': frags.GlobElem('g', 'a*')}
+    plan = gen.SearchPlan(smap)
+    assert plan.match('aba') == tuple(k for k in smap if k in ('r2', 'g'))
+    assert plan.match('b') == ()
+    assert gen.do_search(smap, StringIO(text), parser) == {
+        'r1': ['2', '3'], 'r2': ['1'], 'r3': ['3'], 'r4': ['4'],
+        'g': ['1', '4']}
+
+
+@pytest.mark.parametrize("stop_early", [False, True])
+def test_search_patterns(stop_early):
+    parser = prm_file.PFileParser.parser_by_name('dealIIPRM')
+    text = (u"set A1 = 1\nsubsection S\n  set A2 = 2\n  set B = 3\nend\n"
+            u"set A1 = 4\nset A3 = 5\n")
+    smap = {'a': frags.GlobElem('a', '*A?'),
+            'as': frags.GlobElem('as', 'A*', sep=','),
+            'b': frags.LocElem('b', 'S:B'),
+            'r': frags.RegexElem('r', 'S:.*')}
+    assert gen.do_search(smap, StringIO(text), parser,
+                         stop_early=stop_early) == {
+        'a': ['4', '2', '5'], 'as': '4,5', 'b': '3', 'r': ['2', '3']}
+
+    smap['c'] = frags.GlobElem('c', 'C*')
+    with pytest.raises(gen.MissingValues):
+        gen.do_search(smap, StringIO(text), parser)
+    assert 'c' not in gen.do_search(smap, StringIO(text), parser,
+                                    findall=False)
@@ -0,0 +1,49 @@
+import pytest
+import sci_parameter_utils.graph as graph
+
+
+DEPS = {
+    'a': [],
+    'b': [],
+    'w': ['a', 'c'],
+    'c': ['b'],
+    't': ['a', 'w'],
+}
+
+
+def test_graph_order():
+    g = graph.DependencyGraph(DEPS)
+    assert sorted(g.order) == sorted(DEPS)
+    for k in DEPS:
+        for d in DEPS[k]:
+            assert g.order.index(d) < g.order.index(k)
+    assert g.levels == {'a': 0, 'b': 0, 'c': 1, 'w': 2, 't': 3}
+    assert [sorted(l) for l in g.by_level()] == [
+        ['a', 'b'], ['c'], ['w'], ['t']]
+    assert g.dependents == {'a': set('wt'), 'b': set('c'), 'c': set('w'),
+                            'w': set('t'), 't': set()}
+    assert g.downstream(['c']) == set('cwt')
+    assert g.upstream(['w']) == set('wacb')
+
+
+def test_graph_deep_chain():
+    n = 50000
+    deps = dict(('n{}'.format(i), ['n{}'.format(i - 1)] if i else [])
+                for i in range(n))
+    g = graph.DependencyGraph(deps)
+    assert g.order == ['n{}'.format(i) for i in range(n)]
+    assert g.levels['n{}'.format(n - 1)] == n - 1
+
+
+@pytest.mark.parametrize("deps,error", [
+    ({'a': ['b']}, "Unknown dependency b"),
+    ({'a': ['b'], 'b': ['c'], 'c': ['a']},
+     "Cyclic element dependency including a: a -> b -> c -> a"),
+    ({'x': ['a'], 'a': ['b'], 'b': ['c'], 'c': ['b']},
+     "Cyclic element dependency including b: b -> c -> b"),
+    ({'a': ['a']}, "Cyclic element dependency including a: a -> a"),
+])
+def test_graph_invalid(deps, error):
+    with pytest.raises(graph.DependencyError) as excinfo:
+        graph.DependencyGraph(deps)
+    assert str(excinfo.value) == error
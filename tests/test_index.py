@@ -0,0 +1,130 @@
+import os
+import pytest
+import sci_parameter_utils.index as index
+import sci_parameter_utils.parsers as parsers
+import sci_parameter_utils.parameter_file as prm_file
+
+
+def write_runs(tmpdir, n):
+    runs = tmpdir.mkdir('runs')
+    for i in range(n):
+        runs.join('run{}.prm'.format(i)).write(
+            "set Name = run{0}\nset Viscosity = {1}e21\n"
+            "subsection Mesh\n  set Refinement = {2}\nend\n"
+            "set Viscosity = {0}e21\n".format(i, 9, i % 3))
+    runs.join('notes.txt').write("Not a parameter file\n")
+    return runs
+
+
+@pytest.mark.parametrize("text,parsed", [
+    ("Mesh:Refinement >= 6", ('Mesh:Refinement', '>=', '6')),
+    ("A=1", ('A', '=', '1')),
+    (" A B == x y ", ('A B', '==', 'x y')),
+    ("A != ", ('A', '!=', '')),
+    ("A ~ run*", ('A', '~', 'run*')),
+    ("A < -1e21", ('A', '<', '-1e21')),
+])
+def test_parse_filter(text, parsed):
+    assert index.parse_filter(text) == parsed
+
+
+def test_parse_filter_invalid():
+    with pytest.raises(index.ParameterIndexError) as excinfo:
+        index.parse_filter("Mesh:Refinement")
+    assert str(excinfo.value) == "Invalid filter Mesh:Refinement"
+
+
+def test_find_files(tmpdir):
+    runs = write_runs(tmpdir, 3)
+    fn = str(runs.join('run1.prm'))
+    found = list(index.find_files([fn, str(runs)]))
+    assert [f for f, _ in found] == [fn] + [
+        str(runs.join('run{}.prm'.format(i))) for i in (0, 2)]
+    assert all(p is parsers.PRMParser for _, p in found)
+
+    with pytest.raises(prm_file.ParserNotFound):
+        list(index.find_files([str(runs.join('notes.txt'))]))
+
+
+def test_index_update(tmpdir):
+    runs = write_runs(tmpdir, 3)
+    db = str(tmpdir.join('index.db'))
+    pi = index.ParameterIndex(db)
+    for fn, parser in index.find_files([str(runs)]):
+        assert pi.update(fn, parser)
+    pi.commit()
+    pi.close()
+
+    pi = index.ParameterIndex(db)
+    fns = [str(runs.join('run{}.prm'.format(i))) for i in range(3)]
+    assert [pi.update(fn, parsers.PRMParser) for fn in fns] == [False]*3
+
+    runs.join('run1.prm').write("set Viscosity = 5\n")
+    os.utime(fns[1], (0, 0))
+    assert [pi.update(fn, parsers.PRMParser) for fn in fns] == [
+        False, True, False]
+    assert pi.query([], ['Viscosity', 'Name']) == [
+        (fns[0], ['0e21', 'run0']),
+        (fns[1], ['5', None]),
+        (fns[2], ['2e21', 'run2'])]
+
+    os.remove(fns[0])
+    assert pi.remove_missing() == [fns[0]]
+    assert pi.remove_missing() == []
+    assert [p for p, _ in pi.query([])] == fns[1:]
+
+    # Uncommitted changes are discarded
+    pi.close()
+    pi = index.ParameterIndex(db)
+    assert [p for p, _ in pi.query([])] == fns
+
+
+@pytest.mark.parametrize("filters,expect", [
+    ([], range(6)),
+    ([('Mesh:Refinement', '=', '1')], [1, 4]),
+    ([('Mesh:Refinement', '=', '1.0')], [1, 4]),
+    ([('Mesh:Refinement', '!=', '1')], [0, 2, 3, 5]),
+    ([('Viscosity', '>=', '3e21')], [3, 4, 5]),
+    ([('Viscosity', '>', '2e21'), ('Mesh:Refinement', '<', '2')], [3, 4]),
+    ([('Viscosity', '=', '4000e18')], [4]),
+    ([('Name', '=', 'run2')], [2]),
+    ([('Name', '~', 'run[45]')], [4, 5]),
+    ([('Name', '>', 'run3')], [4, 5]),
+    ([('Missing', '!=', '1')], []),
+])
+def test_index_query(tmpdir, filters, expect):
+    runs = write_runs(tmpdir, 6)
+    pi = index.ParameterIndex(str(tmpdir.join('index.db')))
+    for fn, parser in index.find_files([str(runs)]):
+        pi.update(fn, parser)
+    assert pi.query(filters, ['Mesh:Refinement']) == [
+        (str(runs.join('run{}.prm'.format(i))), [str(i % 3)])
+        for i in expect]
+
+
+def test_index_query_invalid(tmpdir):
+    pi = index.ParameterIndex(str(tmpdir.join('index.db')))
+    with pytest.raises(index.ParameterIndexError) as excinfo:
+        pi.query([('A', '=>', '1')])
+    assert str(excinfo.value) == "Unknown operator =>"
+
+
+def test_index_version(tmpdir):
+    runs = write_runs(tmpdir, 1)
+    db = str(tmpdir.join('index.db'))
+    pi = index.ParameterIndex(db)
+    pi.update(str(runs.join('run0.prm')), parsers.PRMParser)
+    pi.commit()
+    pi.conn.execute("UPDATE meta SET value = '0' WHERE name = 'version'")
+    pi.commit()
+    pi.close()
+
+    # Indexes of other versions are rebuilt
+    pi = index.ParameterIndex(db)
+    assert pi.query([]) == []
+    assert pi.update(str(runs.join('run0.prm')), parsers.PRMParser)
+
+    tmpdir.join('bad.db').write('Not a database' * 100)
+    with pytest.raises(index.ParameterIndexError) as excinfo:
+        index.ParameterIndex(str(tmpdir.join('bad.db')))
+    assert str(excinfo.value).startswith("Could not open index ")
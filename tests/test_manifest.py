@@ -0,0 +1,53 @@
+import os
+import pytest
+import sci_parameter_utils.manifest as manifest
+
+
+def test_manifest_roundtrip(tmpdir):
+    path = str(tmpdir.join('manifest.json'))
+    fns = [str(tmpdir.join('out_{}.prm'.format(i))) for i in range(3)]
+    m = manifest.Manifest(path, u'template', {'a': {'type': 'int'}})
+    digests = [m.row_digest({'a': i}) for i in range(3)]
+    assert len(set(digests)) == 3
+    assert digests[0] == m.row_digest({'a': 0})
+    for fn, digest in zip(fns, digests):
+        assert not m.unchanged(fn, digest)
+        tmpdir.join(os.path.basename(fn)).write('')
+        m.record(fn, digest)
+    m.save()
+
+    m = manifest.Manifest(path, u'template', {'a': {'type': 'int'}})
+    assert m.unchanged(fns[0], digests[0])
+    assert not m.unchanged(fns[0], digests[1])
+    os.remove(fns[1])
+    assert not m.unchanged(fns[1], digests[1])
+    m.record(fns[0], digests[0], skipped=True)
+    assert m.skipped == set([fns[0]])
+    assert m.orphans() == fns[1:]
+
+    # Orphans are kept until pruned
+    m.save()
+    m = manifest.Manifest(path, u'template', {'a': {'type': 'int'}})
+    m.record(fns[0], digests[0])
+    assert m.orphans() == fns[1:]
+    assert m.prune() == [fns[2]]
+    assert not os.path.exists(fns[2])
+    m.save()
+    m = manifest.Manifest(path, u'template', {'a': {'type': 'int'}})
+    assert m.old == {fns[0]: digests[0]}
+
+    # Digests depend on the shared sources
+    m = manifest.Manifest(path, u'other', {'a': {'type': 'int'}})
+    assert not m.unchanged(fns[0], m.row_digest({'a': 0}))
+
+
+def test_manifest_invalid(tmpdir):
+    path = tmpdir.join('manifest.json')
+    path.write('{')
+    with pytest.raises(manifest.ManifestError) as excinfo:
+        manifest.Manifest(str(path))
+    assert str(excinfo.value).startswith(
+        "Could not read manifest {}".format(path))
+
+    path.write('{"version": 0, "files": {"a": "b"}}')
+    assert manifest.Manifest(str(path)).old == {}
@@ -4,6 +4,8 @@ import pytest
 import difflib
 import six
 import sci_parameter_utils.parsers as parsers
+import sci_parameter_utils.general as gen
+import sci_parameter_utils.fragment as frags
 from io import StringIO
 
 full_parser_list = parsers.PFileParser._file_types.keys()
@@ -84,6 +86,116 @@ def test_parser_parse(parser, param_file):
     assert expect.getvalue() == produce.getvalue()
 
 
+@pytest.mark.parametrize("bsize", [1, 2, 7, 64])
+@pytest.mark.parametrize(
+    "param_file",
+    [fn for _, fn in get_parser_tests(['dealIIPRM'], 'parse_*.test')],
+    indirect=True
+)
+def test_prm_parse_blocks(param_file, bsize, monkeypatch):
+    parser = parsers.PFileParser.parser_by_name('dealIIPRM')
+    text = param_file.read().split("--{{{OUT}}}--\n")[0]
+
+    expect = [str(l) for l in parser.lines(StringIO(six.text_type(text)))]
+
+    monkeypatch.setattr(parsers, '_PRM_BLOCK_SIZE', bsize)
+    produce = [str(l) for l in parser.lines(StringIO(six.text_type(text)))]
+    assert expect == produce
+
+    produce = [str(l) for l in parser.lines(text.splitlines(True))]
+    assert expect == produce
+
+    # Lines may lack line endings or end with \r\n
+    produce = [str(l) for l in parser.lines(text.splitlines())]
+    assert expect == produce
+    produce = [str(l) for l in parser.lines(
+        [l + '\r\n' for l in text.splitlines()])]
+    assert expect == produce
+
+
+def test_prm_lines_without_endings():
+    parser = parsers.PFileParser.parser_by_name('dealIIPRM')
+    kvlines = [l.value for l in parser.lines(['set a = 1', 'set b = 2'])]
+    assert [(v.key, v.value) for v in kvlines] == [('a', '1'), ('b', '2')]
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 0])
+@pytest.mark.parametrize(
+    "param_file",
+    [fn for _, fn in get_parser_tests(['dealIIPRM'], 'parse_*.test')],
+    indirect=True
+)
+def test_prm_search_lines(param_file, step):
+    parser = parsers.PFileParser.parser_by_name('dealIIPRM')
+    text = six.text_type(param_file.read().split("--{{{OUT}}}--\n")[0])
+
+    kvlines = [l for l in parser.lines(StringIO(text))
+               if l.ltype == 'KeyValue']
+    keys = [l.value.key for l in kvlines][::step] if step else []
+    plan = gen.SearchPlan(dict(
+        (k, frags.LocElem(k, k)) for k in keys + ['Missing:Key']))
+    expect = [str(l) for l in kvlines if l.value.key in keys]
+    produce = [str(l) for l in parser.search_lines(StringIO(text), plan)]
+    assert expect == produce
+
+
+def test_prm_search_lines_skip():
+    parser = parsers.PFileParser.parser_by_name('dealIIPRM')
+    text = (u"subsection A # comment\n"
+            u"  set x = \\\n    1\n"
+            u"  subsection \\\n  B\n"
+            u"    set y = 2 # comment\n"
+            u"    bad line\n"
+            u"  end\n"
+            u"end\n"
+            u"subsection C\n"
+            u"  set z = 3\n"
+            u"  subsection A\n"
+            u"    set x = 4\n"
+            u"  end\n"
+            u"end\n"
+            u"set A = 5\n")
+    plan = gen.SearchPlan(dict(
+        (k, frags.LocElem(k, k)) for k in ['C:A:x', 'A']))
+    assert [(l.value.key, l.value.value, l.lnum)
+            for l in parser.search_lines(StringIO(text), plan)] == [
+        ('C:A:x', '4', 13), ('A', '5', 16)]
+
+    with pytest.raises(ValueError) as excinfo:
+        list(parser.search_lines(StringIO(text + u"subsection D\n"), plan))
+    assert str(excinfo.value) == "Did not exit subsection D"
+    with pytest.raises(ValueError) as excinfo:
+        list(parser.search_lines(StringIO(text + u"end\n"), plan))
+    assert str(excinfo.value) == "Line 17: Bad command end"
+
+
+@pytest.mark.parametrize("elems,expect", [
+    ({'x': frags.GlobElem('x', 'A:*:x')}, [('A:B:C:x', '3')]),
+    ({'x': frags.GlobElem('x', '*x')},
+     [('A:x', '1'), ('A:B:C:x', '3'), ('D:x', '5')]),
+    ({'x': frags.GlobElem('x', 'A:*:x'), 'y': frags.LocElem('y', 'A:B:y')},
+     [('A:B:y', '2'), ('A:B:C:x', '3')]),
+    ({'x': frags.RegexElem('x', r'[AD]:x')}, [('A:x', '1'), ('D:x', '5')]),
+])
+def test_prm_search_lines_pattern(elems, expect):
+    parser = parsers.PFileParser.parser_by_name('dealIIPRM')
+    text = (u"subsection A\n"
+            u"  set x = 1\n"
+            u"  subsection B\n"
+            u"    set y = 2\n"
+            u"    subsection C\n"
+            u"      set x = 3\n"
+            u"    end\n"
+            u"  end\n"
+            u"end\n"
+            u"subsection D\n"
+            u"  set \\\n  x = 5\n"
+            u"end\n")
+    plan = gen.SearchPlan(elems)
+    assert [(l.value.key, l.value.value)
+            for l in parser.search_lines(StringIO(text), plan)] == expect
+
+
 @pytest.mark.parametrize(
     "parser,param_file",
     get_parser_tests(full_parser_list, 'invalid_*.test'),
@@ -0,0 +1,46 @@
+import pytest
+import json
+from io import StringIO
+import sci_parameter_utils.profiling as profiling
+
+
+def test_profiler_stages():
+    prof = profiling.Profiler()
+    for i in range(3):
+        with prof.stage('a'):
+            pass
+    with pytest.raises(ValueError):
+        with prof.stage('b'):
+            raise ValueError()
+    prof.count('rows')
+    prof.count('rows', 4)
+
+    report = prof.report()
+    assert list(report['stages']) == ['a', 'b']
+    assert report['stages']['a']['calls'] == 3
+    assert report['stages']['b']['calls'] == 1
+    assert report['stages']['a']['seconds'] >= 0
+    assert report['counts'] == {'rows': 5}
+    assert report['total_seconds'] >= report['stages']['a']['seconds']
+
+    out = StringIO()
+    prof.dump(out)
+    dumped = json.loads(out.getvalue())
+    assert dumped['stages'] == report['stages']
+    assert dumped['counts'] == report['counts']
+
+
+def test_profiler_iterate():
+    prof = profiling.Profiler()
+    assert list(prof.iterate('read', range(4))) == list(range(4))
+    assert prof.report()['stages']['read']['calls'] == 5
+
+
+def test_null_profiler():
+    prof = profiling.NullProfiler()
+    with prof.stage('a'):
+        prof.count('rows')
+    assert list(prof.iterate('read', range(2))) == [0, 1]
+    report = prof.report()
+    assert report['stages'] == {}
+    assert report['counts'] == {}
@@ -0,0 +1,101 @@
+import pytest
+import itertools
+import sci_parameter_utils.sweep as sweep
+
+
+@pytest.mark.parametrize("spec,rows", [
+    ({'design': 'grid',
+      'inputs': {'a': [1, 2], 'b': {'values': ['x', 'y', 'z']}}},
+     [{'a': a, 'b': b} for a in [1, 2] for b in 'xyz']),
+    ({'design': 'grid',
+      'inputs': {'a': {'start': 0.0, 'stop': 1.0, 'num': 3}}},
+     [{'a': 0.0}, {'a': 0.5}, {'a': 1.0}]),
+    ({'design': 'zip',
+      'inputs': {'a': [1, 2], 'b': {'start': 0, 'stop': 1, 'num': 2}}},
+     [{'a': 1, 'b': 0}, {'a': 2, 'b': 1}]),
+])
+def test_discrete_sweeps(spec, rows):
+    design = sweep.sweep_from_dict(spec)
+    assert len(design) == len(rows)
+    assert list(design.rows()) == rows
+
+
+@pytest.mark.parametrize("dtype,args", [
+    ('random', {'seed': 3}),
+    ('lhs', {'seed': 3}),
+    ('sobol', {}),
+    ('sobol', {'skip': 1}),
+])
+@pytest.mark.parametrize("samples", [1, 8, 17])
+def test_sampled_sweeps(dtype, args, samples):
+    spec = {'design': dtype, 'samples': samples,
+            'inputs': {'a': {'low': 1.0, 'high': 3.0},
+                       'b': {'values': ['x', 'y']}}}
+    spec.update(args)
+    design = sweep.sweep_from_dict(spec)
+    rows = list(design.rows())
+    assert len(design) == samples
+    assert len(rows) == samples
+    for r in rows:
+        assert 1.0 <= r['a'] <= 3.0
+        assert r['b'] in ['x', 'y']
+    assert rows == list(sweep.sweep_from_dict(spec).rows())
+
+
+@pytest.mark.parametrize("samples", [4, 10])
+def test_lhs_strata(samples):
+    design = sweep.sweep_from_dict(
+        {'design': 'lhs', 'samples': samples, 'seed': 1,
+         'inputs': {'a': {'low': 0.0, 'high': 1.0},
+                    'b': {'low': 0.0, 'high': 1.0}}})
+    rows = list(design.rows())
+    for k in 'ab':
+        assert (sorted(int(r[k]*samples) for r in rows) ==
+                list(range(samples)))
+
+
+def test_sobol_points():
+    design = sweep.sweep_from_dict(
+        {'design': 'sobol', 'samples': 4,
+         'inputs': {'a': {'low': 0.0, 'high': 1.0},
+                    'b': {'low': 0.0, 'high': 1.0},
+                    'c': {'low': 0.0, 'high': 1.0}}})
+    assert [(r['a'], r['b'], r['c']) for r in design.rows()] == [
+        (0.0, 0.0, 0.0),
+        (0.5, 0.5, 0.5),
+        (0.75, 0.25, 0.25),
+        (0.25, 0.75, 0.75),
+    ]
+
+
+@pytest.mark.parametrize("count", [1, 3, 4])
+def test_shard(count):
+    design = sweep.sweep_from_dict(
+        {'design': 'grid', 'inputs': {'a': list(range(10))}})
+    shards = [list(sweep.shard(design.rows(), i, count))
+              for i in range(count)]
+    assert sorted(itertools.chain(*shards),
+                  key=lambda r: r['a']) == list(design.rows())
+
+
+@pytest.mark.parametrize("spec,error", [
+    ({'inputs': {}}, "No design type for sweep"),
+    ({'design': 'grid'}, "No inputs for sweep"),
+    ({'design': 'bad', 'inputs': {}}, "Unknown design 'bad'"),
+    ({'design': 'grid', 'inputs': {}, 'seed': 1},
+     "Error constructing sweep of type 'grid': Unknown arguments ['seed']"),
+    ({'design': 'grid', 'inputs': {'a': {}}},
+     "No values or range for input 'a'"),
+    ({'design': 'grid', 'inputs': {'a': {'step': 1}}},
+     "Bad specification for input 'a': {'step': 1}"),
+    ({'design': 'grid', 'inputs': {'a': {'low': 0, 'high': 1}}},
+     "Input 'a' has no discrete values"),
+    ({'design': 'zip', 'inputs': {'a': [1], 'b': [1, 2]}},
+     "Inputs of zip design have differing numbers of values"),
+    ({'design': 'random', 'samples': 1, 'inputs': {'a': {'low': 0}}},
+     "Input 'a' needs both low and high"),
+])
+def test_invalid_sweeps(spec, error):
+    with pytest.raises(sweep.InvalidSweepError) as excinfo:
+        len(sweep.sweep_from_dict(spec))
+    assert str(excinfo.value) == error
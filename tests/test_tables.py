@@ -0,0 +1,43 @@
+import io
+import pytest
+import sci_parameter_utils.tables as tables
+
+
+def test_table_writers():
+    f = io.StringIO()
+    writer = tables.table_writer('csv', f, ['a', 'b'])
+    writer.write_row({'file': 'x,y.prm', 'a': '1', 'b': 'text'})
+    writer.close()
+    assert f.getvalue() == u'file,a,b\n"x,y.prm",1,text\n'
+
+    f = io.StringIO()
+    writer = tables.table_writer('jsonl', f, ['b', 'a'])
+    writer.write_row({'file': 'x.prm', 'a': '1', 'b': 'text'})
+    assert f.getvalue() == u'{"file": "x.prm", "b": "text", "a": "1"}\n'
+
+
+def test_table_npz():
+    numpy = pytest.importorskip('numpy')
+    f = io.BytesIO()
+    writer = tables.table_writer('npz', f, ['i', 'x', 's'])
+    for k in range(3):
+        writer.write_row({'file': 'r{}'.format(k), 'i': str(k),
+                          'x': '{}e-1'.format(k), 's': 'v{}'.format(k)})
+    writer.close()
+    f.seek(0)
+    with numpy.load(f) as data:
+        assert data['i'].dtype == numpy.int64
+        assert data['x'].dtype == numpy.float64
+        assert list(data['x']) == [0.0, 0.1, 0.2]
+        assert list(data['s']) == ['v0', 'v1', 'v2']
+        assert list(data['file']) == ['r0', 'r1', 'r2']
+
+
+def test_table_errors():
+    with pytest.raises(tables.TableError) as excinfo:
+        tables.table_writer('xls', io.StringIO(), ['a'])
+    assert str(excinfo.value) == "Unknown table format xls"
+    with pytest.raises(tables.TableError) as excinfo:
+        tables.table_writer('csv', io.StringIO(), ['file'])
+    assert str(excinfo.value) == \
+        "Element file conflicts with the input file column"